@@ -1,8 +1,22 @@
 # app_duckdb.py — node cache (varsa) + polygon cache (varsa) ile hızlı POI analizi + PUANLAMA
-import os, math, argparse
-import duckdb, pandas as pd, folium
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
+import sys
+if __name__ == "__main__" and "--client" in sys.argv[1:]:
+    # ince istemci: ağır modüller (duckdb/pandas/folium) yüklenmeden istek çalışan daemon'a iletilir
+    from poi_daemon import client_main
+    sys.exit(client_main(sys.argv[1:], script=__file__))
+import os, io, math, json, argparse, time, threading, hashlib, sqlite3, struct, zlib, traceback
+from contextlib import redirect_stdout, redirect_stderr
+from collections import deque, OrderedDict
+from functools import lru_cache
+import duckdb, numpy as np, pandas as pd, folium
+import pyarrow as pa, pyarrow.compute as pc, pyarrow.parquet as pq
+from geocode_cache import GeocodeCache, DEFAULT_DB as GEOCODE_DB, address_key_candidates, key_hash
+from poi_cache_utils import (tiles_for_circle, manifest_path_for, sql_str, plain, has_int_coords, has_rank_columns, COORD_SCALE,
+                             RANK_STAMP_KEY, MERGED_SOURCES_KEY, region_files, region_manifest_path,
+                             region_manifest)
+from poi_rank import SCORES, HOSPITAL_SQL, score_case_sql, rank_config_hash
+from road_graph import RoadGraph, ROAD_GRAPH, NEAR_META, near_meta_mtime
+from profiling import NULL_PROFILER, as_profiler, emit, add_metrics_args, install_sinks, scoped_sinks
 
 # ========== KULLANICI AYARLANABİLİR PARAMETRELER ==========
 
@@ -13,6 +27,10 @@ DEFAULT_RADIUS_M = 2500
 WALK_SPEED_KPH, DRIVE_SPEED_KPH = 4.8, 35.0
 WALK_CIRCUITY, DRIVE_CIRCUITY = 1.25, 1.40
 
+# Yol ağı ile süre (build_road_graph.py çıktısı varsa; yoksa/--circuity ile yukarıdaki model)
+ROUTE_BOUND_FACTOR = 2.0      # ağ mesafesi üst sınırı = yarıçap * faktör
+DRIVE_ACCESS_KPH = 15.0       # adres/POI ile en yakın araç yolu düğümü arası
+
 # Kategori isimleri, etiketleri ve renkleri
 CATS = {
     "school": {"label": "Okul",   "color": "blue"},
@@ -62,88 +80,92 @@ def meters_to_deg_latlon(lat, r_m):
     dlon = r_m/(111320.0*max(0.1, math.cos(math.radians(lat))))
     return dlat, dlon
 
-def geocode(address):
-    geocoder = Nominatim(user_agent="be-poi-cache/1.3")
-    rl = RateLimiter(geocoder.geocode, min_delay_seconds=1.0)
-    loc = rl(address)
-    if not loc: raise RuntimeError("Adres geocode edilemedi.")
-    return loc.latitude, loc.longitude, loc.address
-
-# Alt-skor (tür ağırlıkları) — sıralama için; puanlamadan bağımsız
-SCORES = {
-    "school": """
-        (CASE WHEN amenity='school' THEN 10 ELSE 0 END) +
-        (CASE WHEN amenity='college' THEN 7 ELSE 0 END) +
-        (CASE WHEN amenity='kindergarten' THEN 6 ELSE 0 END) +
-        (CASE WHEN "school_level" IS NOT NULL THEN 4 ELSE 0 END) +
-        (CASE WHEN "isced_level" IS NOT NULL THEN 4 ELSE 0 END)
-    """,
-    "market": """
-        (CASE WHEN shop='supermarket' THEN 10 ELSE 0 END) +
-        (CASE WHEN shop='convenience' THEN 8 ELSE 0 END) +
-        (CASE WHEN amenity='marketplace' THEN 6 ELSE 0 END)
-    """,
-    "health": """
-        (CASE WHEN amenity='hospital' OR healthcare='hospital' THEN 100 ELSE 0 END) +
-        (CASE WHEN amenity='clinic' OR healthcare='clinic' THEN 80 ELSE 0 END) +
-        (CASE WHEN amenity='doctors' OR healthcare='doctor' THEN 60 ELSE 0 END) +
-        (CASE WHEN amenity='dentist' OR healthcare='dentist' THEN 55 ELSE 0 END) +
-        (CASE WHEN healthcare='physiotherapist' THEN 50 ELSE 0 END) +
-        (CASE WHEN amenity='pharmacy' THEN 40 ELSE 0 END) +
-        (CASE WHEN healthcare IS NOT NULL THEN 30 ELSE 0 END)
-    """,
-    "transit": """
-        (CASE WHEN railway='station' THEN 100 ELSE 0 END) +
-        (CASE WHEN railway='halt' THEN 90 ELSE 0 END) +
-        (CASE WHEN amenity='bus_station' THEN 80 ELSE 0 END) +
-        (CASE WHEN railway='tram_stop' OR railway='subway_entrance' THEN 70 ELSE 0 END) +
-        (CASE WHEN highway='bus_stop' THEN 50 ELSE 0 END) +
-        (CASE WHEN public_transport IS NOT NULL THEN 40 ELSE 0 END)
-    """,
-    "park": """
-        (CASE WHEN leisure='park' THEN 100 ELSE 0 END) +
-        (CASE WHEN leisure='garden' THEN 80 ELSE 0 END) +
-        (CASE WHEN leisure='nature_reserve' OR boundary='national_park' THEN 80 ELSE 0 END) +
-        (CASE WHEN leisure='recreation_ground' THEN 60 ELSE 0 END) +
-        (CASE WHEN leisure='playground' THEN 50 ELSE 0 END) +
-        (CASE WHEN landuse='grass' THEN 20 ELSE 0 END) +
-        (CASE WHEN boundary='national_park' THEN 15 ELSE 0 END)
-    """,
-    "sport": """
-        (CASE WHEN leisure='fitness_centre' OR amenity='gym' THEN 90 ELSE 0 END) +
-        (CASE WHEN leisure='sports_centre' THEN 80 ELSE 0 END) +
-        (CASE WHEN sport IS NOT NULL THEN 20 ELSE 0 END)
-    """,
-}
+_GEOCODE_CACHES = {}
+
+def get_geocode_cache(path=GEOCODE_DB, geocoder=None):
+    """Yol başına tek GeocodeCache (Nominatim istemcisi + RateLimiter bir kez kurulur)."""
+    key = os.path.abspath(path)
+    if key not in _GEOCODE_CACHES:
+        _GEOCODE_CACHES[key] = GeocodeCache(path, geocoder=geocoder)
+    return _GEOCODE_CACHES[key]
+
+ADDR_INDEX = "./cache/be_addr.parquet"
+
+class LocalGeocoder:
+    """
+    build_address_index.py çıktısı üzerinde çevrimdışı geocoder: key_hash sıralı int64 dizide
+    searchsorted + anahtar metni doğrulaması (hash çakışmasına karşı). Bulamazsa None döner,
+    yani geocoder arayüzü Nominatim/Stub ile aynıdır.
+    """
+    def __init__(self, path=ADDR_INDEX):
+        t0 = time.perf_counter()
+        t = pq.read_table(path, columns=["key_hash", "key", "lat", "lon", "display"])
+        self.hashes = t["key_hash"].to_numpy()
+        self.lat, self.lon = t["lat"].to_numpy(), t["lon"].to_numpy()
+        self.keys = t["key"].combine_chunks()
+        self.display = t["display"].combine_chunks()
+        self.hits = self.misses = 0
+        self.load_s = time.perf_counter() - t0
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def find(self, key):
+        h = key_hash(key)
+        i = int(np.searchsorted(self.hashes, h))
+        while i < len(self.hashes) and self.hashes[i] == h:
+            if self.keys[i].as_py() == key:
+                return i
+            i += 1
+        return None
+
+    def __call__(self, address):
+        for key in address_key_candidates(address):
+            i = self.find(key)
+            if i is not None:
+                self.hits += 1
+                return float(self.lat[i]), float(self.lon[i]), self.display[i].as_py()
+        self.misses += 1
+        return None
+
+_LOCAL_GEOCODERS = {}
+
+def get_local_geocoder(path=ADDR_INDEX):
+    """Yol başına tek LocalGeocoder; indeks dosyası yoksa None (doğrudan Nominatim yolu)."""
+    if not path or not os.path.exists(path):
+        return None
+    key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+    if key not in _LOCAL_GEOCODERS:
+        _LOCAL_GEOCODERS[key] = LocalGeocoder(path)
+    return _LOCAL_GEOCODERS[key]
+
+def geocode(address, cache=None, local=None):
+    # önce çevrimdışı adres indeksi (varsa), sonra kalıcı cache (normalize adres), yoksa Nominatim;
+    # bulunamazsa RuntimeError
+    local = local if local is not None else get_local_geocoder()
+    if local is not None:
+        hit = local(address)
+        if hit is not None:
+            return hit
+    return (cache or get_geocode_cache()).geocode(address)
 
 def query_category(con, nodes_path, polys_path, cat, lat, lon, radius_m, topn):
     dlat, dlon = meters_to_deg_latlon(lat, radius_m)
     lat_min, lat_max = lat - dlat, lat + dlat
     lon_min, lon_max = lon - dlon, lon + dlon
-    score_sql = SCORES[cat]
 
-    parts = []
-    if nodes_path:
-        # node cache’de brand kolonu yok → NULL AS brand
-        parts.append(
-            f"SELECT name, NULL AS brand, lat, lon, amenity, shop, healthcare, railway, highway, public_transport, leisure, boundary, landuse, sport, school_level, isced_level "
-            f"FROM read_parquet('{nodes_path}') WHERE cat='{cat}'"
-        )
-    if polys_path:
-        parts.append(
-            f"SELECT name, brand, lat, lon, amenity, shop, healthcare, railway, highway, public_transport, leisure, boundary, landuse, sport, school_level, isced_level "
-            f"FROM read_parquet('{polys_path}') WHERE cat='{cat}'"
-        )
-    if not parts:
+    # eski node cache'lerinde brand kolonu yok → NULL AS brand; manifest varsa sadece daireye düşen tile'lar okunur
+    base_src = _poi_source_sql(nodes_path, polys_path, con=con,
+                               tiles=tiles_for_circle(lat, lon, radius_m), cats=[cat])
+    if not base_src:
         return pd.DataFrame()
 
-    base_src = " UNION ALL ".join(parts)
-
     # not: 'is_hospital' ve window fonksiyonları ile n_total, d_min ve has_hospital_any de getiriyoruz
     q = f"""
     WITH base AS (
       SELECT * FROM ({base_src})
-      WHERE lat BETWEEN {lat_min} AND {lat_max}
+      WHERE cat='{cat}'
+        AND lat BETWEEN {lat_min} AND {lat_max}
         AND lon BETWEEN {lon_min} AND {lon_max}
     ),
     dist AS (
@@ -159,8 +181,8 @@ def query_category(con, nodes_path, polys_path, cat, lat, lon, radius_m, topn):
     ),
     scored AS (
       SELECT *,
-        {score_sql} AS score,
-        (CASE WHEN amenity='hospital' OR healthcare='hospital' THEN 1 ELSE 0 END) AS is_hospital
+        score_pre AS score,
+        hosp_pre AS is_hospital
       FROM dist
       WHERE d_lin <= {radius_m}
     ),
@@ -184,6 +206,1017 @@ def query_category(con, nodes_path, polys_path, cat, lat, lon, radius_m, topn):
     """
     return con.execute(q).df()
 
+POI_COLS = ("name, lat, lon, amenity, shop, healthcare, railway, highway, public_transport, "
+            "leisure, boundary, landuse, sport, school_level, isced_level")
+
+class TileManifest:
+    """
+    Builder'ın yazdığı <cache>.tiles.parquet: (cat, tile) → satır aralığı. Arama dairesine düşen
+    tile'ların satırları hangi row-group'larda ise sadece onlar okunur; sorgu maliyeti dosya
+    boyutuna değil yerel POI yoğunluğuna bağlı kalır.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.md = pq.ParquetFile(path).metadata
+        m = pq.read_table(manifest_path_for(path))
+        # tile'a göre sıralı tut → sorgu başına sadece birkaç searchsorted
+        order = np.argsort(m["tile"].to_numpy(), kind="stable")
+        self.cat = m["cat"].to_numpy(zero_copy_only=False).astype(str)[order]
+        self.tile = m["tile"].to_numpy()[order]
+        self.row_start = m["row_start"].to_numpy()[order]
+        self.row_count = m["row_count"].to_numpy()[order]
+        sizes = [self.md.row_group(i).num_rows for i in range(self.md.num_row_groups)]
+        self.rg_start = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+
+    def row_groups(self, tiles, cats=None):
+        lo = np.searchsorted(self.tile, tiles, side="left")
+        hi = np.searchsorted(self.tile, tiles, side="right")
+        idx = np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)]) if len(tiles) else np.zeros(0, np.int64)
+        idx = idx.astype(np.int64)
+        if cats is not None:
+            idx = idx[np.isin(self.cat[idx], list(cats))]
+        first = np.searchsorted(self.rg_start, self.row_start[idx], side="right") - 1
+        last = np.searchsorted(self.rg_start, self.row_start[idx] + self.row_count[idx] - 1, side="right") - 1
+        rgs = set()
+        for f, l in zip(first.tolist(), last.tolist()):
+            rgs.update(range(f, l + 1))
+        return sorted(rgs)
+
+    def read(self, tiles, cats, columns):
+        pf = pq.ParquetFile(self.path, metadata=self.md)  # footer tekrar ayrıştırılmaz
+        # dictionary kolonlar / int32 koordinatlar düz hale (lat/lon float derece) getirilir
+        t = plain(pf.read_row_groups(self.row_groups(tiles, cats), columns=list(columns) + ["tile"]))
+        mask = pc.is_in(t["tile"], value_set=pa.array(tiles, type=pa.int64()))
+        if cats is not None:
+            mask = pc.and_(mask, pc.is_in(t["cat"], value_set=pa.array(list(cats), type=t.schema.field("cat").type)))
+        return t.filter(mask).drop_columns(["tile"])
+
+_MANIFESTS = {}
+
+def _tile_manifest(path):
+    # dosya imzasına göre önbellekli; manifest yoksa (eski cache) None → read_parquet + bbox
+    if not os.path.exists(manifest_path_for(path)):
+        return None
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if key not in _MANIFESTS:
+        _MANIFESTS[key] = TileManifest(path)
+    return _MANIFESTS[key]
+
+_INT_COORDS = {}
+
+def _poi_cols_sql(path):
+    # --int-coords ile üretilmiş cache: lat/lon int32 (1e-7 derece) → SQL'de dereceye çevrilir
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if key not in _INT_COORDS:
+        _INT_COORDS[key] = has_int_coords(pq.read_schema(path))
+    if not _INT_COORDS[key]:
+        return POI_COLS
+    return POI_COLS.replace("lat, lon", f"CAST(lat AS DOUBLE) / {COORD_SCALE} AS lat, "
+                                        f"CAST(lon AS DOUBLE) / {COORD_SCALE} AS lon")
+
+_SCHEMAS = {}
+
+def _file_schema(path):
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if key not in _SCHEMAS:
+        _SCHEMAS[key] = pq.read_schema(path)
+    return _SCHEMAS[key]
+
+def _as_paths(p):
+    # kaynak argümanı: None, tek yol ya da (çoklu bölge) yol listesi → liste
+    if not p:
+        return []
+    return [p] if isinstance(p, str) else [x for x in p if x]
+
+def _existing(p):
+    # var olan kaynak(lar); hiçbiri yoksa None (tek yol → yol, liste → liste)
+    paths = [x for x in _as_paths(p) if os.path.exists(x)]
+    if not paths:
+        return None
+    return paths[0] if isinstance(p, str) else paths
+
+def _poi_source_sql(nodes_path, polys_path, con=None, tiles=None, cats=None, prof=NULL_PROFILER):
+    # node + polygon cache'leri tek kaynak olarak (cat kolonu dahil); brand'siz (eski) node cache'inde NULL.
+    # Yollar liste de olabilir (çoklu bölge: RegionSet.select); her dosya ayrı UNION ALL kolu olur.
+    # con + tiles verilirse manifest'li dosyalarda sadece ilgili tile'lar okunup con'a kaydedilir.
+    # score_pre / hosp_pre: builder'ın yazdığı rank_score / is_hospital (damga SCORES ile eşleşirse),
+    # yoksa SCORES / HOSPITAL_SQL canlı hesaplanır.
+    parts = []
+    sources = [(path, f"tiles_{kind}{i or ''}") for kind, paths in (("nodes", nodes_path), ("polys", polys_path))
+               for i, path in enumerate(_as_paths(paths))]
+    for path, view in sources:
+        brand = "brand" if "brand" in _file_schema(path).names else "NULL AS brand"
+        src, cols_sql = f"read_parquet({sql_str(path)})", _poi_cols_sql(path)
+        rank = _has_rank(path)
+        rank_sql = ("rank_score AS score_pre, is_hospital AS hosp_pre" if rank
+                    else f"{score_case_sql()} AS score_pre, {HOSPITAL_SQL} AS hosp_pre")
+        tm = _tile_manifest(path) if (con is not None and tiles is not None) else None
+        if tm is not None:
+            cols = (["cat"] + (["brand"] if brand == "brand" else []) + POI_COLS.split(", ") +
+                    (["rank_score", "is_hospital"] if rank else []))
+            with prof.stage("tile_read"):
+                con.register(view, tm.read(tiles, cats, cols))
+            src, cols_sql = view, POI_COLS
+        parts.append(f"SELECT cat, {brand}, {cols_sql}, {rank_sql} FROM {src}")
+    return " UNION ALL ".join(parts)
+
+def _haversine_sql(lat1, lon1, lat2, lon2):
+    return (f"2*6371000*asin(sqrt("
+            f"sin(radians({lat2} - {lat1})/2)*sin(radians({lat2} - {lat1})/2) + "
+            f"cos(radians({lat1}))*cos(radians({lat2}))*"
+            f"sin(radians({lon2} - {lon1})/2)*sin(radians({lon2} - {lon1})/2)))")
+
+_RANK_OK = {}
+
+def _has_rank(path):
+    # dosyada rank kolonları var ve damgası şu anki SCORES ile aynı mı (değilse canlı hesaplamaya düşülür)
+    st = os.stat(path)
+    stamp = rank_config_hash()
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size, stamp)
+    if key not in _RANK_OK:
+        schema = pq.read_schema(path)
+        found = (schema.metadata or {}).get(RANK_STAMP_KEY, b"").decode()
+        _RANK_OK[key] = has_rank_columns(schema) and found == stamp
+    return _RANK_OK[key]
+
+def _multi_category_params(lat, lon, radius_m, topn, radii=None, cats=None):
+    # çok kategorili sorgunun parametreleri: kategori başına yarıçap + bbox (query_category ile aynı sınırlar)
+    cats = list(cats or CATS.keys())
+    radii = {c: float((radii or {}).get(c, radius_m)) for c in cats}
+    lat, lon = float(lat), float(lon)
+    dlat, dlon = meters_to_deg_latlon(lat, max(radii.values()))
+    params = {"lat": lat, "lon": lon, "topn": int(topn),
+              "lat_min": lat - dlat, "lat_max": lat + dlat,
+              "lon_min": lon - dlon, "lon_max": lon + dlon}
+    for c in cats:
+        dlat_c, dlon_c = meters_to_deg_latlon(lat, radii[c])
+        params.update({f"r_{c}": radii[c],
+                       f"lat_min_{c}": lat - dlat_c, f"lat_max_{c}": lat + dlat_c,
+                       f"lon_min_{c}": lon - dlon_c, f"lon_max_{c}": lon + dlon_c})
+    return cats, params
+
+def _multi_category_sql(base_src, cats, score_sql="score_pre", hosp_sql="hosp_pre"):
+    # $param'lı tek sorgu; kaynak (read_parquet ya da bellek tablosu) ve skor ifadesi dışarıdan gelir
+    def per_cat(name):
+        return "(CASE cat " + " ".join(f"WHEN '{c}' THEN ${name}_{c}" for c in cats) + " END)"
+    cat_list = ", ".join(f"'{c}'" for c in cats)
+    return f"""
+    WITH base AS (
+      SELECT * FROM ({base_src})
+      WHERE cat IN ({cat_list})
+        AND lat BETWEEN $lat_min AND $lat_max
+        AND lon BETWEEN $lon_min AND $lon_max
+    ),
+    dist AS (
+      SELECT *, {per_cat("r")} AS r_cat, {_haversine_sql("$lat", "$lon", "lat", "lon")} AS d_lin
+      FROM base
+    ),
+    scored AS (
+      SELECT *,
+        {score_sql} AS score,
+        {hosp_sql} AS is_hospital
+      FROM dist
+      WHERE lat BETWEEN {per_cat("lat_min")} AND {per_cat("lat_max")}
+        AND lon BETWEEN {per_cat("lon_min")} AND {per_cat("lon_max")}
+        AND d_lin <= r_cat
+    ),
+    ranked AS (
+      SELECT *,
+        COUNT(*) OVER (PARTITION BY cat) AS n_total,
+        MIN(d_lin) OVER (PARTITION BY cat) AS d_min,
+        MAX(is_hospital) OVER (PARTITION BY cat) AS has_hospital_any,
+        d_lin*{WALK_CIRCUITY} AS walk_m,
+        d_lin*{DRIVE_CIRCUITY} AS drive_m,
+        (d_lin*{WALK_CIRCUITY}) / ({WALK_SPEED_KPH} * 1000/3600) AS walk_s,
+        (d_lin*{DRIVE_CIRCUITY}) / ({DRIVE_SPEED_KPH} * 1000/3600) AS drive_s,
+        ROW_NUMBER() OVER (PARTITION BY cat ORDER BY score DESC, d_lin ASC) AS rn_all
+      FROM scored
+    )
+    SELECT cat, name, brand, amenity, shop, healthcare,
+           lat, lon, score, d_lin, d_min, n_total, has_hospital_any,
+           walk_m, walk_s, drive_m, drive_s
+    FROM ranked
+    WHERE rn_all <= $topn
+    ORDER BY cat, rn_all
+    """
+
+def _split_categories(big, cats):
+    # tek sorgu sonucunu kategori frame'lerine ve (n_total, d_min, has_hospital_any) özetlerine ayır
+    frames = {c: pd.DataFrame() for c in cats}
+    stats = {c: (0, None, False) for c in cats}
+    for c, df in big.groupby("cat", sort=False):
+        df = df.drop(columns=["cat"]).reset_index(drop=True)
+        frames[c] = df
+        stats[c] = (int(df.iloc[0]["n_total"]),
+                    float(df.iloc[0]["d_min"]) if pd.notnull(df.iloc[0]["d_min"]) else None,
+                    bool(df.iloc[0]["has_hospital_any"]))
+    return frames, stats
+
+def query_all_categories(con, nodes_path, polys_path, lat, lon, radius_m, topn, radii=None, cats=None,
+                         prof=NULL_PROFILER):
+    """
+    Tüm kategoriler için tek sorgu: kaynak bir kez taranır, bbox + haversine bir kez hesaplanır,
+    pencereler cat'e göre bölünür. radii={cat: metre} ile kategori bazlı yarıçap verilebilir
+    (ör. {c: SCORING[c]["D0"] for c in CATS}); verilmeyenler radius_m kullanır.
+    Dönüş: (frames, stats) → frames[cat] = query_category ile aynı kolonlar,
+                             stats[cat] = (n_total, d_min, has_hospital_any)
+    """
+    cats, params = _multi_category_params(lat, lon, radius_m, topn, radii, cats)
+    tiles = tiles_for_circle(lat, lon, max(params[f"r_{c}"] for c in cats))
+    base_src = _poi_source_sql(nodes_path, polys_path, con=con, tiles=tiles, cats=cats, prof=prof)
+    if not base_src:
+        return _split_categories(pd.DataFrame(columns=["cat"]), cats)
+    sql = _multi_category_sql(base_src, cats)
+    with prof.stage("sql"):
+        res = con.execute(sql, params)
+    with prof.stage("to_df"):
+        big = res.df()
+    with prof.stage("split"):
+        frames, stats = _split_categories(big, cats)
+    _profile_query(prof, con, base_src, sql, params, cats, frames, stats)
+    if prof.detail:
+        for path in _as_paths(nodes_path) + _as_paths(polys_path):
+            prof.file(path, **_file_read_stats(path, cats, tiles, params))
+    return frames, stats
+
+# ---------- profil yardımcıları (sadece analyze(profile=...) / --profile) ----------
+
+def _profile_query(prof, con, base_src, sql, params, cats, frames, stats):
+    # kategori başına: bbox adayı (taranan), yarıçap içi (n_total), dönen (TOP-N); explain'de plan
+    if not prof.enabled:
+        return
+    cand = {}
+    if prof.detail:
+        cat_list = ", ".join(f"'{c}'" for c in cats)
+        cand = dict(con.execute(f"""
+        SELECT CAST(cat AS VARCHAR), COUNT(*) FROM ({base_src})
+        WHERE cat IN ({cat_list}) AND lat BETWEEN $lat_min AND $lat_max AND lon BETWEEN $lon_min AND $lon_max
+        GROUP BY 1""", {k: params[k] for k in ("lat_min", "lat_max", "lon_min", "lon_max")}).fetchall())
+    for c in cats:
+        counts = {"in_radius": stats[c][0], "returned": len(frames[c])}
+        if prof.detail:
+            counts = {"scanned": int(cand.get(c, 0))} | counts
+        prof.category(c, **counts)
+    if prof.explain:
+        rows = con.execute("EXPLAIN ANALYZE " + sql, params).fetchall()
+        prof.add_explain("multi_category", "\n".join(str(r[-1]) for r in rows))
+
+def _row_groups_by_stats(md, cats, params, scale):
+    # DuckDB'nin min/max budamasının aynısı: cat ve lat/lon aralığı istatistiklerle kesişmeyen row-group atlanır
+    names = md.schema.names
+    out = []
+    for i in range(md.num_row_groups):
+        rg = md.row_group(i)
+        keep = True
+        for col, lo, hi in (("cat", None, None),
+                            ("lat", params["lat_min"] * scale, params["lat_max"] * scale),
+                            ("lon", params["lon_min"] * scale, params["lon_max"] * scale)):
+            st = rg.column(names.index(col)).statistics
+            if st is None or not st.has_min_max:
+                continue
+            if col == "cat":
+                keep = any(st.min <= c <= st.max for c in cats)
+            else:
+                keep = not (st.max < lo or st.min > hi)
+            if not keep:
+                break
+        if keep:
+            out.append(i)
+    return out
+
+def _file_read_stats(path, cats, tiles, params):
+    """Dosyadan okunan row-group / satır / sıkıştırılmış bayt (manifest varsa tile'lar, yoksa min/max budaması)."""
+    md = pq.ParquetFile(path).metadata
+    tm = _tile_manifest(path)
+    if tm is not None:
+        mode, rgs = "manifest", tm.row_groups(tiles, cats)
+    else:
+        scale = COORD_SCALE if has_int_coords(md.schema.to_arrow_schema()) else 1
+        mode, rgs = "minmax", _row_groups_by_stats(md, cats, params, scale)
+    wanted = {"cat", "brand", "tile"} | set(POI_COLS.split(", "))
+    cols = [j for j, n in enumerate(md.schema.names) if n in wanted]
+    col_bytes = lambda i: sum(md.row_group(i).column(j).total_compressed_size for j in cols)
+    return {"mode": mode, "row_groups_read": len(rgs), "row_groups_total": md.num_row_groups,
+            "rows_read": sum(md.row_group(i).num_rows for i in rgs), "rows_total": md.num_rows,
+            "bytes_read": sum(col_bytes(i) for i in rgs),
+            "bytes_total": sum(col_bytes(i) for i in range(md.num_row_groups))}
+
+def files_signature(paths):
+    """Var olan dosyaların (yol, mtime_ns, boyut) imzası; builder'lar dosyayı yeniden yazınca değişir."""
+    sig = []
+    for p in (x for group in paths for x in _as_paths(group)):
+        if os.path.exists(p):
+            st = os.stat(p)
+            sig.append((p, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+class PoiEngine:
+    """
+    Uzun ömürlü POI motoru (web/servis kullanımı): node + polygon cache'leri bir kez okunur,
+    tipli tek bir bellek tablosuna (poi) alınır; skor ve is_hospital cache'teki build-time kolonlardan
+    (damga eşleşmezse yükleme anında) alınır.
+    Sorgular $param'lı tek SQL ile, her thread'e ayrı cursor üzerinden çalışır. Parquet dosyalarının
+    mtime/size imzası değişirse tablo arka planda yeniden yüklenip atomik olarak değiştirilir.
+    """
+    def __init__(self, nodes_path="./cache/be_poi.parquet", polys_path="./cache/be_poi_poly.parquet",
+                 check_every_s=2.0):
+        self.nodes_path, self.polys_path = nodes_path, polys_path
+        self.check_every_s = check_every_s
+        self.con = duckdb.connect()
+        self._local = threading.local()
+        self._reload_lock = threading.Lock()
+        self._sig = None
+        self._last_check = 0.0
+        self._sql = {}
+        self.reloads = 0
+        self.load_s = None
+        self.cold_query_ms = None
+        self.warm_query_ms = deque(maxlen=1000)
+        self.load()
+
+    def _paths(self):
+        return _existing(self.nodes_path), _existing(self.polys_path)
+
+    def _signature(self):
+        return files_signature(self._paths())
+
+    def fingerprint(self):
+        # şu an bellekte olan verinin imzası (ResultCache anahtarı; dosya değişmişse önce yeniden yükler)
+        self.maybe_reload()
+        return self._sig
+
+    def load(self):
+        with self._reload_lock:
+            self._load_locked()
+
+    def _load_locked(self):
+        t0 = time.perf_counter()
+        nodes, polys = self._paths()
+        if not nodes and not polys:
+            raise FileNotFoundError("Ne node ne polygon cache bulundu.")
+        sig = self._signature()
+        src = _poi_source_sql(nodes, polys)
+        cur = self.con.cursor()
+        cur.execute(f"""
+        CREATE OR REPLACE TABLE poi_next AS
+        SELECT CAST(cat AS VARCHAR) AS cat, CAST(name AS VARCHAR) AS name,
+               CAST(NULLIF(trim(CAST(brand AS VARCHAR)), '') AS VARCHAR) AS brand,
+               CAST(lat AS DOUBLE) AS lat, CAST(lon AS DOUBLE) AS lon,
+               amenity, shop, healthcare, railway, highway, public_transport,
+               leisure, boundary, landuse, sport, school_level, isced_level,
+               CAST(score_pre AS INTEGER) AS score,
+               CAST(hosp_pre AS INTEGER) AS is_hospital
+        FROM ({src})
+        ORDER BY cat, lat
+        """)
+        cur.execute("BEGIN TRANSACTION")
+        cur.execute("DROP TABLE IF EXISTS poi")
+        cur.execute("ALTER TABLE poi_next RENAME TO poi")
+        cur.execute("COMMIT")
+        self._sig = sig
+        self._last_check = time.time()
+        self.load_s = time.perf_counter() - t0
+        self.reloads += 1
+
+    def maybe_reload(self):
+        # imza kontrolü en fazla check_every_s saniyede bir (stat çağrısı ucuz ama her istekte gereksiz)
+        now = time.time()
+        if now - self._last_check < self.check_every_s:
+            return False
+        self._last_check = now
+        if self._signature() == self._sig:
+            return False
+        with self._reload_lock:
+            # başka bir thread bu arada yüklemiş olabilir
+            if self._signature() == self._sig:
+                return False
+            self._load_locked()
+        return True
+
+    def cursor(self):
+        cur = getattr(self._local, "cur", None)
+        if cur is None:
+            cur = self._local.cur = self.con.cursor()
+        return cur
+
+    def source_sql(self):
+        # analyze_batch vb. için _poi_source_sql ile aynı kolonlar
+        return f"SELECT cat, brand, {POI_COLS}, score AS score_pre, is_hospital AS hosp_pre FROM poi"
+
+    def query(self, lat, lon, radius_m, topn, radii=None, cats=None, prof=NULL_PROFILER):
+        """query_all_categories ile aynı dönüş: (frames, stats)."""
+        with prof.stage("engine_reload_check"):
+            self.maybe_reload()
+        t0 = time.perf_counter()
+        cats, params = _multi_category_params(lat, lon, radius_m, topn, radii, cats)
+        key = tuple(cats)
+        src = self.source_sql()
+        if key not in self._sql:
+            self._sql[key] = _multi_category_sql(src, cats)
+        cur = self.cursor()
+        with prof.stage("sql"):
+            res = cur.execute(self._sql[key], params)
+        with prof.stage("to_df"):
+            big = res.df()
+        ms = (time.perf_counter() - t0) * 1000
+        if self.cold_query_ms is None:
+            self.cold_query_ms = ms
+        else:
+            self.warm_query_ms.append(ms)
+        with prof.stage("split"):
+            frames, stats = _split_categories(big, cats)
+        # bellek tablosu: dosya okuması yok, "scanned" = poi tablosunda bbox adayı
+        _profile_query(prof, cur, src, self._sql[key], params, cats, frames, stats)
+        return frames, stats
+
+    def latency_stats(self):
+        warm = sorted(self.warm_query_ms)
+        pct = lambda q: warm[min(len(warm)-1, int(q*len(warm)))] if warm else None
+        return {"load_s": self.load_s, "reloads": self.reloads,
+                "cold_query_ms": self.cold_query_ms,
+                "warm_p50_ms": pct(0.50), "warm_p95_ms": pct(0.95), "warm_n": len(warm)}
+
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+def get_engine(nodes_path="./cache/be_poi.parquet", polys_path="./cache/be_poi_poly.parquet"):
+    """Süreç başına paylaşılan PoiEngine (Flask vb. için)."""
+    # birleşik cache: nodes None; çoklu bölge: yol listeleri
+    key = tuple(tuple(os.path.abspath(x) for x in _as_paths(p)) for p in (nodes_path, polys_path))
+    with _ENGINES_LOCK:
+        if key not in _ENGINES:
+            _ENGINES[key] = PoiEngine(nodes_path, polys_path)
+        return _ENGINES[key]
+
+MERGED_CACHE = "./cache/be_poi_merged.parquet"
+
+_STALE_MERGED_WARNED = set()
+
+def resolve_sources(nodes_path, polys_path, merged_path=MERGED_CACHE):
+    """
+    build_poi_merged.py çıktısı bu node/polygon cache'lerinden üretilmişse ve onlardan yeni ise
+    (None, merged_path) döner: sorgular tek, dupe'suz dosyayı (polygon şemasında) tarar.
+    Aksi halde (yok, başka kaynaklardan, ya da update_poi_cache sonrası eskimiş) iki dosya aynen kalır.
+    """
+    if not merged_path or not os.path.exists(merged_path):
+        return nodes_path, polys_path
+    srcs = [p for p in (nodes_path, polys_path) if p and os.path.exists(p)]
+    recorded = json.loads((_file_schema(merged_path).metadata or {}).get(MERGED_SOURCES_KEY, b"[]"))
+    if sorted(os.path.abspath(p) for p in srcs) != sorted(recorded):
+        return nodes_path, polys_path
+    if any(os.path.getmtime(p) > os.path.getmtime(merged_path) for p in srcs):
+        # uzun ömürlü süreçte (server/daemon) her istekte değil, dosya imzası başına bir kez; stdout CLI/JSON çıktısıdır
+        sig = files_signature([merged_path, *srcs])
+        if sig not in _STALE_MERGED_WARNED:
+            _STALE_MERGED_WARNED.add(sig)
+            print(f"[WARN] {merged_path} kaynak cache'lerden eski; build_poi_merged.py'yi yeniden çalıştırın "
+                  f"(şimdilik node + polygon ayrı taranıyor)", file=sys.stderr)
+        return nodes_path, polys_path
+    return None, merged_path
+
+class RegionSet:
+    """
+    Çoklu bölge cache dizini (builder'ların --out-dir / çoklu --pbf çıktısı). regions.parquet'teki
+    row-group sınır kutularıyla sorgu dairesine değen bölge dosyaları seçilir: sorgu süresi toplam
+    bölge sayısına değil, daireye değen dosyaya bağlıdır (sınır yakınında iki bölge, içeride tek).
+    Bölge başına güncel birleşik dosya (build_poi_merged.py --regions) varsa node + polygon yerine o taranır.
+    Manifest'i sadece builder'lar yazar. Bölge dosyaları manifest'ten yeni ise (yeniden build,
+    update_poi_cache) ya da dosya kümesi değiştiyse manifest bellekte yeniden kurulur; dizin salt okunur
+    olabilir ve birden çok süreç aynı dizini okuyabilir.
+    """
+    def __init__(self, region_dir, check_every_s=5.0):
+        self.dir = region_dir
+        self.check_every_s = check_every_s
+        self._lock = threading.Lock()
+        self._sig, self._view = self._build()
+        self._last_check = time.time()
+
+    def _dir_signature(self):
+        # bölge dosyası adı -> mtime_ns; listeleme ile stat arasında silinen dosya atlanır
+        sig = {}
+        for _, _, name in region_files(self.dir):
+            try:
+                sig[name] = os.stat(os.path.join(self.dir, name)).st_mtime_ns
+            except FileNotFoundError:
+                pass
+        return sig
+
+    def _build(self):
+        sig = self._dir_signature()
+        if not sig:
+            raise FileNotFoundError(f"Bölge cache'i yok: {self.dir} (builder'ları --out-dir ile çalıştırın)")
+        path = region_manifest_path(self.dir)
+        t = None
+        if os.path.exists(path) and os.stat(path).st_mtime_ns >= max(sig.values()):
+            t = pq.read_table(path)
+            if not set(t["file"].to_pylist()) <= set(sig):
+                t = None
+        if t is None:
+            # manifest yok / eskimiş: footer'lardan bellekte (yazmadan) kurulur
+            t = region_manifest(self.dir)
+        files = {}
+        for region, kind, name in zip(*(t[c].to_pylist() for c in ("region", "kind", "file"))):
+            files.setdefault(region, {})[kind] = os.path.join(self.dir, name)
+        # bölge başına taranacak (nodes, polys): güncel birleşik dosya varsa (None, merged)
+        sources = {r: resolve_sources(k.get("nodes"), k.get("polys"), k.get("merged")) for r, k in sorted(files.items())}
+        view = {
+            "sources": sources,
+            "region_of": {p: r for r, src in sources.items() for p in src if p},
+            "file": np.asarray([os.path.join(self.dir, n) for n in t["file"].to_pylist()], dtype=object),
+            "box": np.column_stack([t[c].to_numpy() for c in ("lat_min", "lat_max", "lon_min", "lon_max")]),
+        }
+        return sig, view
+
+    @property
+    def sources(self):
+        return self._view["sources"]
+
+    def maybe_refresh(self):
+        # en fazla check_every_s'de bir dizin imzası; değiştiyse görünüm bellekte yeniden kurulur (tek atamayla)
+        now = time.time()
+        if now - self._last_check < self.check_every_s:
+            return False
+        with self._lock:
+            if now - self._last_check < self.check_every_s:
+                return False
+            self._last_check = now
+            try:
+                if self._dir_signature() == self._sig:
+                    return False
+                self._sig, self._view = self._build()
+            except OSError as e:
+                # dosya yazılırken/silinirken okundu: önceki görünümle devam, sonraki kontrolde tekrar denenir
+                print(f"[WARN] bölge dizini yenilenemedi ({e}); önceki bölge listesi kullanılıyor", file=sys.stderr)
+                return False
+        return True
+
+    def select_bbox(self, lat_min, lon_min, lat_max, lon_max):
+        """Kutuya değen row-group'u olan bölge dosyaları → (nodes listesi, polys listesi), bölge sırasıyla."""
+        self.maybe_refresh()
+        view = self._view
+        b = view["box"]
+        hit = (b[:, 0] <= lat_max) & (b[:, 1] >= lat_min) & (b[:, 2] <= lon_max) & (b[:, 3] >= lon_min)
+        files = set(view["file"][hit].tolist())
+        nodes = [n for n, _ in view["sources"].values() if n in files]
+        polys = [p for _, p in view["sources"].values() if p in files]
+        return nodes, polys
+
+    def select(self, lat, lon, radius_m):
+        dlat, dlon = meters_to_deg_latlon(lat, radius_m)
+        return self.select_bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+    def all_sources(self):
+        # tüm bölgeler (uzun ömürlü motor / server: tek bellek tablosu)
+        self.maybe_refresh()
+        src = self.sources.values()
+        return [n for n, _ in src if n], [p for _, p in src if p]
+
+    def regions_of(self, *paths):
+        region_of = self._view["region_of"]
+        return sorted({region_of[p] for group in paths for p in _as_paths(group) if p in region_of})
+
+_REGION_SETS = {}
+
+def get_region_set(region_dir):
+    """Dizin başına tek RegionSet (daemon / server'da istekler arası paylaşılır)."""
+    if isinstance(region_dir, RegionSet):
+        return region_dir
+    key = os.path.abspath(region_dir)
+    if key not in _REGION_SETS:
+        _REGION_SETS[key] = RegionSet(region_dir)
+    return _REGION_SETS[key]
+
+_POI_INDEXES = {}
+
+def get_poi_index(nodes_path, polys_path):
+    """Dosya imzası başına tek PoiIndex (--engine index; daemon'da istekler arası paylaşılır)."""
+    from poi_index import PoiIndex  # DuckDB'siz süreç içi indeks
+    key = files_signature((nodes_path, polys_path))
+    if key not in _POI_INDEXES:
+        _POI_INDEXES.clear()   # dosya yeniden yazıldıysa eski indeks bırakılır
+        _POI_INDEXES[key] = PoiIndex(nodes_path, polys_path)
+    return _POI_INDEXES[key]
+
+_CLI_CON = {}
+
+def cli_connection():
+    """
+    CLI yolu için süreç başına tek DuckDB bağlantısı. Object cache açık: aynı süreçte (daemon) tekrar
+    okunan Parquet dosyalarının footer/metadata'sı yeniden çözülmez. Tek seferlik çalıştırmada fark yok.
+    """
+    if "con" not in _CLI_CON:
+        con = duckdb.connect()
+        try:
+            con.execute("SET enable_object_cache = true")
+        except duckdb.Error:
+            pass  # ayarın adı/varsayılanı sürüme göre değişir; yoksa bağlantı yine tek
+        _CLI_CON["con"] = con
+    return _CLI_CON["con"]
+
+# ---------- yol ağı ile süre ----------
+
+_ROAD_GRAPHS = {}
+
+def get_road_graph(path=ROAD_GRAPH):
+    """
+    Yol + meta.json/near_meta.json mtime başına tek RoadGraph (build_nearest_poi.py tek başına yeniden
+    çalışınca da yeni nesne); ağ dosyası yoksa (ya da path boşsa) None → circuity modeli.
+    """
+    meta = os.path.join(path, "meta.json") if path else None
+    if not meta or not os.path.exists(meta):
+        return None
+    key = (os.path.abspath(path), os.stat(meta).st_mtime_ns, near_meta_mtime(path))
+    if key not in _ROAD_GRAPHS:
+        _ROAD_GRAPHS[key] = RoadGraph(path)
+    return _ROAD_GRAPHS[key]
+
+def retime_frames(frames, lat, lon, graph, radius_m, radii=None):
+    """
+    frames'teki (TOP-N) POI'lerin walk_*/drive_* değerlerini yol ağı üzerinden yeniden hesaplar: mod başına
+    snap'lenmiş başlangıç düğümünden tek, yarıçapla sınırlı Dijkstra. Ağda ulaşılamayan POI'ler circuity
+    modelinde kalır. Sadece gösterilen süreleri değiştirir: n_total düz mesafeyle sayılır, puandaki d_min
+    ise near_* tabloları varsa network_nearest'ten gelen yürüme ağı mesafesidir (_score_frames).
+    """
+    cats = [c for c, df in frames.items() if not df.empty]
+    if not cats:
+        return frames
+    pts_lat = np.concatenate([frames[c]["lat"].to_numpy(float) for c in cats])
+    pts_lon = np.concatenate([frames[c]["lon"].to_numpy(float) for c in cats])
+    max_m = max([radius_m] + list((radii or {}).values())) * ROUTE_BOUND_FACTOR
+    res = {}
+    L, _ = graph.route("walk", lat, lon, pts_lat, pts_lon, max_m, WALK_SPEED_KPH / 3.6)
+    res["walk"] = (L, L / (WALK_SPEED_KPH / 3.6))
+    res["drive"] = graph.route("drive", lat, lon, pts_lat, pts_lon, max_m, DRIVE_ACCESS_KPH / 3.6)
+    i = 0
+    for c in cats:
+        df = frames[c]
+        n = len(df)
+        for mode, (L, T) in res.items():
+            ok = ~np.isnan(L[i:i + n])
+            df[f"{mode}_m"] = np.where(ok, L[i:i + n], df[f"{mode}_m"].to_numpy(float))
+            df[f"{mode}_s"] = np.where(ok, T[i:i + n], df[f"{mode}_s"].to_numpy(float))
+        i += n
+    return frames
+
+def network_nearest(graph, lat, lon):
+    """
+    build_nearest_poi.py tablolarından kategori başına en yakın POI'ye ağ mesafesi/süresi: adres mod başına
+    en yakın yol düğümüne snap'lenir, değer o düğümün satırından okunur (istek başına graf araması yok).
+    Dönüş: {cat: {"walk_m", "walk_s", "walk_poi", "drive_m", "drive_s", "drive_poi"}}; tablo yoksa o mod atlanır.
+    """
+    out = {c: {} for c in CATS}
+    for mode, access in (("walk", WALK_SPEED_KPH / 3.6), ("drive", DRIVE_ACCESS_KPH / 3.6)):
+        if not any(graph.has_near(mode, c) for c in CATS):
+            continue
+        node, d0 = graph.nearest(mode, lat, lon)
+        for c in CATS:
+            if node is None or not graph.has_near(mode, c):
+                continue
+            dist, tim, poi = graph.near(mode, c)
+            if poi[node] < 0:
+                continue
+            L = d0 + float(dist[node])
+            out[c][f"{mode}_m"] = L
+            out[c][f"{mode}_s"] = L / access if mode == "walk" else d0 / access + float(tim[node])
+            rec = graph.near_poi(int(poi[node]))
+            out[c][f"{mode}_poi"] = rec["name"] or rec["ref"]
+    return out
+
+_NEAR_MISMATCH_WARNED = set()
+
+def near_tables_match(graph, sources):
+    """
+    graph'ın near_* tabloları (build_nearest_poi.py) bu POI kaynaklarından (aynı yol, mtime, boyut)
+    üretilmişse True. Değilse (başka cache/bölge, update_poi_cache sonrası eskimiş) imza başına bir kez
+    stderr'e uyarır ve False döner: çağıran d_min'i düz mesafeyle hesaplar (resolve_sources'taki gibi).
+    """
+    if graph is None or not graph.near_meta:
+        return False
+    norm = lambda sig: sorted((os.path.abspath(p), m, size) for p, m, size in sig)
+    cur = files_signature(sources)
+    if norm(graph.near_meta.get("sources", [])) == norm(cur):
+        return True
+    key = (os.path.abspath(graph.path), graph.near_mtime_ns, cur)
+    if key not in _NEAR_MISMATCH_WARNED:
+        _NEAR_MISMATCH_WARNED.add(key)
+        print(f"[WARN] {os.path.join(graph.path, NEAR_META)} başka/eski POI cache'lerinden üretilmiş; "
+              f"build_nearest_poi.py'yi yeniden çalıştırın (şimdilik d_min düz mesafeyle)", file=sys.stderr)
+    return False
+
+def network_walk_dmin(graph, lats, lons):
+    """
+    network_nearest'in toplu, sadece yürüme mesafeli hali (analyze_batch): {cat: float dizi}, tablosu olan
+    kategoriler için; nokta başına snap + tablo satırı, değer analyze() ile birebir aynı. Ulaşılamayan: NaN.
+    """
+    cats = [c for c in CATS if graph.has_near("walk", c)]
+    out = {c: np.full(len(lats), np.nan) for c in cats}
+    if not cats:
+        return out
+    tables = {c: graph.near("walk", c) for c in cats}
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        node, d0 = graph.nearest("walk", float(lat), float(lon))
+        if node is None:
+            continue
+        for c in cats:
+            dist, _, poi = tables[c]
+            if poi[node] >= 0:
+                out[c][i] = d0 + float(dist[node])
+    return out
+
+# ---------- analyze() sonuç cache'i ----------
+
+RESULT_SNAP_DECIMALS = 4          # ~11 m; yakın noktalar aynı girdiyi paylaşır
+RESULT_CACHE_MAX_MB = 64
+
+def scoring_config_hash():
+    """Puanlamayı/sıralamayı/çıktıyı etkileyen ayarların özeti; biri değişince cache girdileri geçersiz olur."""
+    cfg = {"scoring": SCORING, "weights": OVERALL_WEIGHTS, "scores": SCORES, "cats": CATS,
+           "speed": [WALK_SPEED_KPH, DRIVE_SPEED_KPH, WALK_CIRCUITY, DRIVE_CIRCUITY]}
+    return hashlib.sha1(json.dumps(cfg, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+class ResultCache:
+    """
+    analyze() için iki katmanlı sonuç cache'i. Anahtar: (ayar özeti + cache dosyası imzası, yuvarlanmış
+    lat/lon, radius, topn, radii). Girdide yapısal sonuç (puanlar + TOP-N POI'ler, JSON) ve render edilmiş
+    HTML ayrı tutulur; JSON/GeoJSON/HTML çıktılarının hepsi aynı girdiden üretilir.
+    Bellek katmanı bayt sınırlı LRU; disk katmanı (opsiyonel) SQLite. Sürüm kaynak kümesi (sources) başına
+    izlenir: bir kümenin sürümü (ayar özeti veya Parquet imzası) değişince sadece o kümenin eski girdileri
+    bellekten ve diskten düşer. Farklı kaynak kümeleri (bölgeler, birleşik/ayrı cache) aynı cache'i paylaşır.
+    """
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_MB << 20, disk_path=None, snap_decimals=RESULT_SNAP_DECIMALS):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.snap_decimals = snap_decimals
+        self._mem = OrderedDict()   # key -> {"data": json str, "html": {render_key: str}, "size": int}
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._slots = {}            # kaynak kümesi özeti -> geçerli sürüm
+        self.hits = self.disk_hits = self.misses = self.evictions = self.invalidations = 0
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            con = self._con()
+            cols = [r[1] for r in con.execute("PRAGMA table_info(result)")]
+            if cols and "slot" not in cols:
+                # eski biçim (kaynak kümesi yok): anahtarları artık eşleşmez
+                con.execute("DROP TABLE result")
+                con.execute("DROP TABLE IF EXISTS render")
+            con.execute("CREATE TABLE IF NOT EXISTS result (key TEXT PRIMARY KEY, slot TEXT, version TEXT, data TEXT, "
+                        "ts REAL)")
+            con.execute("CREATE TABLE IF NOT EXISTS render (key TEXT, render TEXT, body TEXT, PRIMARY KEY (key, render))")
+            con.commit()
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.disk_path, timeout=30.0)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA busy_timeout=30000")
+            self._local.con = con
+        return con
+
+    def snap(self, lat, lon):
+        return round(lat, self.snap_decimals), round(lon, self.snap_decimals)
+
+    def key(self, lat, lon, radius, topn, radii, fingerprint, sources=None):
+        """
+        lat/lon snap()'lenmiş olmalı. fingerprint: kaynakların durumu (dosya imzası vb.); sources: kaynak kümesinin
+        kimliği (ör. dosya yolları). Bu kümenin sürümü değiştiyse önce kümenin eski girdileri düşürülür.
+        """
+        version = scoring_config_hash() + "-" + hashlib.sha1(repr(fingerprint).encode("utf-8")).hexdigest()[:16]
+        slot = hashlib.sha1(repr(sources).encode("utf-8")).hexdigest()[:16]
+        if self._slots.get(slot) != version:
+            self._retire(slot, version)
+        return json.dumps([version, slot, lat, lon, float(radius), int(topn), sorted((radii or {}).items())])
+
+    def _retire(self, slot, version):
+        # slot'un önceki sürümüne ait girdiler artık erişilemez: bellekten ve diskten silinir
+        with self._lock:
+            old = self._slots.get(slot)
+            if old == version:
+                return
+            self._slots[slot] = version
+            if old is not None:
+                self.invalidations += 1
+                for k in [k for k, e in self._mem.items() if e["version"] == old]:
+                    self.bytes -= self._mem.pop(k)["size"]
+        if self.disk_path:
+            # süreç yeni başladıysa (old None) önceki çalıştırmalardan kalan eski sürümler de gider
+            con = self._con()
+            con.execute("DELETE FROM render WHERE key IN (SELECT key FROM result WHERE slot = ? AND version <> ?)",
+                        (slot, version))
+            con.execute("DELETE FROM result WHERE slot = ? AND version <> ?", (slot, version))
+            con.commit()
+
+    def _insert(self, key, entry):
+        # çağıran _lock'u tutar
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self.bytes -= old["size"]
+        self._mem[key] = entry
+        self.bytes += entry["size"]
+        self._evict()
+
+    def _evict(self):
+        # en az yakın zamanda kullanılanlardan başlayarak bayt sınırına inilir (en yeni girdi kalır)
+        while self.bytes > self.max_bytes and len(self._mem) > 1:
+            _, ev = self._mem.popitem(last=False)
+            self.bytes -= ev["size"]
+            self.evictions += 1
+
+    def get(self, key):
+        """Yapısal sonuç (dict) ya da None."""
+        with self._lock:
+            e = self._mem.get(key)
+            if e is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return json.loads(e["data"])
+        if self.disk_path:
+            row = self._con().execute("SELECT data FROM result WHERE key=?", (key,)).fetchone()
+            if row is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._insert(key, {"data": row[0], "html": {}, "size": len(row[0]),
+                                       "version": json.loads(key)[0]})
+                return json.loads(row[0])
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        version, slot = json.loads(key)[:2]
+        with self._lock:
+            self._insert(key, {"data": body, "html": {}, "size": len(body), "version": version})
+        if self.disk_path:
+            con = self._con()
+            con.execute("INSERT OR REPLACE INTO result (key, slot, version, data, ts) VALUES (?,?,?,?,?)",
+                        (key, slot, version, body, time.time()))
+            con.commit()
+
+    def get_html(self, key, render_key):
+        with self._lock:
+            e = self._mem.get(key)
+            html = e["html"].get(render_key) if e is not None else None
+        if html is None and self.disk_path:
+            row = self._con().execute("SELECT body FROM render WHERE key=? AND render=?", (key, render_key)).fetchone()
+            if row is not None:
+                html = row[0]
+                self._attach_html(key, render_key, html)
+        return html
+
+    def _attach_html(self, key, render_key, html):
+        with self._lock:
+            e = self._mem.get(key)
+            if e is None or render_key in e["html"]:
+                return
+            e["html"][render_key] = html
+            e["size"] += len(html)
+            self.bytes += len(html)
+            self._mem.move_to_end(key)
+            self._evict()
+
+    def put_html(self, key, render_key, html):
+        self._attach_html(key, render_key, html)
+        if self.disk_path:
+            con = self._con()
+            con.execute("INSERT OR REPLACE INTO render (key, render, body) VALUES (?,?,?)", (key, render_key, html))
+            con.commit()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._mem), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "evictions": self.evictions, "invalidations": self.invalidations}
+
+_RESULT_CACHES = {}
+
+def get_result_cache(max_mb=RESULT_CACHE_MAX_MB, disk_path=None, snap_decimals=RESULT_SNAP_DECIMALS):
+    """Süreç başına paylaşılan ResultCache (disk yolu başına bir tane)."""
+    key = os.path.abspath(disk_path) if disk_path else None
+    with _ENGINES_LOCK:
+        if key not in _RESULT_CACHES:
+            _RESULT_CACHES[key] = ResultCache(int(max_mb * (1 << 20)), disk_path, snap_decimals)
+        return _RESULT_CACHES[key]
+
+# ---------- önceden hesaplanmış puan rasterı (build_score_grid.py) ----------
+
+SCORE_GRID = "./cache/be_score_grid.npy"
+SCORE_GRID_SCALE, SCORE_GRID_NODATA = 10, 255    # uint8 = round(puan*10); 255 = veri yok
+HEAT_STOPS = ((0.0, (215, 48, 39)), (5.0, (254, 224, 139)), (10.0, (26, 152, 80)))   # kırmızı → sarı → yeşil
+
+def score_grid_meta_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+def _write_png(path, rgba):
+    # bağımlılıksız RGBA PNG (satır filtresi 0 + zlib)
+    h, w, _ = rgba.shape
+    raw = b"".join(b"\x00" + rgba[i].tobytes() for i in range(h))
+    chunk = lambda tag, data: (struct.pack(">I", len(data)) + tag + data +
+                               struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 6, 0, 0, 0)) +
+                chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b""))
+
+class ScoreGrid:
+    """
+    build_score_grid.py çıktısı: (katman, satır, sütun) uint8 dizi, mmap ile açılır (dosya belleğe
+    okunmaz). Nokta sorgusu hücre indeksi hesabı + en fazla 4 okuma → sabit zamanlı.
+    Satır 0 en güneydeki hücredir; hücre (i, j) merkezi = (lat0 + (i+.5)*dlat, lon0 + (j+.5)*dlon).
+    """
+    def __init__(self, path=SCORE_GRID):
+        with open(score_grid_meta_path(path), encoding="utf-8") as f:
+            self.meta = m = json.load(f)
+        self.arr = np.load(path, mmap_mode="r")
+        self.lat0, self.lon0, self.dlat, self.dlon = m["lat0"], m["lon0"], m["dlat"], m["dlon"]
+        self.rows, self.cols = m["rows"], m["cols"]
+        self.layers = {name: k for k, name in enumerate(m["layers"])}
+        self.scale, self.nodata = m["scale"], m["nodata"]
+        # SCORING/ağırlıklar raster üretildikten sonra değiştiyse değerler eskidir (yeniden build gerekir)
+        self.stale = m.get("config") != scoring_config_hash()
+
+    def bounds(self):
+        return [[self.lat0, self.lon0], [self.lat0 + self.rows * self.dlat, self.lon0 + self.cols * self.dlon]]
+
+    def lookup(self, lat, lon, interpolate=True):
+        """{katman: puan} ya da raster dışındaysa None. interpolate: komşu 4 hücre merkezinden bilineer."""
+        fy, fx = (lat - self.lat0) / self.dlat, (lon - self.lon0) / self.dlon
+        if not (0 <= fy < self.rows and 0 <= fx < self.cols):
+            return None
+        i, j = int(fy), int(fx)
+        v = self.arr[:, i, j].astype(float)
+        if interpolate:
+            fy, fx = min(max(fy - 0.5, 0.0), self.rows - 1.0), min(max(fx - 0.5, 0.0), self.cols - 1.0)
+            i0, j0 = max(0, min(int(fy), self.rows - 2)), max(0, min(int(fx), self.cols - 2))
+            ty, tx = fy - i0, fx - j0
+            c = self.arr[:, i0:i0 + 2, j0:j0 + 2].astype(float)
+            if c.shape[1:] == (2, 2) and not (c == self.nodata).any():
+                v = (c[:, 0, 0] * (1 - ty) * (1 - tx) + c[:, 0, 1] * (1 - ty) * tx +
+                     c[:, 1, 0] * ty * (1 - tx) + c[:, 1, 1] * ty * tx)
+        return {name: (None if self.arr[k, i, j] == self.nodata else round(float(v[k]) / self.scale, 2))
+                for name, k in self.layers.items()}
+
+    def window(self, layer="overall", bbox=None):
+        """(puan dizisi [kuzey üstte, veri yok = NaN], [[güney, batı], [kuzey, doğu]]) — bbox: lat_min,lon_min,lat_max,lon_max."""
+        i0, j0, i1, j1 = 0, 0, self.rows, self.cols
+        if bbox is not None:
+            lat_min, lon_min, lat_max, lon_max = bbox
+            i0 = max(0, int((lat_min - self.lat0) / self.dlat))
+            i1 = min(self.rows, int(math.ceil((lat_max - self.lat0) / self.dlat)))
+            j0 = max(0, int((lon_min - self.lon0) / self.dlon))
+            j1 = min(self.cols, int(math.ceil((lon_max - self.lon0) / self.dlon)))
+        raw = np.asarray(self.arr[self.layers[layer], i0:i1, j0:j1])[::-1]
+        vals = np.where(raw == self.nodata, np.nan, raw / self.scale)
+        return vals, [[self.lat0 + i0 * self.dlat, self.lon0 + j0 * self.dlon],
+                      [self.lat0 + i1 * self.dlat, self.lon0 + j1 * self.dlon]]
+
+    def export_png(self, out, layer="overall", bbox=None, alpha=170):
+        """
+        Isı haritası PNG'si + yanına <out>.json sınırlar (Leaflet L.imageOverlay / folium ImageOverlay için).
+        Renk: 0 kırmızı → 5 sarı → 10 yeşil; veri yok saydam.
+        """
+        vals, bounds = self.window(layer, bbox)
+        xs, cols = [s[0] for s in HEAT_STOPS], [s[1] for s in HEAT_STOPS]
+        v = np.nan_to_num(vals, nan=0.0)
+        rgba = np.empty(vals.shape + (4,), np.uint8)
+        for ch in range(3):
+            rgba[..., ch] = np.interp(v, xs, [c[ch] for c in cols]).astype(np.uint8)
+        rgba[..., 3] = np.where(np.isnan(vals), 0, alpha)
+        _write_png(out, rgba)
+        with open(os.path.splitext(out)[0] + ".json", "w", encoding="utf-8") as f:
+            json.dump({"layer": layer, "bounds": bounds, "image": os.path.basename(out)}, f)
+        return bounds
+
+    def export_ascii(self, out, layer="overall", bbox=None):
+        """ESRI ASCII grid (.asc; GDAL/QGIS doğrudan açar, dx/dy ile kare olmayan hücre)."""
+        vals, bounds = self.window(layer, bbox)
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(f"ncols {vals.shape[1]}\nnrows {vals.shape[0]}\n"
+                    f"xllcorner {bounds[0][1]:.9f}\nyllcorner {bounds[0][0]:.9f}\n"
+                    f"dx {self.dlon:.9f}\ndy {self.dlat:.9f}\nNODATA_value -1\n")
+            np.savetxt(f, np.nan_to_num(vals, nan=-1.0), fmt="%.1f")
+        return bounds
+
+_SCORE_GRIDS = {}
+
+def get_score_grid(path=SCORE_GRID):
+    """Yol + mtime başına tek ScoreGrid (raster yeniden üretilince yenisi açılır); dosya yoksa None."""
+    if not path or not os.path.exists(path):
+        return None
+    key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+    if key not in _SCORE_GRIDS:
+        _SCORE_GRIDS[key] = ScoreGrid(path)
+    return _SCORE_GRIDS[key]
+
+def grid_score(lat, lon, path=SCORE_GRID, interpolate=True):
+    """analyze()'ın hızlı yolu: sadece puanlar (kategori + overall), POI listesi/harita yok; raster yoksa None."""
+    grid = get_score_grid(path)
+    return grid.lookup(lat, lon, interpolate) if grid is not None else None
+
 def calc_category_score(cat, n_total:int, d_min:float, has_hospital:bool=False) -> float:
     # Kategoriye göre konfig
     cfg = SCORING[cat]
@@ -212,7 +1245,233 @@ def calc_category_score(cat, n_total:int, d_min:float, has_hospital:bool=False)
     # 0..10 aralığına kırp
     return max(0.0, min(10.0, score))
 
-def main():
+def calc_category_score_vec(cat, n_total, d_min, has_hospital):
+    """calc_category_score'un pandas Series üzerinde vektörel karşılığı (batch modu)."""
+    cfg = SCORING[cat]
+    D0, w_prox, w_count, Nsat = cfg["D0"], cfg["w_prox"], cfg["w_count"], cfg["Nsat"]
+    n_total = n_total.fillna(0).astype(float)
+    prox_norm = (1.0 - d_min.clip(upper=D0) / D0).clip(lower=0.0)
+    prox_pts = prox_norm.where(d_min.notna() & (n_total > 0), 0.0) * w_prox
+    count_pts = n_total.clip(upper=Nsat) / Nsat * w_count
+    score = prox_pts + count_pts
+    if cat == "health" and "bonus_if_hospital" in cfg:
+        score = score + has_hospital.fillna(False).astype(bool) * cfg["bonus_if_hospital"]
+    return score.clip(0.0, 10.0)
+
+def _geocode_points(df, local=None, cache=None):
+    # 'address' kolonlu tablo → lat/lon (yerel indeks önce; sadece kaçanlar Nominatim'e gider)
+    coords = []
+    for addr in df["address"]:
+        try:
+            coords.append(geocode(addr, cache=cache, local=local)[:2])
+        except RuntimeError:
+            coords.append((None, None))
+    df = df.copy()
+    df["lat"] = [c[0] for c in coords]
+    df["lon"] = [c[1] for c in coords]
+    missing = df["lat"].isna()
+    if missing.any():
+        print(f"[BATCH] geocode edilemeyen adres: {int(missing.sum()):,} (atlandı)")
+    return df[~missing]
+
+def _load_points(points, local=None, cache=None):
+    # DataFrame ya da .parquet/.csv yolu → lat/lon içeren DataFrame
+    if isinstance(points, pd.DataFrame):
+        df = points
+    elif str(points).lower().endswith(".parquet"):
+        df = duckdb.sql(f"SELECT * FROM read_parquet({sql_str(points)})").df()
+    elif str(points).lower().endswith(".csv"):
+        df = duckdb.sql(f"SELECT * FROM read_csv_auto({sql_str(points)})").df()
+    else:
+        raise ValueError(f"Desteklenmeyen nokta dosyası: {points} (.parquet veya .csv)")
+    if not {"lat", "lon"} <= set(df.columns):
+        if "address" not in df.columns:
+            raise ValueError("Nokta tablosunda 'lat' ve 'lon' (veya 'address') kolonları olmalı.")
+        df = _geocode_points(df, local=local, cache=cache)
+    df = df.reset_index(drop=True).copy()
+    df["pid"] = range(len(df))
+    return df
+
+def analyze_batch(points, radius=DEFAULT_RADIUS_M, topn=TOP_N,
+                  nodes_path="./cache/be_poi.parquet", polys_path="./cache/be_poi_poly.parquet",
+                  with_top=False, con=None, engine=None, local_geocoder=None, geocode_cache=None,
+                  road_graph=ROAD_GRAPH):
+    """
+    Çok sayıda nokta için tek geçişli puanlama: noktalar tablo olarak yüklenir, POI'lerle
+    grid hücreleri üzerinden tek bir spatial join yapılır; n_total/d_min/has_hospital_any
+    (pid, cat) bazında, TOP-N ise pencereli sıralama ile hesaplanır. road_graph'ta bu kaynaklardan
+    üretilmiş near_* tabloları varsa d_min, analyze()'daki gibi en yakın POI'ye yürüme ağı mesafesidir.
+    Dönüş: {"scores": nokta başına 1 satır, "top": uzun TOP-N tablosu veya None, "elapsed_s", "points_per_s"}
+    """
+    t0 = time.time()
+    pts = _load_points(points, local=local_geocoder, cache=geocode_cache)
+    if engine is not None:
+        engine.maybe_reload()
+        con, base_src = engine.cursor(), engine.source_sql()
+        sources = engine._paths()
+    else:
+        nodes_ok, polys_ok = _existing(nodes_path), _existing(polys_path)
+        if not nodes_ok and not polys_ok:
+            raise FileNotFoundError("Ne node ne polygon cache bulundu.")
+        base_src = _poi_source_sql(nodes_ok, polys_ok)
+        sources = (nodes_ok, polys_ok)
+    graph = road_graph if isinstance(road_graph, RoadGraph) else get_road_graph(road_graph)
+    walk_dmin = (network_walk_dmin(graph, pts["lat"].to_numpy(float), pts["lon"].to_numpy(float))
+                 if near_tables_match(graph, sources) else {})
+
+    # grid hücresi >= yarıçap → her nokta için komşu 3x3 hücre yeterli (boylam: en kuzeydeki noktaya göre)
+    max_abs_lat = float(pts["lat"].abs().max()) if len(pts) else 0.0
+    cell_lat, cell_lon = meters_to_deg_latlon(min(89.0, max_abs_lat + 0.01), radius)
+
+    con = con or duckdb.connect()
+    con.register("points_in", pts[["pid", "lat", "lon"]])
+    con.execute(f"""
+    CREATE OR REPLACE TEMP TABLE batch_hits AS
+    WITH pts AS (
+      SELECT pid, lat AS plat, lon AS plon,
+             CAST(floor(lat/{cell_lat}) AS BIGINT) AS gy,
+             CAST(floor(lon/{cell_lon}) AS BIGINT) AS gx
+      FROM points_in
+    ),
+    pts_n AS (
+      SELECT pid, plat, plon, gy + dy AS ny, gx + dx AS nx
+      FROM pts, (SELECT range AS dy FROM range(-1, 2)) ty, (SELECT range AS dx FROM range(-1, 2)) tx
+    ),
+    src AS (
+      SELECT *,
+             CAST(floor(lat/{cell_lat}) AS BIGINT) AS gy,
+             CAST(floor(lon/{cell_lon}) AS BIGINT) AS gx
+      FROM ({base_src})
+    ),
+    dist AS (
+      SELECT p.pid, s.*,
+             {_haversine_sql("p.plat", "p.plon", "s.lat", "s.lon")} AS d_lin
+      FROM pts_n p JOIN src s ON s.gy = p.ny AND s.gx = p.nx
+      -- tekil sorgudaki (query_category) bbox ön-filtresinin aynısı → sonuçlar birebir aynı
+      WHERE abs(s.lat - p.plat) <= {cell_lat}
+        AND abs(s.lon - p.plon) <= {radius}/(111320.0*greatest(0.1, cos(radians(p.plat))))
+    )
+    SELECT pid, cat, name, brand, amenity, shop, healthcare, lat, lon, d_lin,
+           score_pre AS score, hosp_pre AS is_hospital
+    FROM dist WHERE d_lin <= {radius}
+    """)
+    stats = con.execute("""
+        SELECT pid, cat, COUNT(*) AS n_total, MIN(d_lin) AS d_min, MAX(is_hospital) AS has_hospital_any
+        FROM batch_hits GROUP BY pid, cat
+    """).df()
+
+    top = None
+    if with_top:
+        top = con.execute(f"""
+        SELECT pid, cat, rn, name, brand, amenity, shop, healthcare, lat, lon, score, d_lin,
+               d_lin*{WALK_CIRCUITY} AS walk_m,
+               d_lin*{DRIVE_CIRCUITY} AS drive_m,
+               (d_lin*{WALK_CIRCUITY}) / ({WALK_SPEED_KPH} * 1000/3600) AS walk_s,
+               (d_lin*{DRIVE_CIRCUITY}) / ({DRIVE_SPEED_KPH} * 1000/3600) AS drive_s
+        FROM (
+          SELECT *, ROW_NUMBER() OVER (PARTITION BY pid, cat ORDER BY score DESC, d_lin ASC) AS rn
+          FROM batch_hits
+        )
+        WHERE rn <= {topn}
+        ORDER BY pid, cat, rn
+        """).df()
+    con.execute("DROP TABLE batch_hits")
+    con.unregister("points_in")
+
+    # nokta başına geniş tablo: kategori puanları + genel puan
+    out = pts.drop(columns=["pid"]).copy()
+    overall = pd.Series(0.0, index=out.index)
+    for cat in CATS.keys():
+        st = stats[stats["cat"] == cat].set_index("pid").reindex(pts["pid"])
+        st.index = out.index
+        n_total = st["n_total"].fillna(0).astype(int)
+        d_min = st["d_min"].astype(float)
+        if cat in walk_dmin:
+            # analyze() (_score_frames) ile aynı: ağda ulaşılan en yakın POI varsa yürüme ağı mesafesi
+            d_min = d_min.where(np.isnan(walk_dmin[cat]), walk_dmin[cat])
+        has_hosp = st["has_hospital_any"].fillna(0).astype(bool)
+        score = calc_category_score_vec(cat, n_total, d_min, has_hosp)
+        out[f"{cat}_score"] = score
+        out[f"{cat}_n"] = n_total
+        out[f"{cat}_dmin"] = d_min
+        if cat == "health":
+            out["health_has_hospital"] = has_hosp
+        overall += OVERALL_WEIGHTS.get(cat, 0.0) * score
+    out["overall"] = overall
+    if top is not None and "id" in pts.columns:
+        top.insert(1, "id", pts["id"].to_numpy()[top["pid"].to_numpy()])
+
+    elapsed = time.time() - t0
+    return {"scores": out, "top": top, "elapsed_s": elapsed,
+            "points_per_s": (len(pts)/elapsed if elapsed > 0 else float("inf"))}
+
+def run_batch(args):
+    points = args.batch_input
+    if args.regions:
+        # noktaların kapsadığı kutu + yarıçap payına değen bölge dosyaları
+        points = _load_points(points, local=get_local_geocoder(args.addr_index))
+        dlat, dlon = meters_to_deg_latlon(float(points["lat"].abs().max()) if len(points) else 0.0, args.radius)
+        rs = get_region_set(args.regions)
+        nodes_path, polys_path = rs.select_bbox(points["lat"].min() - dlat, points["lon"].min() - dlon,
+                                                points["lat"].max() + dlat, points["lon"].max() + dlon)
+        print(f"[REGIONS] {', '.join(rs.regions_of(nodes_path, polys_path)) or '-'}")
+    else:
+        nodes_path, polys_path = resolve_sources(args.nodes, args.polys, args.merged)
+    res = analyze_batch(points, radius=args.radius, topn=args.topn,
+                        nodes_path=nodes_path, polys_path=polys_path,
+                        with_top=bool(args.batch_top_output),
+                        local_geocoder=get_local_geocoder(args.addr_index),
+                        road_graph=None if args.circuity else args.road_graph)
+    res["scores"].to_parquet(args.batch_output, index=False)
+    print(f"[BATCH] puan tablosu: {os.path.abspath(args.batch_output)}  satır={len(res['scores']):,}")
+    if args.batch_top_output:
+        res["top"].to_parquet(args.batch_top_output, index=False)
+        print(f"[BATCH] TOP-N tablosu: {os.path.abspath(args.batch_top_output)}  satır={len(res['top']):,}")
+    print(f"[BATCH] nokta={len(res['scores']):,}  süre={res['elapsed_s']:.2f}s  hız={res['points_per_s']:,.0f} nokta/sn")
+
+def _daemon_run(argv, cwd):
+    # daemon'daki tek CLI çağrısı: istemcinin dizininde main(argv), çıktı/çıkış kodu yakalanır
+    out, err, code = io.StringIO(), io.StringIO(), 0
+    if "--daemon" in argv:
+        return {"stdout": "", "stderr": "[ERROR] --daemon istemciden iletilemez\n", "code": 2}
+    home = os.getcwd()
+    try:
+        os.chdir(cwd)
+        with redirect_stdout(out), redirect_stderr(err), scoped_sinks():
+            main(argv)
+    except SystemExit as e:
+        # tek seferlik yorumlayıcı ile aynı: None → 0, int → kendisi, mesaj → stderr + 1
+        if e.code is None or isinstance(e.code, int):
+            code = e.code or 0
+        else:
+            print(e.code, file=err)
+            code = 1
+    except Exception:
+        traceback.print_exc(file=err)
+        code = 1
+    finally:
+        os.chdir(home)
+    return {"stdout": out.getvalue(), "stderr": err.getvalue(), "code": code}
+
+def serve_daemon(args):
+    """--daemon: cache'leri ve bağlantıyı ısıtıp Unix soketinde --client isteklerini karşılar."""
+    from poi_daemon import serve
+    t0 = time.perf_counter()
+    cli_connection()
+    sources = (get_region_set(args.regions).all_sources() if args.regions
+               else resolve_sources(args.nodes, args.polys, args.merged))
+    for path in _as_paths(sources[0]) + _as_paths(sources[1]):
+        if os.path.exists(path):
+            _tile_manifest(path)
+            _has_rank(path)
+    if not args.circuity:
+        get_road_graph(args.road_graph)
+    get_local_geocoder(args.addr_index)
+    get_geocode_cache(args.geocode_cache)
+    print(f"[DAEMON] ısınma: {(time.perf_counter()-t0)*1000:.0f} ms")
+    serve(args.socket, _daemon_run)
+
+def main(argv=None):
     ap = argparse.ArgumentParser(description="Adres çevresinde hızlı POI analizi (node+polygon cache, puanlama).")
     ap.add_argument("--address", type=str)
     ap.add_argument("--lat", type=float)
@@ -221,37 +1480,139 @@ def main():
     ap.add_argument("--topn", type=int, default=TOP_N)
     ap.add_argument("--nodes", type=str, default="./cache/be_poi.parquet")
     ap.add_argument("--polys", type=str, default="./cache/be_poi_poly.parquet")
-    args = ap.parse_args()
+    ap.add_argument("--merged", type=str, default=MERGED_CACHE,
+                    help="build_poi_merged.py çıktısı; bu node/polygon cache'lerinden üretilmişse tek dosya taranır ('' ile kapalı)")
+    ap.add_argument("--regions", type=str,
+                    help="Çoklu bölge cache dizini (builder --out-dir); --nodes/--polys yerine daireye değen bölgeler taranır")
+    ap.add_argument("--geocode-cache", type=str, default=GEOCODE_DB, help="Kalıcı geocode cache'i (SQLite)")
+    ap.add_argument("--addr-index", type=str, default=ADDR_INDEX,
+                    help="Çevrimdışı adres indeksi (build_address_index.py); bulunamayan adresler Nominatim'e gider")
+    ap.add_argument("--radius-from-d0", action="store_true",
+                    help="Her kategori için yarıçap olarak SCORING[cat]['D0'] kullan")
+    ap.add_argument("--engine", choices=["duckdb", "index"], default="duckdb",
+                    help="Sorgu motoru: duckdb (varsayılan) veya index (NumPy grid indeksi, poi_index.py)")
+    ap.add_argument("--batch-input", type=str, help="Toplu mod: lat/lon (ops. id) içeren .parquet veya .csv")
+    ap.add_argument("--batch-output", type=str, default="scores.parquet", help="Toplu mod: nokta başına puan tablosu")
+    ap.add_argument("--batch-top-output", type=str, help="Toplu mod (ops.): uzun TOP-N POI tablosu (.parquet)")
+    ap.add_argument("--bench-map", action="store_true",
+                    help="folium render'ı ile GeoJSON payload çıktısının süre/boyut karşılaştırması")
+    ap.add_argument("--road-graph", type=str, default=ROAD_GRAPH,
+                    help="Yol ağı dizini (build_road_graph.py); varsa yürüme/araç süreleri ağ üzerinden hesaplanır")
+    ap.add_argument("--circuity", action="store_true",
+                    help="Yol ağını kullanma: düz mesafe x dolaşıklık / sabit hız modeli")
+    ap.add_argument("--score-grid", type=str,
+                    help="Hızlı yol: build_score_grid.py rasterından puan (POI sorgusu/harita yok)")
+    ap.add_argument("--grid-export", type=str, help="Rasterı dışa aktar: .png (ısı haritası + .json sınırlar) veya .asc")
+    ap.add_argument("--grid-layer", type=str, default="overall", help="Dışa aktarılacak katman (kategori adı veya overall)")
+    ap.add_argument("--grid-bbox", type=str, help="Dışa aktarma kesiti: lat_min,lon_min,lat_max,lon_max")
+    ap.add_argument("--profile", action="store_true",
+                    help="Aşama süreleri, kategori başına taranan/dönen satır, dosya başına okunan row-group/bayt")
+    ap.add_argument("--explain", action="store_true", help="--profile + DuckDB EXPLAIN ANALYZE planı")
+    ap.add_argument("--profile-out", type=str, help="Profili JSON olarak da yaz")
+    ap.add_argument("--daemon", action="store_true",
+                    help="Sıcak daemon: cache'ler + DuckDB bağlantısı açık kalır, --socket üzerinden istek bekler")
+    ap.add_argument("--client", action="store_true",
+                    help="İnce istemci: diğer argümanları çalışan daemon'a iletir (daemon yoksa tek seferlik çalışır)")
+    ap.add_argument("--socket", type=str, default="./cache/app_duckdb.sock", help="Daemon Unix soketi")
+    add_metrics_args(ap)
+    args = ap.parse_args(argv)
+
+    if args.daemon:
+        return serve_daemon(args)
+    if args.bench_map:
+        return bench_map_output(n_per_cat=args.topn)
+    if args.grid_export:
+        grid = ScoreGrid(args.score_grid or SCORE_GRID)
+        bbox = tuple(float(x) for x in args.grid_bbox.split(",")) if args.grid_bbox else None
+        export = grid.export_ascii if args.grid_export.lower().endswith(".asc") else grid.export_png
+        bounds = export(args.grid_export, layer=args.grid_layer, bbox=bbox)
+        print(f"[EXPORT] {args.grid_export}  katman={args.grid_layer}  sınırlar={bounds}")
+        return
+    if args.batch_input:
+        return run_batch(args)
+    install_sinks(args)
+    prof = as_profiler("explain" if args.explain else (args.profile or bool(args.profile_out)))
 
     # konum
     if args.address:
-        lat, lon, disp = geocode(args.address)
+        with prof.stage("geocode"):
+            lat, lon, disp = geocode(args.address, cache=get_geocode_cache(args.geocode_cache),
+                                     local=get_local_geocoder(args.addr_index))
     elif args.lat is not None and args.lon is not None:
         lat, lon, disp = args.lat, args.lon, f"({args.lat:.6f}, {args.lon:.6f})"
     else:
         raise SystemExit("Adres veya (lat,lon) verin.")
 
-    # kaynaklar (fallback)
-    nodes_path = args.nodes if (args.nodes and os.path.exists(args.nodes)) else None
-    polys_path = args.polys if (args.polys and os.path.exists(args.polys)) else None
-    if not nodes_path and not polys_path:
-        raise SystemExit(f"Ne node ne polygon cache bulundu.\n  nodes arg: {args.nodes}\n  polys arg: {args.polys}\nLütfen cache dosyalarını üretin.")
+    if args.score_grid:
+        t0 = time.perf_counter()
+        grid = ScoreGrid(args.score_grid)
+        res = grid.lookup(lat, lon)
+        if res is None:
+            raise SystemExit(f"Konum raster dışında: ({lat:.6f}, {lon:.6f})")
+        print(f"Adres: {disp}  (lat={lat:.6f}, lon={lon:.6f})  [raster, {(time.perf_counter()-t0)*1000:.2f} ms]")
+        if grid.stale:
+            print("[WARN] SCORING/ağırlıklar raster üretildikten sonra değişmiş; build_score_grid.py'yi yeniden çalıştırın")
+        for cat in CATS:
+            print(f"{CATS[cat]['label']:<8}: {res[cat]:>4.1f}/10")
+        print(f"\n*** GENEL PUAN: {res['overall']:.1f}/10 ***")
+        return
+
+    radii = {c: SCORING[c]["D0"] for c in CATS} if args.radius_from_d0 else None
+    if args.regions:
+        with prof.stage("regions"):
+            rs = get_region_set(args.regions)
+            nodes_path, polys_path = rs.select(lat, lon, max([args.radius, *(radii or {}).values()]))
+        if not nodes_path and not polys_path:
+            raise SystemExit(f"Konum hiçbir bölge cache'inin kapsamında değil: ({lat:.6f}, {lon:.6f})")
+    else:
+        # kaynaklar (fallback)
+        nodes_path = args.nodes if (args.nodes and os.path.exists(args.nodes)) else None
+        polys_path = args.polys if (args.polys and os.path.exists(args.polys)) else None
+        if not nodes_path and not polys_path:
+            raise SystemExit(f"Ne node ne polygon cache bulundu.\n  nodes arg: {args.nodes}\n  polys arg: {args.polys}\nLütfen cache dosyalarını üretin.")
+        nodes_path, polys_path = resolve_sources(nodes_path, polys_path, args.merged)
 
     print(f"Adres: {disp}  (lat={lat:.6f}, lon={lon:.6f})")
-    if nodes_path and not polys_path:
+    if args.regions:
+        print(f"[INFO] Bölgeler: {', '.join(rs.regions_of(nodes_path, polys_path))}  "
+              f"(dosya={len(nodes_path) + len(polys_path)})")
+    elif polys_path and polys_path == args.merged:
+        print("[INFO] Birleşik (node + polygon, dupe'suz) cache kullanılacak.")
+    elif nodes_path and not polys_path:
         print("[INFO] Sadece NODE cache bulunuyor.")
     elif polys_path and not nodes_path:
         print("[INFO] Sadece POLYGON cache bulunuyor (node yok).")
     else:
         print("[INFO] Node + Polygon birlikte kullanılacak.")
 
-    con = duckdb.connect()
+    if args.engine == "index":
+        with prof.stage("index_load"):
+            index = get_poi_index(nodes_path, polys_path)
+        frames, _ = index.query(lat, lon, args.radius, args.topn, radii=radii, prof=prof)
+    else:
+        with prof.stage("connect"):
+            con = cli_connection()
+        frames, _ = query_all_categories(con, nodes_path, polys_path, lat, lon, args.radius, args.topn,
+                                         radii=radii, prof=prof)
+    with prof.stage("road_graph"):
+        graph = None if args.circuity else get_road_graph(args.road_graph)
+    if graph is not None:
+        t0 = time.perf_counter()
+        with prof.stage("route"):
+            frames = retime_frames(frames, lat, lon, graph, args.radius, radii)
+        with prof.stage("nearest"):
+            nearest = (network_nearest(graph, lat, lon)
+                       if near_tables_match(graph, (nodes_path, polys_path)) else None)
+        print(f"[ROUTE] yol ağı ile süre: {(time.perf_counter()-t0)*1000:.1f} ms")
+    else:
+        nearest = None
+        print("[INFO] Yürüme/araç: circuity modeli (yol ağı yok ya da --circuity)")
     all_rows=[]
     cat_scores={}
     summary_rows=[]  # kategori scorecard için
 
     for cat in CATS.keys():
-        df = query_category(con, nodes_path, polys_path, cat, lat, lon, args.radius, args.topn)
+        df = frames[cat]
         label = CATS[cat]["label"]
         if df.empty:
             print(f"\n— {label} (sonuç yok)")
@@ -269,9 +1630,12 @@ def main():
         # Puanlama verileri (CTE window'dan aynı değerler tüm satırlarda aynı)
         n_total = int(df.iloc[0]["n_total"])
         d_min   = float(df.iloc[0]["d_min"]) if pd.notnull(df.iloc[0]["d_min"]) else None
+        if nearest is not None and "walk_m" in nearest[cat]:
+            d_min = nearest[cat]["walk_m"]   # en yakın POI'ye yürüme ağı mesafesi
         has_hospital = bool(df.iloc[0]["has_hospital_any"]) if "has_hospital_any" in df.columns else False
 
-        score = calc_category_score(cat, n_total, d_min, has_hospital)
+        with prof.stage("score"):
+            score = calc_category_score(cat, n_total, d_min, has_hospital)
         cat_scores[cat] = score
         summary_rows.append((label, score, n_total, d_min, has_hospital))
 
@@ -302,10 +1666,20 @@ def main():
     print(f"\n*** GENEL PUAN: {overall:.1f}/10 ***")
 
     # Harita
-    if not all_rows:
-        return
-    big = pd.concat(all_rows, ignore_index=True)
+    if all_rows:
+        with prof.stage("map_folium"):
+            _save_cli_map(lat, lon, disp, pd.concat(all_rows, ignore_index=True), summary_rows, overall)
+
+    if prof.enabled:
+        report = prof.to_dict()
+        print("\n" + prof.report())
+        emit("analyze", **report)
+        if args.profile_out:
+            with open(args.profile_out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=1, ensure_ascii=False)
+            print(f"[PROFILE] JSON: {args.profile_out}")
 
+def _save_cli_map(lat, lon, disp, big, summary_rows, overall):
     m = folium.Map(location=[lat, lon], zoom_start=15, control_scale=True)
     folium.Marker([lat, lon], popup=f"Adres: {disp}", tooltip="Adres",
                   icon=folium.Icon(color="black", icon="home")).add_to(m)
@@ -354,57 +1728,49 @@ def main():
     m.save(out)
     print(f"\nHarita kaydedildi: {out}")
 
-def analyze(address=None, lat=None, lon=None, radius=DEFAULT_RADIUS_M, topn=TOP_N,
-            nodes_path="./cache/be_poi.parquet", polys_path="./cache/be_poi_poly.parquet"):
-    # konum
-    if address:
-        lat, lon, disp = geocode(address)
-    elif lat is not None and lon is not None:
-        disp = f"({lat:.6f}, {lon:.6f})"
-    else:
-        raise ValueError("address veya (lat,lon) verin.")
+MAP_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "map_template.html")
 
-    nodes_ok = nodes_path and os.path.exists(nodes_path)
-    polys_ok = polys_path and os.path.exists(polys_path)
-    if not nodes_ok and not polys_ok:
-        raise FileNotFoundError("Ne node ne polygon cache bulundu.")
-
-    con = duckdb.connect()
-    all_rows = []
-    cat_scores = {}
-    summary_rows = []
-
-    for cat in CATS.keys():
-        df = query_category(con, nodes_path if nodes_ok else None,
-                            polys_path if polys_ok else None,
-                            cat, lat, lon, radius, topn)
-        label = CATS[cat]["label"]
-        if df.empty:
-            cat_scores[cat] = 0.0
-            summary_rows.append((label, 0.0, 0, None, False))
-            continue
-
-        n_total = int(df.iloc[0]["n_total"])
-        d_min   = float(df.iloc[0]["d_min"]) if pd.notnull(df.iloc[0]["d_min"]) else None
-        has_hospital = bool(df.iloc[0]["has_hospital_any"]) if "has_hospital_any" in df.columns else False
-        score = calc_category_score(cat, n_total, d_min, has_hospital)
-        cat_scores[cat] = score
-        summary_rows.append((label, score, n_total, d_min, has_hospital))
+def map_payload(lat, lon, disp, big, cat_scores, overall, radius=None):
+    """
+    Harita için kompakt GeoJSON: adres noktası + POI'ler (kategori, yürüme/araç mesafe-süre) + puanlar.
+    map_template.html bunu istemci tarafında çizer; satır başına Python nesnesi/HTML üretilmez.
+    """
+    feats = []
+    if not big.empty:
+        cols = [big[c].tolist() for c in ("lon", "lat", "cat", "name", "walk_m", "walk_s", "drive_m", "drive_s")]
+        for x, y, cat, name, wm, ws, dm, ds in zip(*cols):
+            feats.append({"type": "Feature",
+                          "geometry": {"type": "Point", "coordinates": [round(x, 6), round(y, 6)]},
+                          "properties": {"cat": cat, "name": None if pd.isna(name) else name,
+                                         "walk_m": round(wm), "walk_s": round(ws),
+                                         "drive_m": round(dm), "drive_s": round(ds)}})
+    return {
+        "type": "FeatureCollection",
+        "properties": {
+            "address": disp, "center": [lat, lon], "radius": radius,
+            "cats": CATS,
+            "scores": {c: round(cat_scores.get(c, 0.0), 1) for c in CATS},
+            "overall": round(overall, 1),
+        },
+        "features": feats,
+    }
 
-        df["cat"] = cat
-        all_rows.append(df)
+@lru_cache(maxsize=1)
+def map_template():
+    """Statik Leaflet şablonu (süreç başına bir kez okunur; web tarafında uzun süre cache'lenebilir)."""
+    with open(MAP_TEMPLATE, encoding="utf-8") as f:
+        return f.read()
 
-    # genel puan (ağırlıklı)
-    overall = 0.0
-    for cat in CATS.keys():
-        overall += OVERALL_WEIGHTS.get(cat, 0.0) * cat_scores.get(cat, 0.0)
+def embed_map_payload(payload, template=None):
+    # tek dosyalık HTML gerekiyorsa: şablon + <script>window.MAP_DATA = …</script>
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+    return (template or map_template()).replace("</head>", f"<script>window.MAP_DATA = {data};</script>\n</head>", 1)
 
-    # harita
+def _folium_map_html(lat, lon, disp, big, cat_scores):
     m = folium.Map(location=[lat, lon], zoom_start=15, control_scale=True)
     folium.Marker([lat, lon], popup=f"Adres: {disp}", tooltip="Adres",
                   icon=folium.Icon(color="black", icon="home")).add_to(m)
 
-    big = pd.concat(all_rows, ignore_index=True) if all_rows else pd.DataFrame()
     if not big.empty:
         for _, r in big.iterrows():
             label = CATS[r["cat"]]["label"]
@@ -437,29 +1803,188 @@ def analyze(address=None, lat=None, lon=None, radius=DEFAULT_RADIUS_M, topn=TOP_
         f'{score_items}'
         f'</div>'
     ))
-    map_html = m.get_root().render()
+    return m.get_root().render()
 
-    # tablo verileri
-    results_by_cat = {}
-    if not big.empty:
-        for cat in CATS.keys():
-            sub = big[big["cat"] == cat].copy()
-            if sub.empty:
-                results_by_cat[cat] = []
-                continue
-            rows = []
-            for _, r in sub.iterrows():
-                rows.append({
-                    "name": r["name"],
-                    "walk_m": fmt_meters(r["walk_m"]),
-                    "walk_s": fmt_seconds(r["walk_s"]),
-                    "drive_m": fmt_meters(r["drive_m"]),
-                    "drive_s": fmt_seconds(r["drive_s"]),
-                })
-            results_by_cat[cat] = rows
+def _bench_frame(lat, lon, n_per_cat):
+    # render benchmark'ı için sahte sonuç tablosu (analyze'daki 'big' ile aynı kolonlar)
+    rng = np.random.default_rng(0)
+    n = n_per_cat * len(CATS)
+    d = rng.uniform(50, 2500, n)
+    return pd.DataFrame({
+        "cat": np.repeat(list(CATS), n_per_cat), "name": [f"POI {i}" for i in range(n)],
+        "lat": lat + rng.uniform(-0.02, 0.02, n), "lon": lon + rng.uniform(-0.03, 0.03, n),
+        "walk_m": d * WALK_CIRCUITY, "walk_s": d * WALK_CIRCUITY / (WALK_SPEED_KPH / 3.6),
+        "drive_m": d * DRIVE_CIRCUITY, "drive_s": d * DRIVE_CIRCUITY / (DRIVE_SPEED_KPH / 3.6),
+    })
+
+def bench_map_output(n_per_cat=TOP_N, repeats=20, lat=50.876182, lon=4.680335):
+    """folium render'ı ile GeoJSON payload'ını aynı veride karşılaştırır: istek başına süre ve yanıt boyutu."""
+    big = _bench_frame(lat, lon, n_per_cat)
+    scores = {c: 5.0 for c in CATS}
+    out = {}
+    for mode in ("folium", "geojson"):
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            if mode == "folium":
+                body = _folium_map_html(lat, lon, "bench", big, scores)
+            else:
+                body = json.dumps(map_payload(lat, lon, "bench", big, scores, 5.0), ensure_ascii=False,
+                                  separators=(",", ":"))
+        out[mode] = {"ms": (time.perf_counter() - t0) * 1000 / repeats, "bytes": len(body.encode("utf-8"))}
+    tmpl = len(map_template().encode("utf-8"))
+    print(f"[BENCH-MAP] poi={len(big)}  tekrar={repeats}")
+    for mode, r in out.items():
+        print(f"  {mode:<8} {r['ms']:8.2f} ms/istek  {r['bytes']:>9,} B/istek")
+    print(f"  şablon   {tmpl:,} B (bir kez)  → süre x{out['folium']['ms'] / out['geojson']['ms']:.0f}, "
+          f"boyut x{out['folium']['bytes'] / out['geojson']['bytes']:.0f} daha az")
+    return out
+
+POI_OUT_COLS = ("cat", "name", "lat", "lon", "walk_m", "walk_s", "drive_m", "drive_s")
+
+def _analyze_data(lat, lon, radius, topn, nodes_path, polys_path, radii, engine, graph=None, prof=NULL_PROFILER):
+    """
+    Haritadan bağımsız yapısal sonuç: {"cat_scores", "overall", "pois": {kolon: liste}}.
+    JSON'a çevrilebilir; ResultCache'te saklanan kısım budur.
+    """
+    if engine is not None:
+        # uzun ömürlü motor (web): bağlantı/tablo hazır, sadece parametreli sorgu
+        frames, _ = engine.query(lat, lon, radius, topn, radii=radii, prof=prof)
     else:
-        for cat in CATS.keys():
-            results_by_cat[cat] = []
+        nodes_ok, polys_ok = _existing(nodes_path), _existing(polys_path)
+        if not nodes_ok and not polys_ok:
+            raise FileNotFoundError("Ne node ne polygon cache bulundu.")
+
+        with prof.stage("connect"):
+            con = duckdb.connect()
+        frames, _ = query_all_categories(con, nodes_ok, polys_ok, lat, lon, radius, topn, radii=radii, prof=prof)
+    nearest = None
+    if graph is not None:
+        with prof.stage("route"):
+            frames = retime_frames(frames, lat, lon, graph, radius, radii)
+        with prof.stage("nearest"):
+            sources = engine._paths() if engine is not None else (nodes_path, polys_path)
+            nearest = network_nearest(graph, lat, lon) if near_tables_match(graph, sources) else None
+    with prof.stage("score"):
+        return _score_frames(frames, nearest)
+
+def _score_frames(frames, nearest):
+    all_rows = []
+    cat_scores = {}
+
+    for cat in CATS.keys():
+        df = frames[cat]
+        if df.empty:
+            cat_scores[cat] = 0.0
+            continue
+
+        n_total = int(df.iloc[0]["n_total"])
+        d_min   = float(df.iloc[0]["d_min"]) if pd.notnull(df.iloc[0]["d_min"]) else None
+        if nearest is not None and "walk_m" in nearest[cat]:
+            # yakınlık puanı: en yakın POI'ye yürüme ağı mesafesi (önceden hesaplanmış)
+            d_min = nearest[cat]["walk_m"]
+        has_hospital = bool(df.iloc[0]["has_hospital_any"]) if "has_hospital_any" in df.columns else False
+        cat_scores[cat] = calc_category_score(cat, n_total, d_min, has_hospital)
+
+        df["cat"] = cat
+        all_rows.append(df[list(POI_OUT_COLS)])
+
+    # genel puan (ağırlıklı)
+    overall = 0.0
+    for cat in CATS.keys():
+        overall += OVERALL_WEIGHTS.get(cat, 0.0) * cat_scores.get(cat, 0.0)
+
+    big = pd.concat(all_rows, ignore_index=True) if all_rows else pd.DataFrame(columns=list(POI_OUT_COLS))
+    big["name"] = big["name"].astype(object).where(big["name"].notna(), None)
+    return {"cat_scores": cat_scores, "overall": overall,
+            "pois": {c: big[c].tolist() for c in POI_OUT_COLS}, "nearest": nearest}
+
+def analyze(address=None, lat=None, lon=None, radius=DEFAULT_RADIUS_M, topn=TOP_N,
+            nodes_path="./cache/be_poi.parquet", polys_path="./cache/be_poi_poly.parquet",
+            radii=None, engine=None, geocode_cache=None, map_mode="folium", display=None,
+            result_cache=None, road_graph=ROAD_GRAPH, profile=False, regions=None):
+    """
+    map_mode: "folium" → 'map_html' tam HTML (eski davranış); "geojson" → 'map' kompakt payload
+    (map_template() ile istemci tarafında çizilir); "none" → harita üretilmez.
+    display: lat/lon ile çağrıldığında gösterilecek adres metni (ör. çağıran taraf geocode ettiyse).
+    result_cache: ResultCache verilirse sorgu snap()'lenmiş konumda yapılır ve sonuç/HTML cache'lenir
+    (mesafeler en fazla snap hassasiyeti kadar kayar; adres işaretçisi gerçek konumda kalır).
+    road_graph: yol ağı dizini (ya da RoadGraph); yoksa/None → yürüme/araç değerleri circuity modeliyle.
+    profile: True → sonuçta 'profile' (aşama süreleri ms, kategori başına taranan/yarıçap içi/dönen satır,
+    dosya başına okunan row-group/bayt); "explain" → ek olarak DuckDB EXPLAIN ANALYZE planı; Profiler
+    örneği de verilebilir. Profil ayrıca emit("analyze", ...) ile kurulu metrik sink'lerine gider.
+    regions: çoklu bölge dizini ya da RegionSet (engine yoksa); nodes_path/polys_path yerine sorgu
+    dairesine değen bölge dosyaları taranır.
+    """
+    prof = as_profiler(profile)
+    # konum
+    if address:
+        with prof.stage("geocode"):
+            lat, lon, disp = geocode(address, cache=geocode_cache)
+    elif lat is not None and lon is not None:
+        disp = display or f"({lat:.6f}, {lon:.6f})"
+    else:
+        raise ValueError("address veya (lat,lon) verin.")
+
+    with prof.stage("road_graph"):
+        graph = road_graph if isinstance(road_graph, RoadGraph) else get_road_graph(road_graph)
+    qlat, qlon = result_cache.snap(lat, lon) if result_cache is not None else (lat, lon)
+    if regions is not None and engine is None:
+        with prof.stage("regions"):
+            nodes_path, polys_path = get_region_set(regions).select(qlat, qlon, max([radius, *(radii or {}).values()]))
+        if not nodes_path and not polys_path:
+            raise ValueError(f"Konum hiçbir bölge cache'inin kapsamında değil: ({lat:.6f}, {lon:.6f})")
+    data = key = None
+    if result_cache is not None:
+        with prof.stage("result_cache_get"):
+            files = engine.fingerprint() if hasattr(engine, "fingerprint") else files_signature((nodes_path, polys_path))
+            fp = (files, graph.fingerprint if graph is not None else None)
+            # kaynak kümesi: taranan dosyalar (bölge seçimi konuma göre değişir) + yol ağı
+            sources = (sorted(os.path.abspath(f[0]) for f in files),
+                       os.path.abspath(graph.path) if graph is not None else None)
+            key = result_cache.key(qlat, qlon, radius, topn, radii, fp, sources)
+            data = result_cache.get(key)
+        prof.info["result_cache_hit"] = data is not None
+    if data is None:
+        data = _analyze_data(qlat, qlon, radius, topn, nodes_path, polys_path, radii, engine, graph, prof)
+        if result_cache is not None:
+            with prof.stage("result_cache_put"):
+                result_cache.put(key, data)
+
+    cat_scores, overall = data["cat_scores"], data["overall"]
+    big = pd.DataFrame(data["pois"], columns=list(POI_OUT_COLS))
+
+    # harita: folium (tam HTML) ya da GeoJSON payload (statik şablon istemcide çizer)
+    map_html = map_data = None
+    if map_mode == "folium":
+        with prof.stage("map_folium"):
+            render_key = f"folium|{disp}|{lat:.6f},{lon:.6f}"
+            map_html = result_cache.get_html(key, render_key) if result_cache is not None else None
+            if map_html is None:
+                map_html = _folium_map_html(lat, lon, disp, big, cat_scores)
+                if result_cache is not None:
+                    result_cache.put_html(key, render_key, map_html)
+    elif map_mode == "geojson":
+        with prof.stage("map_geojson"):
+            map_data = map_payload(lat, lon, disp, big, cat_scores, overall, radius)
+
+    with prof.stage("format"):
+        out = _format_result(disp, lat, lon, radius, map_html, map_data, big, cat_scores, overall, data)
+    if prof.enabled:
+        out["profile"] = prof.to_dict()
+        emit("analyze", **out["profile"])
+    return out
+
+def _format_result(disp, lat, lon, radius, map_html, map_data, big, cat_scores, overall, data):
+    # tablo verileri
+    results_by_cat = {cat: [] for cat in CATS.keys()}
+    for r in big.itertuples(index=False):
+        results_by_cat[r.cat].append({
+            "name": r.name,
+            "walk_m": fmt_meters(r.walk_m),
+            "walk_s": fmt_seconds(r.walk_s),
+            "drive_m": fmt_meters(r.drive_m),
+            "drive_s": fmt_seconds(r.drive_s),
+        })
 
     cat_scores_pretty = {CATS[c]["label"]: float(f"{cat_scores.get(c,0.0):.1f}") for c in CATS.keys()}
     return {
@@ -467,9 +1992,11 @@ def analyze(address=None, lat=None, lon=None, radius=DEFAULT_RADIUS_M, topn=TOP_
         "lat": lat, "lon": lon,
         "radius": radius,
         "map_html": map_html,
+        "map": map_data,
         "scores": cat_scores_pretty,
-        "overall": float(f"{(sum(OVERALL_WEIGHTS.get(c,0.0)*cat_scores.get(c,0.0) for c in CATS.keys())):.1f}"),
+        "overall": float(f"{overall:.1f}"),
         "results": results_by_cat,
+        "nearest": data.get("nearest"),
     }
 
 
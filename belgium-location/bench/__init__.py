@@ -0,0 +1 @@
+# bench — sentetik veriyle performans ölçümü (çalıştırma: belgium-location dizininden python -m bench.run)
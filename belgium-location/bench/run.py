@@ -0,0 +1,313 @@
+# bench/run.py — sentetik veriyle uçtan uca performans ölçümü + baseline karşılaştırması
+# Kullanım (belgium-location dizininden):
+#   python -m bench.run --out bench_out/result.json [--profiles city,rural] [--save-baseline bench/baseline.json]
+#   python -m bench.run --baseline bench/baseline.json --tolerance 0.15   (gerileme varsa çıkış kodu 1)
+# Metrik adları "<profil>.<grup>.<ad>_<birim>"; birim son ekinden yön çıkarılır:
+#   *_per_s büyük olan iyi; *_ms, *_s, *_mb küçük olan iyi; diğerleri sadece bilgi (karşılaştırılmaz).
+import os, sys, json, time, shutil, argparse, platform, subprocess, runpy
+import numpy as np
+import pandas as pd
+
+def percentiles(samples_ms):
+    a = np.asarray(samples_ms, dtype=np.float64)
+    return {"p50_ms": float(np.percentile(a, 50)), "p95_ms": float(np.percentile(a, 95)),
+            "p99_ms": float(np.percentile(a, 99)), "mean_ms": float(a.mean())}
+
+def query_points(profile, n, seed=7):
+    """Profil diskinin iç kısmında (kenar etkisi olmasın diye yarıçapın %60'ı) sorgu noktaları."""
+    from bench.synth import PROFILES
+    p = PROFILES[profile]
+    rng = np.random.default_rng(seed)
+    r = 0.6 * p["radius_km"] * 1000.0 * np.sqrt(rng.random(n))
+    th = rng.random(n) * 2 * np.pi
+    lat = p["lat"] + r * np.cos(th) / 111320.0
+    lon = p["lon"] + r * np.sin(th) / (111320.0 * np.cos(np.radians(p["lat"])))
+    return lat, lon
+
+# --- builder'lar alt süreçte: tepe RSS ölçümü diğer aşamalardan etkilenmesin ---
+
+CHILD_TAG = "[BENCH-JSON]"
+
+def child_main(module, argv):
+    """Alt süreç: modülü __main__ olarak çalıştırır, süre + tepe RSS'i tek JSON satırında basar."""
+    from poi_cache_utils import peak_rss_mb
+    sys.argv = [module + ".py"] + argv
+    t0 = time.perf_counter()
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+    print(CHILD_TAG + " " + json.dumps({"elapsed_s": time.perf_counter() - t0, "peak_rss_mb": peak_rss_mb()}))
+
+def run_builder(module, argv, log):
+    cmd = [sys.executable, "-m", "bench.run", "--child", module, "--"] + argv
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    with open(log, "w", encoding="utf-8") as f:
+        f.write(proc.stdout + proc.stderr)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{module} başarısız (çıkış {proc.returncode}); log: {log}")
+    for line in proc.stdout.splitlines()[::-1]:
+        if line.startswith(CHILD_TAG):
+            return json.loads(line[len(CHILD_TAG):])
+    return {"elapsed_s": time.perf_counter() - t0, "peak_rss_mb": None}
+
+def parquet_rows(path):
+    import pyarrow.parquet as pq
+    return pq.ParquetFile(path).metadata.num_rows
+
+def bench_builds(profile, pbf, work, metrics, roads):
+    """PBF → node/polygon cache (ve yol ağı + en yakın POI tabloları); satır/s ve tepe RSS."""
+    pre = f"{profile}.build"
+    out = {}
+    for name, module in (("nodes", "build_poi_cache"), ("polys", "build_poi_poly_cache_osmium")):
+        path = os.path.join(work, f"built_{name}.parquet")
+        r = run_builder(module, ["--pbf", pbf, "--out", path], os.path.join(work, f"build_{name}.log"))
+        rows = parquet_rows(path)
+        metrics[f"{pre}.{name}.elapsed_s"] = r["elapsed_s"]
+        metrics[f"{pre}.{name}.rows"] = rows
+        metrics[f"{pre}.{name}.rows_per_s"] = rows / max(r["elapsed_s"], 1e-9)
+        if r["peak_rss_mb"] is not None:
+            metrics[f"{pre}.{name}.peak_rss_mb"] = r["peak_rss_mb"]
+        out[name] = path
+    if roads:
+        graph = os.path.join(work, "roads")
+        r = run_builder("build_road_graph", ["--pbf", pbf, "--out", graph], os.path.join(work, "build_roads.log"))
+        with open(os.path.join(graph, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        metrics[f"{pre}.roads.elapsed_s"] = r["elapsed_s"]
+        metrics[f"{pre}.roads.nodes_per_s"] = meta["n_nodes"] / max(r["elapsed_s"], 1e-9)
+        if r["peak_rss_mb"] is not None:
+            metrics[f"{pre}.roads.peak_rss_mb"] = r["peak_rss_mb"]
+        r = run_builder("build_nearest_poi", ["--graph", graph, "--nodes", out["nodes"], "--polys", out["polys"]],
+                        os.path.join(work, "build_near.log"))
+        metrics[f"{pre}.near.elapsed_s"] = r["elapsed_s"]
+        if r["peak_rss_mb"] is not None:
+            metrics[f"{pre}.near.peak_rss_mb"] = r["peak_rss_mb"]
+        out["roads"] = graph
+    return out
+
+# --- sorgu tarafı ---
+
+def bench_latency(profile, nodes, polys, metrics, n_cold, n_warm, n_batch, graph=None):
+    import app_duckdb as app
+    pre = f"{profile}.latency"
+    lat, lon = query_points(profile, max(n_cold, n_warm, n_batch))
+
+    # cold: motor yok → her çağrı Parquet'i baştan tarar (CLI yolu)
+    samples = []
+    for i in range(n_cold):
+        t0 = time.perf_counter()
+        app.analyze(lat=float(lat[i]), lon=float(lon[i]), nodes_path=nodes, polys_path=polys,
+                    map_mode="none", road_graph=None)
+        samples.append((time.perf_counter() - t0) * 1000)
+    for k, v in percentiles(samples).items():
+        metrics[f"{pre}.cold.{k}"] = v
+
+    # warm: uzun ömürlü PoiEngine (servis yolu); yükleme ayrı ölçülür
+    t0 = time.perf_counter()
+    engine = app.PoiEngine(nodes, polys)
+    metrics[f"{pre}.warm.load_s"] = time.perf_counter() - t0
+    samples = []
+    for i in range(n_warm):
+        t0 = time.perf_counter()
+        app.analyze(lat=float(lat[i]), lon=float(lon[i]), engine=engine, map_mode="none", road_graph=None)
+        samples.append((time.perf_counter() - t0) * 1000)
+    for k, v in percentiles(samples).items():
+        metrics[f"{pre}.warm.{k}"] = v
+
+    # warm + folium HTML üretimi (eski tam sayfa yolu)
+    samples = []
+    for i in range(min(n_warm, 20)):
+        t0 = time.perf_counter()
+        app.analyze(lat=float(lat[i]), lon=float(lon[i]), engine=engine, map_mode="folium", road_graph=None)
+        samples.append((time.perf_counter() - t0) * 1000)
+    metrics[f"{pre}.warm_folium.p50_ms"] = percentiles(samples)["p50_ms"]
+
+    if graph:
+        g = app.get_road_graph(graph)
+        samples = []
+        for i in range(n_warm):
+            t0 = time.perf_counter()
+            app.analyze(lat=float(lat[i]), lon=float(lon[i]), engine=engine, map_mode="none", road_graph=g)
+            samples.append((time.perf_counter() - t0) * 1000)
+        for k, v in percentiles(samples).items():
+            metrics[f"{pre}.warm_routed.{k}"] = v
+
+    # toplu mod: tek spatial join
+    pts = pd.DataFrame({"lat": lat[:n_batch], "lon": lon[:n_batch]})
+    res = app.analyze_batch(pts, engine=engine)
+    metrics[f"{profile}.batch.points"] = n_batch
+    metrics[f"{profile}.batch.points_per_s"] = res["points_per_s"]
+
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app_duckdb.py")
+
+def _cli_output(stdout):
+    # süre içeren satırlar hariç CLI çıktısı (iki modun sonuç eşitliği için)
+    return [ln for ln in stdout.splitlines() if " ms" not in ln and "Harita kaydedildi" not in ln]
+
+def bench_cli(profile, nodes, polys, work, metrics, n):
+    """
+    Uçtan uca çağrı başına gecikme: her seferinde yeni süreç olarak tek seferlik CLI ile, aynı CLI'nin
+    --client modu (+ arka planda --daemon) yan yana. Çıktıların aynı olduğu da kontrol edilir.
+    """
+    from poi_daemon import wait_ready, request
+    pre = f"{profile}.cli"
+    lat, lon = query_points(profile, n, seed=11)
+    sock = os.path.join(work, "bench.sock")
+    base = [sys.executable, APP_SCRIPT, "--nodes", os.path.abspath(nodes), "--polys", os.path.abspath(polys),
+            "--circuity"]
+    log = open(os.path.join(work, "daemon.log"), "w", encoding="utf-8")
+    daemon = subprocess.Popen(base + ["--daemon", "--socket", sock], cwd=work, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not wait_ready(sock):
+            raise RuntimeError(f"daemon başlamadı; log: {log.name}")
+        samples = {"oneshot": [], "client": []}
+        same = True
+        for i in range(n):
+            q = ["--lat", f"{lat[i]:.6f}", "--lon", f"{lon[i]:.6f}"]
+            outs = {}
+            for mode, extra in (("oneshot", []), ("client", ["--client", "--socket", sock])):
+                t0 = time.perf_counter()
+                proc = subprocess.run(base + q + extra, cwd=work, capture_output=True, text=True)
+                samples[mode].append((time.perf_counter() - t0) * 1000)
+                if proc.returncode != 0:
+                    raise RuntimeError(f"CLI ({mode}) başarısız: {proc.stderr[-500:]}")
+                outs[mode] = _cli_output(proc.stdout)
+            same = same and outs["oneshot"] == outs["client"]
+        for mode, sm in samples.items():
+            for k, v in percentiles(sm).items():
+                metrics[f"{pre}.{mode}.{k}"] = v
+        metrics[f"{pre}.identical"] = int(same)
+        print(f"[CLI] {profile}: tek seferlik p50={metrics[f'{pre}.oneshot.p50_ms']:.0f} ms  "
+              f"istemci p50={metrics[f'{pre}.client.p50_ms']:.0f} ms  çıktı aynı={same}")
+    finally:
+        try:
+            request(sock, {"op": "shutdown"}, timeout=5.0)
+        except OSError:
+            pass
+        try:
+            daemon.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            daemon.kill()
+        log.close()
+
+def bench_scoring(metrics, n=200_000):
+    import app_duckdb as app
+    rng = np.random.default_rng(3)
+    n_total = rng.integers(0, 60, n)
+    d_min = rng.random(n) * 3000
+    for cat in app.CATS:
+        t0 = time.perf_counter()
+        for a, b in zip(n_total[:20_000].tolist(), d_min[:20_000].tolist()):
+            app.calc_category_score(cat, a, b)
+        metrics[f"scoring.{cat}.scalar_calls_per_s"] = 20_000 / (time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        app.calc_category_score_vec(cat, pd.Series(n_total), pd.Series(d_min), pd.Series(np.zeros(n, bool)))
+        metrics[f"scoring.{cat}.vec_cells_per_s"] = n / (time.perf_counter() - t0)
+
+# --- baseline ---
+
+def direction(name):
+    if name.endswith("_per_s"):
+        return 1
+    if name.endswith(("_ms", "_s", "_mb")):
+        return -1
+    return 0
+
+def compare(metrics, baseline, tolerance):
+    """Baseline'a göre gerileyen metrikler: [(ad, eski, yeni, oran)]; oran > 1 her zaman 'daha kötü'."""
+    bad = []
+    for name, old in baseline.items():
+        new, d = metrics.get(name), direction(name)
+        if new is None or d == 0 or not old:
+            continue
+        ratio = (old / new if new else float("inf")) if d > 0 else new / old
+        flag = "GERİLEME" if ratio > 1 + tolerance else ("iyileşme" if ratio < 1 - tolerance else "")
+        print(f"[CMP] {name:<48} {old:>12.3f} → {new:>12.3f}  x{ratio:.2f} {flag}")
+        if flag == "GERİLEME":
+            bad.append((name, old, new, ratio))
+    return bad
+
+def machine_meta(args):
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = None
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": rev or None, "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count(), "profiles": args.profiles,
+            "scale": args.scale, "seed": args.seed}
+
+def main():
+    if "--child" in sys.argv:
+        i = sys.argv.index("--child")
+        module, rest = sys.argv[i + 1], sys.argv[i + 2:]
+        return child_main(module, rest[1:] if rest[:1] == ["--"] else rest)
+
+    ap = argparse.ArgumentParser(description="Sentetik cache/PBF ile gecikme, verim, build hızı ve bellek ölçümü")
+    ap.add_argument("--profiles", default="city,rural", help="Virgülle: city, rural")
+    ap.add_argument("--scale", type=float, default=1.0, help="POI sayısı çarpanı (profil yoğunluğuna göre)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--work", default="./bench_out/work", help="Sentetik veri dizini (her koşuda silinir)")
+    ap.add_argument("--out", default="./bench_out/result.json", help="Makine okunur sonuç (JSON)")
+    ap.add_argument("--cold", type=int, default=20, help="Cold sorgu sayısı")
+    ap.add_argument("--warm", type=int, default=200, help="Warm sorgu sayısı")
+    ap.add_argument("--batch", type=int, default=5_000, help="Toplu mod nokta sayısı")
+    ap.add_argument("--cli", type=int, default=10,
+                    help="Tek seferlik CLI vs --client (daemon) çağrı sayısı (0: atla)")
+    ap.add_argument("--no-build", action="store_true", help="PBF + builder ölçümlerini atla (osmium gerekmez)")
+    ap.add_argument("--no-roads", action="store_true", help="Yol ağı build'i ve rotalı gecikmeyi atla")
+    ap.add_argument("--baseline", help="Karşılaştırılacak önceki sonuç (JSON)")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="Gerileme eşiği (0.15 = %%15)")
+    ap.add_argument("--save-baseline", help="Bu koşuyu baseline olarak da yaz")
+    args = ap.parse_args()
+
+    from bench import synth
+    metrics = {}
+    t_all = time.perf_counter()
+    for profile in args.profiles.split(","):
+        work = os.path.join(args.work, profile)
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work)
+        n = int(synth.default_count(profile) * args.scale)
+
+        t0 = time.perf_counter()
+        nodes = os.path.join(work, "synth_nodes.parquet")
+        polys = os.path.join(work, "synth_polys.parquet")
+        rows = synth.synth_nodes(nodes, n, profile, seed=args.seed)
+        rows += synth.synth_polys(polys, n // 5, profile, seed=args.seed + 1)
+        print(f"[SYNTH] {profile}: {rows:,} satır  time={time.perf_counter()-t0:.1f}s")
+        metrics[f"{profile}.synth.rows"] = rows
+
+        graph = None
+        if not args.no_build:
+            pbf = os.path.join(work, "synth.osm.pbf")
+            counts = synth.synth_pbf(pbf, n, n // 5, profile, roads=not args.no_roads, seed=args.seed + 2)
+            print(f"[PBF] {profile}: " + "  ".join(f"{k}={v:,}" for k, v in counts.items()) +
+                  f"  file={os.path.getsize(pbf)/1e6:.1f} MB")
+            built = bench_builds(profile, pbf, work, metrics, roads=not args.no_roads)
+            graph = built.get("roads")
+
+        bench_latency(profile, nodes, polys, metrics, args.cold, args.warm, args.batch, graph=graph)
+        if args.cli:
+            bench_cli(profile, nodes, polys, work, metrics, args.cli)
+        print(f"[PROFILE] {profile}: warm p50={metrics[f'{profile}.latency.warm.p50_ms']:.1f} ms  "
+              f"p99={metrics[f'{profile}.latency.warm.p99_ms']:.1f} ms  "
+              f"batch={metrics[f'{profile}.batch.points_per_s']:,.0f} nokta/s")
+    bench_scoring(metrics)
+
+    result = {"meta": machine_meta(args), "metrics": metrics}
+    for path in filter(None, (args.out, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1, sort_keys=True)
+    print(f"[DONE] {len(metrics)} metrik → {args.out}  time={time.perf_counter()-t_all:.1f}s")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            base = json.load(f)
+        bad = compare(metrics, base["metrics"], args.tolerance)
+        if bad:
+            print(f"[FAIL] {len(bad)} metrik baseline'a göre %{args.tolerance*100:.0f}'ten fazla geriledi")
+            sys.exit(1)
+        print("[OK] gerileme yok")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# bench/synth.py — sentetik POI cache'leri (builder SCHEMA'larıyla) ve küçük .osm.pbf dosyaları
+# Cache'ler builder'ların kendi append_node/append_area + finalize_cache yolundan geçer: aynı şema,
+# aynı sıralama, aynı tile manifest'i.
+import os, math
+import numpy as np
+import pyarrow.parquet as pq
+import build_poi_cache as nodes_mod
+import build_poi_poly_cache_osmium as polys_mod
+from poi_rank import rank_config_hash, rank_columns_sql
+from poi_cache_utils import batch_table, with_sort_key, final_schema, with_rank_columns, raw_path_for, finalize_cache
+
+# yoğunluk profilleri: merkez, yarıçap (km), km² başına POI
+PROFILES = {
+    "city":  {"lat": 50.8466, "lon": 4.3528, "radius_km": 6.0,  "per_km2": 450.0, "road_m": 150.0},
+    "rural": {"lat": 50.2500, "lon": 5.3500, "radius_km": 20.0, "per_km2": 6.0,   "road_m": 600.0},
+}
+
+# categorize() ile gerçek kategorilere düşen örnek etiketler
+NODE_TAGS = [
+    {"amenity": "school"}, {"amenity": "kindergarten"}, {"shop": "supermarket"}, {"shop": "convenience"},
+    {"amenity": "pharmacy"}, {"amenity": "doctors"}, {"healthcare": "dentist"}, {"amenity": "hospital"},
+    {"highway": "bus_stop"}, {"railway": "tram_stop"}, {"railway": "station"},
+    {"leisure": "playground"}, {"leisure": "fitness_centre"}, {"sport": "soccer"},
+]
+AREA_TAGS = [
+    {"leisure": "park"}, {"leisure": "garden"}, {"landuse": "grass"}, {"amenity": "school"},
+    {"leisure": "sports_centre"}, {"amenity": "hospital"}, {"shop": "supermarket"},
+]
+AREA_SIDE_M = 60.0
+
+def default_count(profile):
+    p = PROFILES[profile]
+    return int(math.pi * p["radius_km"] ** 2 * p["per_km2"])
+
+def profile_points(profile, n, rng):
+    """Profil diskinde düzgün dağılımlı n nokta (lat, lon)."""
+    p = PROFILES[profile]
+    r = p["radius_km"] * 1000.0 * np.sqrt(rng.random(n))
+    th = rng.random(n) * 2 * math.pi
+    lat = p["lat"] + r * np.cos(th) / 111320.0
+    lon = p["lon"] + r * np.sin(th) / (111320.0 * math.cos(math.radians(p["lat"])))
+    return lat, lon
+
+def synth_nodes(out, n=None, profile="city", seed=0, int_coords=False):
+    """build_poi_cache.py çıktısıyla aynı şemada node cache; dönüş: satır sayısı."""
+    rng = np.random.default_rng(seed)
+    n = n or default_count(profile)
+    lat, lon = profile_points(profile, n, rng)
+    kinds = rng.integers(0, len(NODE_TAGS), n)
+    b = nodes_mod.new_batch()
+    for i in range(n):
+        nodes_mod.append_node(b, i + 1, float(lat[i]), float(lon[i]), dict(NODE_TAGS[kinds[i]], name=f"POI {i}"))
+    return _finalize(b, out, nodes_mod.SCHEMA, nodes_mod.ORDER_BY, int_coords)
+
+def synth_polys(out, n=None, profile="city", seed=1, int_coords=False):
+    """build_poi_poly_cache_osmium.py çıktısıyla aynı şemada polygon cache; dönüş: satır sayısı."""
+    rng = np.random.default_rng(seed)
+    n = n or default_count(profile) // 5
+    lat, lon = profile_points(profile, n, rng)
+    kinds = rng.integers(0, len(AREA_TAGS), n)
+    b = polys_mod.new_batch()
+    for i in range(n):
+        polys_mod.append_area(b, "w", i + 1, float(lat[i]), float(lon[i]), dict(AREA_TAGS[kinds[i]], name=f"Area {i}"))
+    return _finalize(b, out, polys_mod.SCHEMA, polys_mod.ORDER_BY, int_coords)
+
+def _finalize(b, out, schema, order_by, int_coords):
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    raw = raw_path_for(out)
+    pq.write_table(batch_table(b, with_sort_key(schema)), raw, compression="zstd")
+    out_schema = with_rank_columns(final_schema(schema, int_coords), rank_config_hash())
+    return finalize_cache(raw, out, out_schema, order_by=order_by, derived_sql=rank_columns_sql())
+
+def synth_pbf(out, n_pois=None, n_areas=None, profile="city", filler=10, roads=True, seed=2):
+    """
+    pyosmium SimpleWriter ile küçük bir .osm.pbf: etiketli POI node'ları, etiketsiz dolgu node'ları
+    (POI başına `filler` adet; native filtrenin elediği gerçek PBF oranını taklit eder), kare area way'leri
+    ve (roads=True) profil üzerinde ızgara şeklinde highway way'leri.
+    Dönüş: {"nodes", "ways", "poi_nodes", "areas", "roads"} sayıları.
+    """
+    import osmium as osm  # sadece PBF üretirken gerekli
+    rng = np.random.default_rng(seed)
+    p = PROFILES[profile]
+    n_pois = n_pois or default_count(profile)
+    n_areas = n_areas if n_areas is not None else n_pois // 5
+    coslat = math.cos(math.radians(p["lat"]))
+    if os.path.exists(out):
+        os.remove(out)
+    w = osm.SimpleWriter(out)
+    counts = {"nodes": 0, "ways": 0, "poi_nodes": n_pois, "areas": n_areas, "roads": 0}
+    nid = 0
+    ways = []
+    try:
+        lat, lon = profile_points(profile, n_pois * (1 + filler), rng)
+        kinds = rng.integers(0, len(NODE_TAGS), n_pois)
+        for i in range(len(lat)):
+            nid += 1
+            tags = dict(NODE_TAGS[kinds[i]], name=f"POI {i}") if i < n_pois else {}
+            w.add_node(osm.osm.mutable.Node(id=nid, location=(float(lon[i]), float(lat[i])), tags=tags))
+        # area'lar: 4 köşe node + kapalı way
+        alat, alon = profile_points(profile, n_areas, rng)
+        akinds = rng.integers(0, len(AREA_TAGS), n_areas)
+        dlat, dlon = AREA_SIDE_M / 111320.0, AREA_SIDE_M / (111320.0 * coslat)
+        for i in range(n_areas):
+            ids = []
+            for a, o in ((0, 0), (dlat, 0), (dlat, dlon), (0, dlon)):
+                nid += 1
+                w.add_node(osm.osm.mutable.Node(id=nid, location=(float(alon[i] + o), float(alat[i] + a))))
+                ids.append(nid)
+            ways.append((ids + ids[:1], dict(AREA_TAGS[akinds[i]], name=f"Area {i}")))
+        if roads:
+            # kare ızgara: satır/sütun başına bir highway way (kesişimler ortak node)
+            step = p["road_m"]
+            k = int(2 * p["radius_km"] * 1000.0 / step) + 1
+            lat0 = p["lat"] - p["radius_km"] * 1000.0 / 111320.0
+            lon0 = p["lon"] - p["radius_km"] * 1000.0 / (111320.0 * coslat)
+            grid = np.empty((k, k), np.int64)
+            for r in range(k):
+                for c in range(k):
+                    nid += 1
+                    grid[r, c] = nid
+                    w.add_node(osm.osm.mutable.Node(id=nid, location=(lon0 + c * step / (111320.0 * coslat),
+                                                                  lat0 + r * step / 111320.0)))
+            hw = ["residential", "residential", "tertiary", "secondary", "footway"]
+            for r in range(k):
+                ways.append((grid[r].tolist(), {"highway": hw[r % len(hw)]}))
+            for c in range(k):
+                ways.append((grid[:, c].tolist(), {"highway": hw[c % len(hw)]}))
+            counts["roads"] = 2 * k
+        for i, (refs, tags) in enumerate(ways, 1):
+            w.add_way(osm.osm.mutable.Way(id=i, nodes=refs, tags=tags))
+    finally:
+        w.close()
+    counts["nodes"], counts["ways"] = nid, len(ways)
+    return counts
@@ -0,0 +1,117 @@
+# build_address_index.py — PBF'teki addr:* etiketlerinden çevrimdışı adres indeksi (osmium + shapely)
+# Çıktı: cache/be_addr.parquet → normalize "sokak|no|posta kodu" (ve "sokak|no|şehir") anahtarına göre sıralı
+import os, time, argparse
+import pyarrow as pa
+import pyarrow.parquet as pq
+import osmium as osm
+from shapely import wkb
+from geocode_cache import address_keys, key_hash
+from poi_cache_utils import (sql_str, raw_path_for, add_low_memory_args, location_index, remove_location_index,
+                             duckdb_connect, rss_report, peak_rss_mb)
+from profiling import emit, add_metrics_args, install_sinks
+
+SCHEMA = pa.schema([
+    ("key_hash", pa.int64()), ("key", pa.string()),
+    ("lat", pa.float64()), ("lon", pa.float64()),
+    ("display", pa.string()), ("src", pa.string()),
+])
+
+class AddressHandler(osm.SimpleHandler):
+    """addr:housenumber taşıyan node'lar (nokta) ve alanlar (bina centroid'i)."""
+    def __init__(self, writer, batch_size=100_000):
+        super().__init__()
+        self.writer = writer
+        self.batch = {f.name: [] for f in SCHEMA}
+        self.batch_size = batch_size
+        self.count_in = 0
+        self.count_out = 0
+        self.wkbf = osm.geom.WKBFactory()
+
+    def _add(self, tags, lat, lon, src):
+        street = tags.get("addr:street") or tags.get("addr:place")
+        num, pc, city = tags.get("addr:housenumber"), tags.get("addr:postcode"), tags.get("addr:city")
+        keys = address_keys(street, num, pc, city)
+        if not keys:
+            return
+        display = f"{street} {num}, {' '.join(x for x in (pc, city) if x)}".strip(", ")
+        for k in keys:
+            b = self.batch
+            b["key_hash"].append(key_hash(k)); b["key"].append(k)
+            b["lat"].append(lat); b["lon"].append(lon)
+            b["display"].append(display); b["src"].append(src)
+            self.count_out += 1
+        if len(self.batch["key"]) >= self.batch_size:
+            self.flush()
+
+    def node(self, n):
+        self.count_in += 1
+        if n.location.valid():
+            self._add(n.tags, float(n.location.lat), float(n.location.lon), "node")
+
+    def area(self, a):
+        self.count_in += 1
+        try:
+            try:
+                g_wkb = self.wkbf.create_multipolygon(a)
+            except Exception:
+                g_wkb = self.wkbf.create_polygon(a)
+            c = wkb.loads(g_wkb).centroid
+        except Exception:
+            return
+        self._add(a.tags, float(c.y), float(c.x), "area")
+
+    def flush(self):
+        if not self.batch["key"]:
+            return
+        self.writer.write_table(pa.table(self.batch, schema=SCHEMA))
+        for v in self.batch.values():
+            v.clear()
+
+def main():
+    ap = argparse.ArgumentParser(description="Belgium PBF -> çevrimdışı adres indeksi (addr:* etiketleri).")
+    ap.add_argument("--pbf", required=True, help="belgium-latest.osm.pbf yolu")
+    ap.add_argument("--out", default="cache/be_addr.parquet", help="Parquet çıktı")
+    add_low_memory_args(ap)
+    add_metrics_args(ap)
+    args = ap.parse_args()
+    install_sinks(args)
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    print("[INFO] PBF okunuyor (adresler)…")
+    t0 = time.time()
+    raw = raw_path_for(args.out)
+    writer = pq.ParquetWriter(raw, SCHEMA, compression="zstd")
+    idx = location_index(args)
+    try:
+        h = AddressHandler(writer)
+        # sadece addr:housenumber taşıyan nesneler Python'a gelir (C++ tarafı filtre)
+        h.apply_file(args.pbf, locations=True, idx=idx, filters=[osm.filter.KeyFilter("addr:housenumber")])
+        h.flush()
+    finally:
+        writer.close()
+        remove_location_index(idx)
+
+    # anahtar başına tek kayıt (node > alan), key_hash sırasına göre → ikili arama
+    con = duckdb_connect(args.memory_limit if args.low_memory else None, spill_dir=args.out + ".duckdb_tmp")
+    con.execute(f"""
+    COPY (
+      SELECT * EXCLUDE (rn) FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY key ORDER BY src DESC, lat, lon) AS rn
+        FROM read_parquet({sql_str(raw)})
+      ) WHERE rn = 1
+      ORDER BY key_hash
+    ) TO {sql_str(args.out)} (FORMAT PARQUET, COMPRESSION ZSTD)
+    """)
+    n = con.execute(f"SELECT COUNT(*) FROM read_parquet({sql_str(args.out)})").fetchone()[0]
+    con.close()
+    os.remove(raw)
+
+    size_mb = os.path.getsize(args.out)/1e6
+    print(f"[DONE] objects~{h.count_in:,}  keys={h.count_out:,}  unique_keys={n:,}  file={size_mb:.1f} MB  time={(time.time()-t0)/60:.1f} dk  "
+          f"{rss_report()}")
+    dt = time.time() - t0
+    emit("done", builder="address_index", elapsed_s=round(dt, 3), read=h.count_in, keys=h.count_out, unique_keys=n,
+         read_per_s=round(h.count_in / max(dt, 1e-9), 1), file_mb=round(size_mb, 2), peak_rss_mb=peak_rss_mb())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# build_nearest_poi.py — yol ağındaki her düğüm için kategori başına en yakın POI'ye ağ mesafesi/süresi
+# Girdi: build_road_graph.py dizini + node/polygon POI cache'leri
+# Çıktı (aynı dizine): near_<mod>_<kategori>_{dist,time,poi}.npy + near_pois.parquet + near_meta.json
+import os, json, time, argparse
+from multiprocessing import Pool
+import numpy as np
+import pyarrow.parquet as pq
+import duckdb
+import app_duckdb as app
+from road_graph import (RoadGraph, ROAD_GRAPH, MODES, NEAR_META, NEAR_POIS, NEAR_PARTS, near_file,
+                        reverse_csr, multi_source_dijkstra)
+from poi_cache_utils import sql_str, has_int_coords, COORD_SCALE, rss_report, peak_rss_mb
+from profiling import emit, add_metrics_args, install_sinks
+
+def _ref_sql(path, kind):
+    # POI kimliği: node → n<id>; alan → w<id> / r<id> (eski cache'lerde uid)
+    if kind == "nodes":
+        return "'n' || CAST(id AS VARCHAR)"
+    if "osm_id" in pq.read_schema(path).names:
+        return "CAST(osm_type AS VARCHAR) || CAST(osm_id AS VARCHAR)"
+    return "CAST(uid AS VARCHAR)"
+
+def _latlon_sql(path):
+    if has_int_coords(pq.read_schema(path)):
+        return f"CAST(lat AS DOUBLE) / {COORD_SCALE} AS lat, CAST(lon AS DOUBLE) / {COORD_SCALE} AS lon"
+    return "CAST(lat AS DOUBLE) AS lat, CAST(lon AS DOUBLE) AS lon"
+
+def load_pois(nodes_path, polys_path):
+    """Tüm kategorilerin POI tablosu (cat sırasıyla); satır numarası = near_*_poi değerleri."""
+    parts = []
+    for path, kind in ((nodes_path, "nodes"), (polys_path, "polys")):
+        if path:
+            parts.append(f"SELECT CAST(cat AS VARCHAR) AS cat, {_ref_sql(path, kind)} AS ref, "
+                         f"CAST(name AS VARCHAR) AS name, {_latlon_sql(path)} "
+                         f"FROM read_parquet({sql_str(path)})")
+    return duckdb.connect().execute(
+        f"SELECT * FROM ({' UNION ALL '.join(parts)}) ORDER BY cat, ref").arrow()
+
+def near_job(job):
+    """(mod, kategori) → tüm düğümler için çok kaynaklı Dijkstra; dosyaları yazar, istatistik döner."""
+    graph_path, mode, cat, idx, lat, lon, max_m, access_mps = job
+    t0 = time.time()
+    g = RoadGraph(graph_path)
+    sources = []
+    for i, la, lo in zip(idx.tolist(), lat.tolist(), lon.tolist()):
+        node, d = g.nearest(mode, la, lo)
+        if node is not None:
+            sources.append((node, d, d / access_mps, i))
+    csr = g.csr[mode]
+    if mode == "drive":
+        # düğüm → POI yönü: POI'lerden ters kenarlar üzerinde arama
+        csr = reverse_csr(*csr)
+    res = multi_source_dijkstra(csr, sources, max_m)
+    for part, arr in zip(NEAR_PARTS, res):
+        np.save(near_file(graph_path, mode, cat, part), arr)
+    reached = int((res[2] >= 0).sum())
+    return mode, cat, len(sources), reached, time.time() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description="Yol ağı + POI cache'leri -> düğüm başına en yakın POI (ağ mesafesi/süresi)")
+    ap.add_argument("--graph", default=ROAD_GRAPH, help="build_road_graph.py çıktı dizini")
+    ap.add_argument("--nodes", default="cache/be_poi.parquet")
+    ap.add_argument("--polys", default="cache/be_poi_poly.parquet")
+    ap.add_argument("--merged", default=app.MERGED_CACHE, help="build_poi_merged.py çıktısı ('' ile kapalı)")
+    ap.add_argument("--max-m", type=float,
+                    default=max([app.DEFAULT_RADIUS_M] + [c["D0"] for c in app.SCORING.values()]) * app.ROUTE_BOUND_FACTOR,
+                    help="Arama sınırı (ağ mesafesi, m); ötesindeki düğümler 'POI yok' sayılır")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Paralel işçi (iş = kategori x mod)")
+    add_metrics_args(ap)
+    args = ap.parse_args()
+    install_sinks(args)
+
+    nodes = args.nodes if os.path.exists(args.nodes) else None
+    polys = args.polys if os.path.exists(args.polys) else None
+    if not nodes and not polys:
+        raise SystemExit("Ne node ne polygon cache bulundu.")
+    nodes, polys = app.resolve_sources(nodes, polys, args.merged)
+    t0 = time.time()
+    pois = load_pois(nodes, polys)
+    pq.write_table(pois, os.path.join(args.graph, NEAR_POIS), compression="zstd")
+    cat_col = np.asarray(pois["cat"].to_pylist())
+    lat, lon = pois["lat"].to_numpy(), pois["lon"].to_numpy()
+    print(f"[POI] {pois.num_rows:,} nokta  time={time.time()-t0:.1f}s")
+
+    access = {"walk": app.WALK_SPEED_KPH / 3.6, "drive": app.DRIVE_ACCESS_KPH / 3.6}
+    jobs = []
+    for cat in app.CATS:
+        idx = np.flatnonzero(cat_col == cat)
+        for mode in MODES:
+            jobs.append((args.graph, mode, cat, idx, lat[idx], lon[idx], args.max_m, access[mode]))
+    print(f"[JOBS] {len(jobs)} (kategori x mod)  işçi={args.workers}  sınır={args.max_m:,.0f} m")
+
+    tables = {}
+    with Pool(min(args.workers, len(jobs))) as pool:
+        for mode, cat, n_src, reached, dt in pool.imap_unordered(near_job, jobs):
+            tables[f"{mode}_{cat}"] = {"sources": n_src, "reached": reached}
+            print(f"[NEAR] {mode:<5} {cat:<8} kaynak={n_src:,}  ulaşılan düğüm={reached:,}  time={dt:.1f}s")
+            emit("progress", builder="nearest_poi", mode=mode, cat=cat, sources=n_src, reached=reached,
+                 elapsed_s=round(dt, 3))
+
+    meta = {"tables": tables, "max_m": args.max_m, "built_at": time.time(),
+            "sources": app.files_signature([os.path.abspath(p) for p in (nodes, polys) if p])}
+    with open(os.path.join(args.graph, NEAR_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=1)
+    print(f"[DONE] {len(tables)} tablo  time={(time.time()-t0)/60:.1f} dk  {rss_report()}")
+    emit("done", builder="nearest_poi", elapsed_s=round(time.time() - t0, 3), tables=len(tables),
+         peak_rss_mb=peak_rss_mb())
+
+if __name__ == "__main__":
+    main()
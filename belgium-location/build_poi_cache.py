@@ -1,9 +1,14 @@
 # build_poi_cache.py — ÜLKE GENELİ ÖN-İŞLEME (osmium + sık flush + progress)
 import os, argparse, time
+from multiprocessing import Pool
 import pyarrow as pa
 import pyarrow.parquet as pq
-import pandas as pd
 import osmium as osm  # Python Osmium
+from profiling import emit, RateMeter, add_metrics_args, install_sinks
+from poi_rank import rank_config_hash, rank_columns_sql
+from poi_cache_utils import (batch_table, final_schema, with_rank_columns, DICT_STR, with_sort_key, raw_path_for, part_path_for, finalize_cache,
+                             pbf_blocks, pbf_shard_bytes, native_key_filters, filter_report, add_region_args, build_regions, node_keys,
+                             add_low_memory_args, rss_report, peak_rss_mb, emit_progress, ROW_GROUP_SIZE)
 
 AMENITY_OK = {"school","college","kindergarten","marketplace","hospital","clinic","doctors","pharmacy","dentist","bus_station","gym"}
 SHOP_OK = {"supermarket","convenience"}
@@ -36,35 +41,60 @@ def categorize(tags):
     return out
 
 SCHEMA = pa.schema([
-    ("id", pa.int64()), ("cat", pa.string()), ("name", pa.string()),
+    ("id", pa.int64()), ("cat", DICT_STR), ("name", pa.string()), ("brand", DICT_STR),
     ("lat", pa.float64()), ("lon", pa.float64()),
-    ("amenity", pa.string()), ("shop", pa.string()), ("healthcare", pa.string()),
-    ("railway", pa.string()), ("highway", pa.string()), ("public_transport", pa.string()),
-    ("leisure", pa.string()), ("boundary", pa.string()), ("landuse", pa.string()),
-    ("sport", pa.string()), ("school_level", pa.string()), ("isced_level", pa.string()),
+    ("amenity", DICT_STR), ("shop", DICT_STR), ("healthcare", DICT_STR),
+    ("railway", DICT_STR), ("highway", DICT_STR), ("public_transport", DICT_STR),
+    ("leisure", DICT_STR), ("boundary", DICT_STR), ("landuse", DICT_STR),
+    ("sport", DICT_STR), ("school_level", DICT_STR), ("isced_level", DICT_STR),
+    ("tile", pa.int64()),
 ])
+BATCH_COLS = [f.name for f in SCHEMA if f.name != "tile"]
+
+def new_batch():
+    return {c: [] for c in BATCH_COLS}
+
+def append_node(b, osm_id, lat, lon, t, cats=None):
+    """Node'u kolon listelerine ekler (kategori başına bir satır; tile/hkey flush'ta). Dönüş: satır sayısı."""
+    cats = categorize(t) if cats is None else cats
+    vals = {
+        "id": osm_id, "name": t.get("name") or t.get("ref") or None, "brand": t.get("brand"), "lat": lat, "lon": lon,
+        "amenity": t.get("amenity"), "shop": t.get("shop"), "healthcare": t.get("healthcare"),
+        "railway": t.get("railway"), "highway": t.get("highway"), "public_transport": t.get("public_transport"),
+        "leisure": t.get("leisure"), "boundary": t.get("boundary"), "landuse": t.get("landuse"),
+        "sport": t.get("sport"), "school_level": t.get("school:level"), "isced_level": t.get("isced:level"),
+    }
+    k = len(cats)
+    for col, v in vals.items():
+        b[col].extend([v] * k)
+    b["cat"].extend(cats)
+    return k
 
 class POIHandler(osm.SimpleHandler):
     def __init__(self, writer, out_path, batch_size=50_000, progress_every=250_000):
         super().__init__()
         self.writer = writer
+        self.schema = writer.schema
         self.out_path = out_path
-        self.batch = []
+        self.batch = new_batch()  # kolon başına bir liste (satır dict'i yok)
         self.batch_size = batch_size
         self.progress_every = progress_every
         self.count_in = 0
         self.count_out = 0
         self.t0 = time.time()
+        self.meter = RateMeter()
 
     def node(self, n):
         self.count_in += 1
         if (self.count_in % self.progress_every) == 0:
             size = os.path.getsize(self.out_path) if os.path.exists(self.out_path) else 0
             print(f"[PROGRESS] read={self.count_in:,}  matched={self.count_out:,}  file={size/1e6:.1f} MB  elapsed={time.time()-self.t0:.1f}s")
+            emit_progress("poi_nodes", self.meter, self.out_path, read=self.count_in, matched=self.count_out)
 
         if not n.location.valid(): 
             return
 
+        # buraya sadece POI_KEYS'ten birini taşıyan node'lar gelir (native_key_filters)
         t = {k:v for k,v in n.tags}
         if not (("amenity" in t) or ("shop" in t) or ("healthcare" in t) or
                 ("railway" in t) or ("highway" in t) or ("public_transport" in t) or
@@ -76,54 +106,122 @@ class POIHandler(osm.SimpleHandler):
         if not cats:
             return
 
-        name = t.get("name") or t.get("ref") or None
-        base = {
-            "id": n.id, "name": name,
-            "lat": float(n.location.lat), "lon": float(n.location.lon),
-            "amenity": t.get("amenity"), "shop": t.get("shop"), "healthcare": t.get("healthcare"),
-            "railway": t.get("railway"), "highway": t.get("highway"), "public_transport": t.get("public_transport"),
-            "leisure": t.get("leisure"), "boundary": t.get("boundary"), "landuse": t.get("landuse"),
-            "sport": t.get("sport"), "school_level": t.get("school:level"), "isced_level": t.get("isced:level"),
-        }
-        for c in cats:
-            row = dict(base); row["cat"] = c
-            self.batch.append(row); self.count_out += 1
-
-        if len(self.batch) >= self.batch_size:
+        self.count_out += append_node(self.batch, n.id, float(n.location.lat), float(n.location.lon), t, cats)
+
+        if len(self.batch["cat"]) >= self.batch_size:
             self.flush()
 
     def flush(self):
-        if not self.batch:
+        if not self.batch["cat"]:
             return
-        df = pd.DataFrame(self.batch)
-        table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+        # Hilbert anahtarı (finalize'da uzamsal sıralama) + ~1 km tile id; listeler doğrudan Arrow dizisine
+        t0 = time.perf_counter()
+        table = batch_table(self.batch, self.schema)
         self.writer.write_table(table)
+        flush_ms = (time.perf_counter() - t0) * 1000
         size = os.path.getsize(self.out_path) if os.path.exists(self.out_path) else 0
-        print(f"[FLUSH] wrote_rows={len(df):,}  total_matched={self.count_out:,}  file_now={size/1e6:.1f} MB")
-        self.batch.clear()
+        print(f"[FLUSH] wrote_rows={table.num_rows:,}  total_matched={self.count_out:,}  file_now={size/1e6:.1f} MB")
+        emit("flush", builder="poi_nodes", rows=table.num_rows, flush_ms=round(flush_ms, 2), matched=self.count_out)
+        for v in self.batch.values():
+            v.clear()
+
+# (cat, konum) eşitliğinde id ile kesin sıra → tek süreç ve --workers çıktıları satır satır aynı
+ORDER_BY = "cat, hkey, id"
+
+def _shard_worker(job):
+    """Tek işçi: PBF'in (i % workers == worker) data blob'larını bellekte ayrı bir PBF olarak işler."""
+    pbf, part_path, worker, workers, blocks, batch, count_filtered = job
+    buf = pbf_shard_bytes(pbf, blocks, worker, workers)
+    writer = pq.ParquetWriter(part_path, with_sort_key(SCHEMA), compression="zstd")
+    filters, counts = native_key_filters(count="node" if count_filtered else None)
+    try:
+        h = POIHandler(writer, out_path=part_path, batch_size=batch)
+        # node'lar koordinatını kendisi taşır; location index'e gerek yok
+        h.apply_buffer(buf, "pbf", filters=filters)
+        h.flush()
+    finally:
+        writer.close()
+    return h.count_in, h.count_out, counts["total"]
+
+def build_sharded(pbf, out, workers, batch, count_filtered=False):
+    """Node'lar blob bazında işçilere dağıtılır (round-robin; PBF'te node blob'ları başta toplu durur)."""
+    blocks = pbf_blocks(pbf)
+    n_data = sum(1 for b in blocks if b[0] == "OSMData")
+    print(f"[WORKERS] {workers} işçi  data_blobs={n_data:,}")
+    jobs = [(pbf, part_path_for(out, w), w, workers, blocks, batch, count_filtered) for w in range(workers)]
+    with Pool(workers) as pool:
+        counts = pool.map(_shard_worker, jobs)
+    return [j[1] for j in jobs], sum(c[0] for c in counts), sum(c[1] for c in counts), sum(c[2] for c in counts)
 
 def main():
     ap = argparse.ArgumentParser(description="Belgium PBF -> POI Parquet cache (ülke geneli).")
-    ap.add_argument("--pbf", required=True, help="belgium-latest.osm.pbf yolu")
+    ap.add_argument("--pbf", required=True, nargs="+",
+                    help="belgium-latest.osm.pbf yolu (birden çok: bölge başına çıktı, bkz. --out-dir)")
     ap.add_argument("--out", default="cache/be_poi.parquet", help="Parquet çıktı")
+    add_region_args(ap)
     ap.add_argument("--batch", type=int, default=50_000, help="Flush batch boyutu")
+    ap.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE, help="Nihai dosyada row-group boyutu")
+    ap.add_argument("--no-sort", action="store_true", help="Uzamsal sıralama yapma (PBF sırasıyla yaz)")
+    ap.add_argument("--workers", type=int, default=1, help="Paralel işçi süreci sayısı (PBF blob'larına göre bölünür)")
+    ap.add_argument("--count-filtered", action="store_true",
+                    help="C++ tarafında elenen node sayısını da raporla (ölçüm içindir, biraz yavaşlatır)")
+    ap.add_argument("--int-coords", action="store_true",
+                    help="Nihai dosyada lat/lon int32 sabit nokta (1e-7 derece) olarak saklanır (daha küçük dosya)")
+    # node builder konum indeksi kullanmaz; --low-memory sadece finalize sıralamasını sınırlar
+    add_low_memory_args(ap, locations=False)
+    add_metrics_args(ap)
     args = ap.parse_args()
-
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    install_sinks(args)
+    if args.workers > 1 and args.no_sort:
+        ap.error("--workers parçaları birleştirirken sıralar; --no-sort ile birlikte kullanılamaz")
+    if args.int_coords and args.no_sort:
+        ap.error("--int-coords finalize adımında uygulanır; --no-sort ile birlikte kullanılamaz")
+    if len(args.pbf) > 1 or args.out_dir:
+        build_regions(args, build, "nodes", ["id"], node_keys, ORDER_BY.split(", "))
+    else:
+        build(args, args.pbf[0], args.out)
+
+def build(args, pbf, out):
+    """Tek PBF → tek node cache (out)."""
+    memory_limit = args.memory_limit if args.low_memory else None
+    # rank_score / is_hospital finalize adımında hesaplanır (--no-sort çıktısında yok → sorguda canlı hesap)
+    out_schema = with_rank_columns(final_schema(SCHEMA, args.int_coords), rank_config_hash())
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
     print("[INFO] PBF okunuyor, bu işlem tek seferlik…")
     t0 = time.time()
-    writer = pq.ParquetWriter(args.out, SCHEMA, compression="zstd")
-
-    try:
-        h = POIHandler(writer, out_path=args.out, batch_size=args.batch)
-        h.apply_file(args.pbf, locations=True)
-        h.flush()
-    finally:
-        writer.close()
+    if args.workers > 1:
+        parts, count_in, count_out, total = build_sharded(pbf, out, args.workers, args.batch,
+                                                          args.count_filtered)
+        counts = {"total": total}
+        finalize_cache(parts, out, out_schema, row_group_size=args.row_group_size, order_by=ORDER_BY,
+                       memory_limit=memory_limit, derived_sql=rank_columns_sql())
+    else:
+        # önce ham dosya (+hkey), sonra cat + Hilbert sırasıyla nihai dosya
+        write_path = out if args.no_sort else raw_path_for(out)
+        writer = pq.ParquetWriter(write_path, SCHEMA if args.no_sort else with_sort_key(SCHEMA), compression="zstd")
+
+        filters, counts = native_key_filters(count="node" if args.count_filtered else None)
+        try:
+            h = POIHandler(writer, out_path=write_path, batch_size=args.batch)
+            # node'lar koordinatını kendisi taşır: location index (locations=True) gereksiz
+            h.apply_file(pbf, filters=filters)
+            h.flush()
+        finally:
+            writer.close()
+        if not args.no_sort:
+            finalize_cache(write_path, out, out_schema, row_group_size=args.row_group_size, order_by=ORDER_BY,
+                           memory_limit=memory_limit, derived_sql=rank_columns_sql())
+        count_in, count_out = h.count_in, h.count_out
 
     dt = time.time()-t0
-    size_mb = os.path.getsize(args.out)/1e6 if os.path.exists(args.out) else 0
-    print(f"[DONE] input_nodes~{h.count_in:,}  matched_rows={h.count_out:,}  file={size_mb:.1f} MB  time={dt/60:.1f} dk")
+    size_mb = os.path.getsize(out)/1e6 if os.path.exists(out) else 0
+    print(filter_report(count_in, counts))
+    print(f"[DONE] candidate_nodes~{count_in:,}  matched_rows={count_out:,}  file={size_mb:.1f} MB  time={dt/60:.1f} dk  "
+          f"{rss_report()}")
+    emit("done", builder="poi_nodes", elapsed_s=round(dt, 3), read=count_in, matched=count_out,
+         read_per_s=round(count_in / max(dt, 1e-9), 1), matched_per_s=round(count_out / max(dt, 1e-9), 1),
+         file_mb=round(size_mb, 2), peak_rss_mb=peak_rss_mb())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,238 @@
+# build_poi_merged.py — node + polygon cache'lerini tek, dupe'suz POI cache'ine birleştirir
+# Aynı market/hastane hem nokta hem bina alanı olarak etiketliyse (Colruyt/Delhaize'de sık) iki kez sayılmaz:
+# aynı kategoride, tolerans içinde ve isim/marka eşleşen (node, area) çiftleri tek satıra iner.
+# Çıktı polygon şemasındadır (+ src); app_duckdb / server / build_score_grid / build_nearest_poi,
+# bu node/polygon cache'lerinden üretilmiş güncel bir birleşik dosya bulursa sadece onu tarar.
+import os, json, time, argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import app_duckdb as app
+from poi_rank import rank_config_hash, score_case_sql, HOSPITAL_SQL
+from profiling import emit, add_metrics_args, install_sinks
+from poi_cache_utils import (sql_str, conform, final_schema, with_rank_columns, with_sort_key, raw_path_for, finalize_cache,
+                             hilbert_key, tile_of, has_int_coords, duckdb_connect, add_low_memory_args, rss_report,
+                             peak_rss_mb, region_files, region_path, write_region_manifest, DICT_STR, COORD_SCALE,
+                             ROW_GROUP_SIZE, MERGED_SOURCES_KEY)
+
+SCHEMA = pa.schema([
+    ("uid", pa.string()), ("osm_type", DICT_STR), ("osm_id", pa.int64()), ("src", DICT_STR),
+    ("cat", DICT_STR), ("name", pa.string()), ("brand", DICT_STR),
+    ("lat", pa.float64()), ("lon", pa.float64()),
+    ("amenity", DICT_STR), ("shop", DICT_STR), ("healthcare", DICT_STR),
+    ("railway", DICT_STR), ("highway", DICT_STR), ("public_transport", DICT_STR),
+    ("leisure", DICT_STR), ("boundary", DICT_STR), ("landuse", DICT_STR),
+    ("sport", DICT_STR), ("school_level", DICT_STR), ("isced_level", DICT_STR),
+    ("tile", pa.int64()),
+])
+ORDER_BY = "cat, hkey, uid"
+# ham dosyada ek kolon: çift satırında iki taraftan biri hastaneyse 1 (eşleşmeyen satırlarda NULL)
+RAW_EXTRA = [pa.field("pair_hospital", pa.int8())]
+TAG_COLS = [c for c in app.POI_COLS.split(", ") if c not in ("name", "lat", "lon")]
+
+# node ile alan centroid'i arasındaki en fazla mesafe (m): büyük alanlarda (park, hastane kampüsü)
+# etiketli nokta centroid'den uzakta kalabilir
+MERGE_TOLERANCE_M = {"school": 150.0, "market": 100.0, "health": 150.0, "transit": 50.0, "park": 300.0,
+                     "sport": 150.0}
+
+def _key_sql(col):
+    # eşleştirme anahtarı: küçük harf, aksansız, boşluksuz uçlar; boş → NULL (isimsiz POI'ler birleşmez)
+    return f"NULLIF(lower(strip_accents(trim({col}))), '')"
+
+def _source_sql(path, kind):
+    """Cache → ortak kolonlar (düz string, derece koordinat); node kimliği n<id>, alanlar kendi uid'i."""
+    names = pq.read_schema(path).names
+    if has_int_coords(pq.read_schema(path)):
+        ll = f"CAST(lat AS DOUBLE) / {COORD_SCALE} AS lat, CAST(lon AS DOUBLE) / {COORD_SCALE} AS lon"
+    else:
+        ll = "CAST(lat AS DOUBLE) AS lat, CAST(lon AS DOUBLE) AS lon"
+    if kind == "node":
+        ident = "'n' || CAST(id AS VARCHAR) AS uid, 'n' AS osm_type, id AS osm_id"
+    elif "osm_id" in names:
+        ident = "CAST(uid AS VARCHAR) AS uid, CAST(osm_type AS VARCHAR) AS osm_type, osm_id"
+    else:
+        ident = "CAST(uid AS VARCHAR) AS uid, CAST(NULL AS VARCHAR) AS osm_type, CAST(NULL AS BIGINT) AS osm_id"
+    brand = "CAST(brand AS VARCHAR)" if "brand" in names else "CAST(NULL AS VARCHAR)"
+    tags = ", ".join(f"CAST({c} AS VARCHAR) AS {c}" for c in TAG_COLS)
+    return (f"SELECT {ident}, CAST(cat AS VARCHAR) AS cat, CAST(name AS VARCHAR) AS name, {brand} AS brand, "
+            f"{ll}, {tags} FROM read_parquet({sql_str(path)})")
+
+def match_pairs(con, nodes_path, polys_path, tolerance):
+    """
+    Grid hash'li uzamsal birleştirme: hücre boyu = en büyük tolerans, her node komşu 3x3 hücredeki aynı
+    kategorideki alanlarla karşılaştırılır. Eşleşme: isim veya marka (çapraz da) eşit ve mesafe <= tolerans[cat].
+    Birebir: her node en yakın alanına, her alan en yakın node'una bağlanır; ikisi de birbirini seçerse çift olur.
+    Tablolar: n, p (rid'li kaynaklar; rs = SCORES sıra skoru, hosp = hastane bayrağı), pairs(nid, pid, d_m).
+    """
+    con.execute(f"CREATE OR REPLACE TEMP TABLE n0 AS {_source_sql(nodes_path, 'node')}")
+    con.execute(f"CREATE OR REPLACE TEMP TABLE p0 AS {_source_sql(polys_path, 'area')}")
+    ref_lat = con.execute("SELECT avg(lat) FROM (SELECT lat FROM n0 UNION ALL SELECT lat FROM p0)").fetchone()[0] or 0.0
+    cell = max(tolerance.values())
+    kx = 111320.0 * np.cos(np.radians(ref_lat))   # tek referans enlem: iki taraf aynı projeksiyonda
+    for t in ("n", "p"):
+        con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE {t} AS
+        SELECT *, ROW_NUMBER() OVER () AS rid, {score_case_sql()} AS rs, {HOSPITAL_SQL} AS hosp,
+               {_key_sql('name')} AS kn, {_key_sql('brand')} AS kb,
+               lon * {kx} AS x, lat * 111320.0 AS y,
+               CAST(floor(lon * {kx} / {cell}) AS BIGINT) AS cx,
+               CAST(floor(lat * 111320.0 / {cell}) AS BIGINT) AS cy
+        FROM {t}0
+        """)
+        con.execute(f"DROP TABLE {t}0")
+    tol_rows = ", ".join(f"('{c}', {float(m)})" for c, m in tolerance.items())
+    con.execute(f"""
+    CREATE OR REPLACE TEMP TABLE pairs AS
+    WITH off AS (
+      SELECT dx, dy FROM (VALUES (-1), (0), (1)) a(dx), (VALUES (-1), (0), (1)) b(dy)
+    ),
+    tol AS (SELECT * FROM (VALUES {tol_rows}) t(cat, m)),
+    cand AS (
+      SELECT n.rid AS nid, p.rid AS pid, tol.m AS m,
+             sqrt((n.x - p.x) * (n.x - p.x) + (n.y - p.y) * (n.y - p.y)) AS d_m
+      FROM n CROSS JOIN off
+      JOIN p ON p.cat = n.cat AND p.cx = n.cx + off.dx AND p.cy = n.cy + off.dy
+      JOIN tol ON tol.cat = n.cat
+      WHERE n.kn = p.kn OR n.kb = p.kb OR n.kn = p.kb OR n.kb = p.kn
+    ),
+    best AS (
+      SELECT nid, pid, d_m,
+             ROW_NUMBER() OVER (PARTITION BY nid ORDER BY d_m, pid) AS rn_n,
+             ROW_NUMBER() OVER (PARTITION BY pid ORDER BY d_m, nid) AS rn_p
+      FROM cand WHERE d_m <= m
+    )
+    SELECT nid, pid, d_m FROM best WHERE rn_n = 1 AND rn_p = 1
+    """)
+
+def merged_sql():
+    """Birleşik satırlar: eşleşen çiftte konum node'dan (etiketlenen nokta), isim/marka node'dan (boşsa alandan),
+    etiketler sıra skoru (SCORES) yüksek olan taraftan bütün olarak (eşitlikte node); hastane bayrağı iki tarafın
+    OR'u (pair_hospital). Eşleşmeyen node ve alanlar aynen."""
+    names = ", ".join(f"COALESCE(n.{c}, p.{c}) AS {c}" for c in ("name", "brand"))
+    tags = ", ".join(f"CASE WHEN n.rs >= p.rs THEN n.{c} ELSE p.{c} END AS {c}" for c in TAG_COLS)
+    plain = ", ".join(["name", "brand"] + TAG_COLS)
+    return f"""
+    SELECT n.uid, n.osm_type, n.osm_id, 'node+area' AS src, n.cat, {names}, {tags}, n.lat, n.lon,
+           CAST(GREATEST(n.hosp, p.hosp) AS TINYINT) AS pair_hospital
+    FROM pairs JOIN n ON n.rid = pairs.nid JOIN p ON p.rid = pairs.pid
+    UNION ALL
+    SELECT uid, osm_type, osm_id, 'node' AS src, cat, {plain}, lat, lon, CAST(NULL AS TINYINT) AS pair_hospital
+    FROM n WHERE rid NOT IN (SELECT nid FROM pairs)
+    UNION ALL
+    SELECT uid, osm_type, osm_id, 'area' AS src, cat, {plain}, lat, lon, CAST(NULL AS TINYINT) AS pair_hospital
+    FROM p WHERE rid NOT IN (SELECT pid FROM pairs)
+    """
+
+def merged_rank_sql():
+    # finalize_cache'in türetilmiş kolonları: rank_score etiketlerden (çiftte zaten yüksek taraf), is_hospital
+    # çiftin OR'u. Damga eşleşmezse (SCORES değişti) sorgu tarafı etiketlerden canlı hesaplar ve bu OR kaybolur;
+    # birleşik dosya yeniden üretilmeli.
+    return (f"CAST({score_case_sql()} AS SMALLINT) AS rank_score, "
+            f"CAST(GREATEST({HOSPITAL_SQL}, COALESCE(pair_hospital, 0)) AS TINYINT) AS is_hospital")
+
+def write_raw(con, raw_path, batch_rows=ROW_GROUP_SIZE * 16):
+    """Birleşik satırlar + Hilbert anahtarı/tile → ham dosya (finalize_cache girdisi); dönüş: satır sayısı."""
+    schema = with_sort_key(pa.schema(list(SCHEMA) + RAW_EXTRA))
+    reader = con.execute(merged_sql()).fetch_record_batch(batch_rows)
+    n = 0
+    with pq.ParquetWriter(raw_path, schema, compression="zstd") as w:
+        for batch in reader:
+            t = pa.Table.from_batches([batch])
+            hkey = hilbert_key(t["lat"].to_numpy(), t["lon"].to_numpy())
+            t = t.append_column("tile", pa.array(tile_of(hkey))).append_column("hkey", pa.array(hkey))
+            w.write_table(conform(t, schema))
+            n += t.num_rows
+    return n
+
+def report(con):
+    """Kategori başına node / alan / birleşen çift sayısı ve çift mesafesi medyanı."""
+    return con.execute("""
+    WITH nc AS (SELECT cat, COUNT(*) AS nodes FROM n GROUP BY cat),
+         pc AS (SELECT cat, COUNT(*) AS areas FROM p GROUP BY cat),
+         dc AS (SELECT n.cat, COUNT(*) AS dupes, median(d_m) AS d_med
+                FROM pairs JOIN n ON n.rid = pairs.nid GROUP BY n.cat)
+    SELECT cat, COALESCE(nodes, 0) AS nodes, COALESCE(areas, 0) AS areas, COALESCE(dupes, 0) AS dupes, d_med
+    FROM nc FULL JOIN pc USING (cat) FULL JOIN dc USING (cat) ORDER BY cat
+    """).fetchall()
+
+def main():
+    ap = argparse.ArgumentParser(description="Node + polygon POI cache -> tek, dupe'suz birleşik cache")
+    ap.add_argument("--nodes", default="cache/be_poi.parquet")
+    ap.add_argument("--polys", default="cache/be_poi_poly.parquet")
+    ap.add_argument("--out", default=app.MERGED_CACHE)
+    ap.add_argument("--tolerance-m", type=float,
+                    help="Tüm kategoriler için tek tolerans (m); verilmezse MERGE_TOLERANCE_M")
+    ap.add_argument("--regions", help="Bölge dizini (çoklu --pbf build çıktısı): her bölge ayrı birleştirilir")
+    ap.add_argument("--dupes-out", help="Birleşen çiftlerin listesi (.parquet: kategori, iki kimlik, isimler, mesafe)")
+    ap.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    ap.add_argument("--int-coords", action="store_true", help="lat/lon int32 sabit noktalı (bkz. builder'lar)")
+    add_low_memory_args(ap, locations=False)
+    add_metrics_args(ap)
+    args = ap.parse_args()
+    install_sinks(args)
+    tolerance = {c: args.tolerance_m for c in app.CATS} if args.tolerance_m else dict(MERGE_TOLERANCE_M)
+    if args.regions:
+        merge_regions(args, tolerance)
+        return
+    for path in (args.nodes, args.polys):
+        if not os.path.exists(path):
+            raise SystemExit(f"Cache bulunamadı: {path} (birleştirme için iki cache de gerekli)")
+    merge(args, args.nodes, args.polys, args.out, tolerance, args.dupes_out)
+
+def merge_regions(args, tolerance):
+    """--regions: iki cache'i de olan her bölge kendi .merged.parquet dosyasına birleşir; manifest yenilenir."""
+    files = {}
+    for region, kind, name in region_files(args.regions):
+        files.setdefault(region, {})[kind] = os.path.join(args.regions, name)
+    done = 0
+    for region, kinds in files.items():
+        if "nodes" not in kinds or "polys" not in kinds:
+            print(f"[SKIP] {region}: node ve polygon cache'lerinin ikisi de gerekli")
+            continue
+        merge(args, kinds["nodes"], kinds["polys"], region_path(args.regions, region, "merged"), tolerance, None)
+        done += 1
+    if not done:
+        raise SystemExit(f"Birleştirilecek bölge yok: {args.regions}")
+    write_region_manifest(args.regions)
+
+def merge(args, nodes, polys, out, tolerance, dupes_out=None):
+    t0 = time.time()
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    memory_limit = args.memory_limit if args.low_memory else None
+    con = duckdb_connect(memory_limit, spill_dir=out + ".duckdb_tmp")
+    match_pairs(con, nodes, polys, tolerance)
+    rows = report(con)
+    n_rows = write_raw(con, raw_path_for(out))
+    if dupes_out:
+        con.execute(f"""
+        COPY (
+          SELECT n.cat, n.uid AS node_uid, p.uid AS area_uid, p.osm_type AS area_type, p.osm_id AS area_osm_id,
+                 n.name AS node_name, p.name AS area_name, n.brand AS node_brand, p.brand AS area_brand,
+                 round(d_m, 1) AS d_m
+          FROM pairs JOIN n ON n.rid = pairs.nid JOIN p ON p.rid = pairs.pid ORDER BY n.cat, d_m
+        ) TO {sql_str(dupes_out)} (FORMAT PARQUET)
+        """)
+    con.close()
+
+    sources = json.dumps(sorted(os.path.abspath(p) for p in (nodes, polys)))
+    out_schema = with_rank_columns(final_schema(SCHEMA, args.int_coords), rank_config_hash())
+    out_schema = out_schema.with_metadata({**out_schema.metadata, MERGED_SOURCES_KEY: sources.encode("utf-8")})
+    finalize_cache(raw_path_for(out), out, out_schema, row_group_size=args.row_group_size,
+                   order_by=ORDER_BY, memory_limit=memory_limit, derived_sql=merged_rank_sql())
+
+    n_nodes, n_areas, n_dupes = (sum(r[i] for r in rows) for i in (1, 2, 3))
+    for cat, cat_nodes, cat_areas, dupes, d_med in rows:
+        med = f"{d_med:.0f} m" if d_med is not None else "-"
+        print(f"[MERGE] {cat:<8} node={cat_nodes:>8,}  area={cat_areas:>8,}  dupe={dupes:>7,}  "
+              f"tol={tolerance.get(cat, 0):.0f} m  medyan={med}")
+    dt = time.time() - t0
+    print(f"[DONE] {out}  node={n_nodes:,} + area={n_areas:,} - dupe={n_dupes:,} = {n_rows:,} satır  "
+          f"file={os.path.getsize(out)/1e6:.1f} MB  time={dt:.1f}s  {rss_report()}")
+    if dupes_out:
+        print(f"[MERGE] çift listesi: {os.path.abspath(dupes_out)}")
+    emit("done", builder="merge", elapsed_s=round(dt, 3), nodes=n_nodes, areas=n_areas, dupes=n_dupes,
+         rows=n_rows, dupes_by_cat={r[0]: r[3] for r in rows},
+         file_mb=round(os.path.getsize(out) / 1e6, 2), peak_rss_mb=peak_rss_mb())
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,19 @@
 # Gereken: pip install osmium shapely pyarrow pandas
 
 import os, time, argparse, hashlib
+from multiprocessing import Pool
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
 import osmium as osm
 from shapely import wkb
+from profiling import emit, RateMeter, add_metrics_args, install_sinks
+from poi_rank import rank_config_hash, rank_columns_sql
+from poi_cache_utils import (sql_str, batch_table, final_schema, with_rank_columns, DICT_STR, with_sort_key, raw_path_for, part_path_for, finalize_cache,
+                             native_key_filters, filter_report, add_low_memory_args, location_index,
+                             add_region_args, build_regions, poly_keys,
+                             remove_location_index, duckdb_connect, rss_report, peak_rss_mb, emit_progress,
+                             ROW_GROUP_SIZE)
 
 # İlgili etiket kümeleri
 AMENITY_OK = {"school","college","kindergarten","marketplace","hospital","clinic","doctors","pharmacy","dentist","bus_station","gym"}
@@ -21,13 +29,16 @@ LANDUSE_OK = {"grass"}
 SPORT_OK = {"fitness","gym"}
 
 SCHEMA = pa.schema([
-    ("uid", pa.string()), ("cat", pa.string()), ("name", pa.string()), ("brand", pa.string()),
+    ("uid", pa.string()), ("osm_type", DICT_STR), ("osm_id", pa.int64()),
+    ("cat", DICT_STR), ("name", pa.string()), ("brand", DICT_STR),
     ("lat", pa.float64()), ("lon", pa.float64()),
-    ("amenity", pa.string()), ("shop", pa.string()), ("healthcare", pa.string()),
-    ("railway", pa.string()), ("highway", pa.string()), ("public_transport", pa.string()),
-    ("leisure", pa.string()), ("boundary", pa.string()), ("landuse", pa.string()),
-    ("sport", pa.string()), ("school_level", pa.string()), ("isced_level", pa.string()),
+    ("amenity", DICT_STR), ("shop", DICT_STR), ("healthcare", DICT_STR),
+    ("railway", DICT_STR), ("highway", DICT_STR), ("public_transport", DICT_STR),
+    ("leisure", DICT_STR), ("boundary", DICT_STR), ("landuse", DICT_STR),
+    ("sport", DICT_STR), ("school_level", DICT_STR), ("isced_level", DICT_STR),
+    ("tile", pa.int64()),
 ])
+BATCH_COLS = [f.name for f in SCHEMA if f.name != "tile"]
 
 def categorize(t: dict):
     out=[]
@@ -42,124 +53,360 @@ def categorize(t: dict):
     if (l in {"fitness_centre","sports_centre"}) or (a=="gym") or (sp in {"fitness","gym"}) or ("sport" in t): out.append("sport")
     return out
 
+def dedupe_key(name, lat, lon):
+    # (name_lower, round(lat,4), round(lon,4)) — hem handler'da hem --workers birleştirmesinde
+    return ((name or "").strip().lower(), round(lat,4), round(lon,4))
+
 def stable_uid(name, lat, lon):
     s = f"{(name or '').strip().lower()}|{round(float(lat),6)}|{round(float(lon),6)}"
     return hashlib.md5(s.encode("utf-8")).hexdigest()
 
+def centroid_of(g_wkb):
+    """Area WKB'si → (lat, lon) centroid; bozuk geometride None."""
+    try:
+        c = wkb.loads(g_wkb).centroid
+        return float(c.y), float(c.x)
+    except Exception:
+        return None
+
+def area_wkb(wkbf, a):
+    # multipolygon tercih; olmazsa polygon dene (bozuk geometride None)
+    try:
+        return wkbf.create_multipolygon(a)
+    except Exception:
+        try:
+            return wkbf.create_polygon(a)
+        except Exception:
+            return None
+
+def has_poi_key(tags):
+    # hızlı ön-eleme: ilgili anahtarlardan hiçbiri yoksa area işlenmez
+    return (("amenity" in tags) or ("shop" in tags) or ("healthcare" in tags) or
+            ("railway" in tags) or ("highway" in tags) or ("public_transport" in tags) or
+            ("leisure" in tags) or ("boundary" in tags) or ("landuse" in tags) or ("sport" in tags) or
+            ("school:level" in tags) or ("isced:level" in tags))
+
+def new_batch(seq=False):
+    return {c: [] for c in BATCH_COLS + (["seq"] if seq else [])}
+
+def append_area(b, osm_type, osm_id, lat, lon, tags, cats=None, seq=None):
+    """Area'yı kolon listelerine ekler (kategori başına bir satır; tile/hkey flush'ta). Dönüş: satır sayısı."""
+    cats = categorize(tags) if cats is None else cats
+    name = tags.get("name") or tags.get("brand") or tags.get("ref") or None
+    vals = {
+        "uid": stable_uid(name, lat, lon), "osm_type": osm_type, "osm_id": osm_id,
+        "name": name,
+        "brand": tags.get("brand"),
+        "lat": lat, "lon": lon,
+        "amenity": tags.get("amenity"),
+        "shop": tags.get("shop"),
+        "healthcare": tags.get("healthcare"),
+        "railway": tags.get("railway"),
+        "highway": tags.get("highway"),
+        "public_transport": tags.get("public_transport"),
+        "leisure": tags.get("leisure"),
+        "boundary": tags.get("boundary"),
+        "landuse": tags.get("landuse"),
+        "sport": tags.get("sport"),
+        "school_level": tags.get("school:level"),
+        "isced_level": tags.get("isced:level"),
+    }
+    if "seq" in b:
+        vals["seq"] = seq
+    k = len(cats)
+    for col, v in vals.items():
+        b[col].extend([v] * k)
+    b["cat"].extend(cats)
+    return k
+
 class PolyHandler(osm.SimpleHandler):
     """
     Multipolygon relation + kapalı way'lerden oluşan 'area' nesnelerini yakalar,
     centroid üretir ve ilgilendiğimiz kategorilere göre satırlaştırır.
+    dedupe=False (--low-memory): dupe kırpmayı birleştirmeye bırakır ve her satıra area'nın
+    geliş sırasını (seq) yazar.
     """
-    def __init__(self, writer, out_path, batch_size=50_000, progress_every=100_000):
+    def __init__(self, writer, out_path, batch_size=50_000, progress_every=100_000, dedupe=True):
         super().__init__()
         self.writer = writer
+        self.schema = writer.schema
         self.out_path = out_path
-        self.batch = []
+        self.batch = new_batch(seq="seq" in self.schema.names)  # kolon başına bir liste
         self.batch_size = batch_size
         self.progress_every = progress_every
         self.count_in = 0
         self.count_out = 0
-        self.seen = set()  # (name_lower, round(lat,4), round(lon,4)) ile dupe kırp
+        # dedupe_key ile dupe kırp (sadece tek süreçte; küme area sayısıyla büyür, --low-memory'de kapalı)
+        self.seen = set() if dedupe else None
         self.wkbf = osm.geom.WKBFactory()
         self.t0 = time.time()
+        self.meter = RateMeter()
 
     def area(self, a):
         self.count_in += 1
         if (self.count_in % self.progress_every) == 0:
             size = os.path.getsize(self.out_path) if os.path.exists(self.out_path) else 0
             print(f"[PROGRESS] read_areas={self.count_in:,}  matched={self.count_out:,}  file={size/1e6:.1f} MB  elapsed={time.time()-self.t0:.1f}s")
-
+            emit_progress("poi_polys", self.meter, self.out_path, read=self.count_in, matched=self.count_out)
+        # buraya sadece POI_KEYS'ten birini taşıyan area'lar gelir (native_key_filters)
         tags = {k:v for k,v in a.tags}
-        # hızlı ön-eleme: ilgili anahtarlardan hiçbiri yoksa çık
-        if not (("amenity" in tags) or ("shop" in tags) or ("healthcare" in tags) or
-                ("railway" in tags) or ("highway" in tags) or ("public_transport" in tags) or
-                ("leisure" in tags) or ("boundary" in tags) or ("landuse" in tags) or ("sport" in tags) or
-                ("school:level" in tags) or ("isced:level" in tags)):
+        if not has_poi_key(tags):
             return
 
         cats = categorize(tags)
         if not cats:
             return
 
-        # geometri -> centroid
-        try:
-            # multipolygon tercih; olmazsa polygon dene
-            try:
-                g_wkb = self.wkbf.create_multipolygon(a)
-            except Exception:
-                g_wkb = self.wkbf.create_polygon(a)
-            geom = wkb.loads(g_wkb)  # shapely geometry
-            c = geom.centroid
-            lat, lon = float(c.y), float(c.x)
-        except Exception:
-            return  # bozuk geometri vb.
+        # geometri -> centroid (bozuk geometri vb. atlanır)
+        g_wkb = area_wkb(self.wkbf, a)
+        c = centroid_of(g_wkb) if g_wkb is not None else None
+        if c is None:
+            return
+        lat, lon = c
 
         name = tags.get("name") or tags.get("brand") or tags.get("ref") or None
-        nm_key = ((name or "").strip().lower(), round(lat,4), round(lon,4))
-        if nm_key in self.seen:
-            return
-        self.seen.add(nm_key)
-
-        base = {
-            "name": name,
-            "brand": tags.get("brand"),
-            "lat": lat, "lon": lon,
-            "amenity": tags.get("amenity"),
-            "shop": tags.get("shop"),
-            "healthcare": tags.get("healthcare"),
-            "railway": tags.get("railway"),
-            "highway": tags.get("highway"),
-            "public_transport": tags.get("public_transport"),
-            "leisure": tags.get("leisure"),
-            "boundary": tags.get("boundary"),
-            "landuse": tags.get("landuse"),
-            "sport": tags.get("sport"),
-            "school_level": tags.get("school:level"),
-            "isced_level": tags.get("isced:level"),
-        }
-        uid = stable_uid(name, lat, lon)
-        for c in cats:
-            row = {"uid": uid, "cat": c, **base}
-            self.batch.append(row)
-            self.count_out += 1
-
-        if len(self.batch) >= self.batch_size:
+        if self.seen is not None:
+            nm_key = dedupe_key(name, lat, lon)
+            if nm_key in self.seen:
+                return
+            self.seen.add(nm_key)
+
+        # OSM kimliği: area id'si way için 2*id, relation için 2*id+1 → orijinal (tip, id)
+        osm_type = "w" if a.from_way() else "r"
+        self.count_out += append_area(self.batch, osm_type, a.orig_id(), lat, lon, tags, cats, seq=self.count_in)
+
+        if len(self.batch["cat"]) >= self.batch_size:
             self.flush()
 
     def flush(self):
-        if not self.batch:
+        if not self.batch["cat"]:
             return
-        df = pd.DataFrame(self.batch)
-        table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+        # Hilbert anahtarı (finalize'da uzamsal sıralama) + ~1 km tile id; listeler doğrudan Arrow dizisine
+        t0 = time.perf_counter()
+        table = batch_table(self.batch, self.schema)
         self.writer.write_table(table)
+        flush_ms = (time.perf_counter() - t0) * 1000
         size = os.path.getsize(self.out_path) if os.path.exists(self.out_path) else 0
-        print(f"[FLUSH] wrote_rows={len(df):,}  total_matched={self.count_out:,}  file_now={size/1e6:.1f} MB")
-        self.batch.clear()
+        print(f"[FLUSH] wrote_rows={table.num_rows:,}  total_matched={self.count_out:,}  file_now={size/1e6:.1f} MB")
+        emit("flush", builder="poi_polys", rows=table.num_rows, flush_ms=round(flush_ms, 2), matched=self.count_out)
+        for v in self.batch.values():
+            v.clear()
+
+ORDER_BY = "cat, hkey, uid"
+
+PART_SCHEMA = with_sort_key(SCHEMA).append(pa.field("seq", pa.int64()))
+
+def _area_worker(job):
+    """--low-memory (tek süreç): dosya tabanlı konum indeksiyle okur, satırları seq ile ham parçaya yazar."""
+    pbf, part_path, batch, count_filtered, idx = job
+    writer = pq.ParquetWriter(part_path, PART_SCHEMA, compression="zstd")
+    filters, counts = native_key_filters(count="area" if count_filtered else None)
+    try:
+        h = PolyHandler(writer, out_path=part_path, batch_size=batch, dedupe=False)
+        h.apply_file(pbf, locations=True, idx=idx, filters=filters)
+        h.flush()
+    finally:
+        writer.close()
+        remove_location_index(idx)
+    return h.count_in, h.count_out, counts["total"]
+
+def _area_chunk(job):
+    """--workers işçisi: (seq, tip, id, etiketler, WKB) parçasını centroid + satırlara çevirip kendi part dosyasına yazar."""
+    part_path, items = job
+    b = new_batch(seq=True)
+    n = 0
+    for seq, osm_type, osm_id, tags, g_wkb in items:
+        c = centroid_of(g_wkb)
+        if c is not None:
+            n += append_area(b, osm_type, osm_id, c[0], c[1], tags, seq=seq)
+    pq.write_table(batch_table(b, PART_SCHEMA), part_path, compression="zstd")
+    return n
+
+class AreaFeeder(osm.SimpleHandler):
+    """
+    --workers: PBF tek süreçte, tek konum indeksiyle okunur (area kurulumu C++'ta). Area başına burada sadece
+    etiketler ve WKB alınır; centroid (shapely), satırlaştırma ve Arrow/Parquet yazımı chunk'lar halinde
+    işçi havuzuna gider. Sıra numarası (seq) tek süreçteki geliş sırasıdır; merge_parts dupe'ları ona göre kırpar.
+    """
+    def __init__(self, pool, workers, out_path, chunk=20_000, progress_every=100_000):
+        super().__init__()
+        self.pool, self.out_path, self.chunk_size = pool, out_path, chunk
+        self.max_pending = 2 * workers        # bellekte bekleyen chunk sınırı (okuma işçilerden hızlıysa bekler)
+        self.items, self.pending, self.parts = [], [], []
+        self.progress_every = progress_every
+        self.count_in = 0
+        self.count_out = 0
+        self.wkbf = osm.geom.WKBFactory()
+        self.t0 = time.time()
+        self.meter = RateMeter()
+
+    def area(self, a):
+        self.count_in += 1
+        if (self.count_in % self.progress_every) == 0:
+            print(f"[PROGRESS] read_areas={self.count_in:,}  written={self.count_out:,}  chunks={len(self.parts):,}  "
+                  f"elapsed={time.time()-self.t0:.1f}s")
+            emit_progress("poi_polys", self.meter, self.out_path, read=self.count_in, matched=self.count_out)
+        tags = {k:v for k,v in a.tags}
+        if not has_poi_key(tags) or not categorize(tags):
+            return
+        g_wkb = area_wkb(self.wkbf, a)
+        if g_wkb is None:
+            return
+        self.items.append((self.count_in, "w" if a.from_way() else "r", a.orig_id(), tags, g_wkb))
+        if len(self.items) >= self.chunk_size:
+            self.submit()
+
+    def submit(self):
+        if not self.items:
+            return
+        part = part_path_for(self.out_path, len(self.parts))
+        self.parts.append(part)
+        self.pending.append(self.pool.apply_async(_area_chunk, ((part, self.items),)))
+        self.items = []
+        while len(self.pending) > self.max_pending:
+            self.count_out += self.pending.pop(0).get()
+
+    def finish(self):
+        self.submit()
+        while self.pending:
+            self.count_out += self.pending.pop(0).get()
+        return self.parts
+
+def merge_parts(parts, raw_out):
+    """
+    Parçaları area sırasına (seq) göre birleştirir ve tek süreçteki 'seen' kırpmasını aynen uygular:
+    aynı dedupe_key'e sahip area'lardan sadece ilk gelen kalır. Sonuç ham dosya olarak yazılır.
+    """
+    df = pa.concat_tables([pq.read_table(p) for p in parts]).to_pandas().sort_values("seq", kind="stable")
+    first = df.drop_duplicates("seq")
+    keys = [dedupe_key(n, la, lo) for n, la, lo in zip(first["name"], first["lat"], first["lon"])]
+    keep_seq = set(first["seq"][~pd.Series(keys, index=first.index).duplicated()])
+    n_dupes = len(first) - len(keep_seq)
+    df = df[df["seq"].isin(keep_seq)].drop(columns="seq")
+    pq.write_table(pa.Table.from_pandas(df, schema=with_sort_key(SCHEMA), preserve_index=False), raw_out,
+                   compression="zstd")
+    for p in parts:
+        os.remove(p)
+    print(f"[MERGE] parts={len(parts)}  rows={len(df):,}  dupes_removed={n_dupes:,}")
+    return len(df)
+
+def dedupe_parts_duckdb(parts, raw_out, memory_limit):
+    """
+    merge_parts'ın sabit bellekli karşılığı: aynı dedupe_key'li area'lardan en küçük seq'li olan kalır.
+    Gruplama DuckDB'de memory_limit içinde yapılır, fazlası diske taşar.
+    """
+    src = "[" + ", ".join(sql_str(p) for p in parts) + "]"
+    cols = ", ".join(f'"{f.name}"' for f in with_sort_key(SCHEMA))
+    con = duckdb_connect(memory_limit, spill_dir=raw_out + ".duckdb_tmp")
+    try:
+        con.execute(f"""
+        COPY (
+          SELECT {cols} FROM read_parquet({src})
+          WHERE seq IN (
+            SELECT MIN(seq) FROM (SELECT DISTINCT seq, name, lat, lon FROM read_parquet({src}))
+            GROUP BY lower(trim(coalesce(name, ''))), round(lat, 4), round(lon, 4)
+          )
+        ) TO {sql_str(raw_out)} (FORMAT PARQUET, COMPRESSION ZSTD)
+        """)
+        n_in = con.execute(f"SELECT COUNT(*) FROM read_parquet({src})").fetchone()[0]
+        n = con.execute(f"SELECT COUNT(*) FROM read_parquet({sql_str(raw_out)})").fetchone()[0]
+    finally:
+        con.close()
+    for p in parts:
+        os.remove(p)
+    print(f"[MERGE] parts={len(parts)}  rows={n:,}  dupe_rows_removed={n_in - n:,}  (duckdb, memory_limit={memory_limit})")
+    return n
 
 def main():
     ap = argparse.ArgumentParser(description="Belgium PBF -> polygon/multipolygon centroid cache (osmium)")
-    ap.add_argument("--pbf", required=True, help="belgium-latest.osm.pbf yolu")
+    ap.add_argument("--pbf", required=True, nargs="+",
+                    help="belgium-latest.osm.pbf yolu (birden çok: bölge başına çıktı, bkz. --out-dir)")
     ap.add_argument("--out", default="cache/be_poi_poly.parquet", help="Parquet çıktı yolu")
+    add_region_args(ap)
     ap.add_argument("--batch", type=int, default=50_000, help="Flush batch boyutu")
+    ap.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE, help="Nihai dosyada row-group boyutu")
+    ap.add_argument("--no-sort", action="store_true", help="Uzamsal sıralama yapma (PBF sırasıyla yaz)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Paralel işçi süreci sayısı (PBF tek okunur; centroid + yazım işçilere chunk'lar halinde dağıtılır)")
+    ap.add_argument("--count-filtered", action="store_true",
+                    help="C++ tarafında elenen area sayısını da raporla (ölçüm içindir, biraz yavaşlatır)")
+    ap.add_argument("--int-coords", action="store_true",
+                    help="Nihai dosyada lat/lon int32 sabit nokta (1e-7 derece) olarak saklanır (daha küçük dosya)")
+    add_low_memory_args(ap)
+    add_metrics_args(ap)
     args = ap.parse_args()
+    install_sinks(args)
+    if (args.workers > 1 or args.low_memory) and args.no_sort:
+        ap.error("--workers/--low-memory parçaları birleştirirken sıralar; --no-sort ile birlikte kullanılamaz")
+    if args.int_coords and args.no_sort:
+        ap.error("--int-coords finalize adımında uygulanır; --no-sort ile birlikte kullanılamaz")
+    if len(args.pbf) > 1 or args.out_dir:
+        build_regions(args, build, "polys", ["osm_type", "osm_id"], poly_keys, ORDER_BY.split(", "))
+    else:
+        build(args, args.pbf[0], args.out)
+
+def build(args, pbf, out):
+    """Tek PBF → tek polygon cache (out)."""
+    # rank_score / is_hospital finalize adımında hesaplanır (--no-sort çıktısında yok → sorguda canlı hesap)
+    out_schema = with_rank_columns(final_schema(SCHEMA, args.int_coords), rank_config_hash())
 
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
     print("[INFO] PBF okunuyor (areas), bu işlem tek seferlik…")
     t0 = time.time()
-    writer = pq.ParquetWriter(args.out, SCHEMA, compression="zstd")
+    memory_limit = args.memory_limit if args.low_memory else None
+    if args.workers > 1 or args.low_memory:
+        # tek okuma + tek konum indeksi (--low-memory'de dosya tabanlı); parçalar seq ile birleştirilir
+        idx = location_index(args)
+        if args.low_memory:
+            print(f"[LOW-MEMORY] node konumları: {idx}")
+        if args.workers > 1:
+            print(f"[WORKERS] {args.workers} işçi (okuma + area kurulumu ana süreçte, centroid/yazım işçilerde)")
+            filters, counts = native_key_filters(count="area" if args.count_filtered else None)
+            with Pool(args.workers) as pool:
+                h = AreaFeeder(pool, args.workers, out, chunk=args.batch)
+                try:
+                    h.apply_file(pbf, locations=True, idx=idx, filters=filters)
+                    parts = h.finish()
+                finally:
+                    remove_location_index(idx)
+            count_in = h.count_in
+        else:
+            parts = [part_path_for(out, 0)]
+            count_in, _, total = _area_worker((pbf, parts[0], args.batch, args.count_filtered, idx))
+            counts = {"total": total}
+        if args.low_memory:
+            count_out = dedupe_parts_duckdb(parts, raw_path_for(out), memory_limit)
+        else:
+            count_out = merge_parts(parts, raw_path_for(out))
+        finalize_cache(raw_path_for(out), out, out_schema, row_group_size=args.row_group_size, order_by=ORDER_BY,
+                       memory_limit=memory_limit, derived_sql=rank_columns_sql())
+    else:
+        # önce ham dosya (+hkey), sonra cat + Hilbert sırasıyla nihai dosya
+        write_path = out if args.no_sort else raw_path_for(out)
+        writer = pq.ParquetWriter(write_path, SCHEMA if args.no_sort else with_sort_key(SCHEMA), compression="zstd")
 
-    try:
-        h = PolyHandler(writer, out_path=args.out, batch_size=args.batch)
-        # areas oluşturmak için locations=True gerekli
-        h.apply_file(args.pbf, locations=True)
-        h.flush()
-    finally:
-        writer.close()
+        filters, counts = native_key_filters(count="area" if args.count_filtered else None)
+        try:
+            h = PolyHandler(writer, out_path=write_path, batch_size=args.batch)
+            # areas oluşturmak için locations=True gerekli; filtre area kurulumundan sonra uygulanır
+            # (etiketsiz outer way'ler multipolygon'a yine girer)
+            h.apply_file(pbf, locations=True, filters=filters)
+            h.flush()
+        finally:
+            writer.close()
+        if not args.no_sort:
+            finalize_cache(write_path, out, out_schema, row_group_size=args.row_group_size, order_by=ORDER_BY,
+                           derived_sql=rank_columns_sql())
+        count_in, count_out = h.count_in, h.count_out
 
     dt = time.time()-t0
-    size_mb = os.path.getsize(args.out)/1e6 if os.path.exists(args.out) else 0
-    print(f"[DONE] areas_read~{h.count_in:,}  rows={h.count_out:,}  file={size_mb:.1f} MB  time={dt/60:.1f} dk")
+    size_mb = os.path.getsize(out)/1e6 if os.path.exists(out) else 0
+    print(filter_report(count_in, counts))
+    print(f"[DONE] candidate_areas~{count_in:,}  rows={count_out:,}  file={size_mb:.1f} MB  time={dt/60:.1f} dk  "
+          f"{rss_report()}")
+    emit("done", builder="poi_polys", elapsed_s=round(dt, 3), read=count_in, matched=count_out,
+         read_per_s=round(count_in / max(dt, 1e-9), 1), matched_per_s=round(count_out / max(dt, 1e-9), 1),
+         file_mb=round(size_mb, 2), peak_rss_mb=peak_rss_mb())
 
 if __name__ == "__main__":
     main()
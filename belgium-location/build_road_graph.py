@@ -0,0 +1,203 @@
+# build_road_graph.py — PBF'teki highway way'lerinden yaya + araç yol ağı (CSR, NumPy .npy dosyaları)
+# Çıktı: cache/be_roads/ → nodes_lat/lon, cell_offsets (snap ızgarası), <mod>_offsets/targets/lengths/speeds, meta.json
+# Sorgu tarafı: road_graph.RoadGraph (app_duckdb --road-graph)
+import os, re, json, math, time, argparse
+from array import array
+import numpy as np
+import osmium as osm
+from road_graph import ROAD_GRAPH, MODES, SNAP_CELL_DEG, WALK_MPS, CSR_PARTS, haversine_np, graph_file
+from poi_cache_utils import add_low_memory_args, location_index, remove_location_index, rss_report, peak_rss_mb
+from profiling import emit, add_metrics_args, install_sinks
+
+# yayaların kullanabildiği yol türleri (otoyol/trunk hariç; foot=* ile açılıp kapanabilir)
+WALK_HIGHWAYS = {"footway", "path", "pedestrian", "living_street", "residential", "service", "unclassified",
+                 "tertiary", "tertiary_link", "secondary", "secondary_link", "primary", "primary_link",
+                 "track", "steps", "cycleway", "bridleway", "road", "corridor"}
+# araç: yol türü başına varsayılan hız (km/s); maxspeed varsa o kullanılır
+DRIVE_KPH = {"motorway": 120, "motorway_link": 60, "trunk": 90, "trunk_link": 50,
+             "primary": 70, "primary_link": 50, "secondary": 60, "secondary_link": 40,
+             "tertiary": 50, "tertiary_link": 40, "unclassified": 40, "residential": 30,
+             "living_street": 15, "service": 15, "road": 30}
+# Belçika bölgesel maxspeed kodları
+MAXSPEED_ZONES = {"BE:urban": 50, "BE-BRU:urban": 30, "BE:rural": 70, "BE-VLG:rural": 70, "BE-WAL:rural": 90,
+                  "BE:trunk": 120, "BE:motorway": 120, "BE:zone30": 30, "BE:zone": 30,
+                  "BE:living_street": 20, "BE:cyclestreet": 30, "walk": 6}
+NO_ACCESS = {"no", "private"}
+YES_ACCESS = {"yes", "designated", "permissive"}
+
+def parse_maxspeed(v, default):
+    if not v:
+        return default
+    if v in MAXSPEED_ZONES:
+        return MAXSPEED_ZONES[v]
+    m = re.match(r"\s*(\d+(?:\.\d+)?)\s*(mph)?", v)
+    if m and float(m[1]) > 0:
+        return float(m[1]) * (1.609 if m[2] else 1.0)
+    return default
+
+def classify(tags):
+    """(yaya, araç_ileri, araç_geri, araç_kmh) ya da yol değilse None."""
+    hw = tags.get("highway")
+    if hw is None or tags.get("area") == "yes":
+        return None
+    access, foot = tags.get("access"), tags.get("foot")
+    if foot in YES_ACCESS:
+        walk = hw not in ("motorway", "motorway_link")
+    else:
+        walk = hw in WALK_HIGHWAYS and foot not in NO_ACCESS and access not in NO_ACCESS
+    kph = DRIVE_KPH.get(hw)
+    drive = (kph is not None and access not in NO_ACCESS and tags.get("motor_vehicle") not in NO_ACCESS
+             and tags.get("motorcar") not in NO_ACCESS)
+    fwd = bwd = drive
+    if drive:
+        kph = parse_maxspeed(tags.get("maxspeed"), kph)
+        oneway = tags.get("oneway")
+        if oneway in ("yes", "1", "true") or (oneway is None and (hw in ("motorway", "motorway_link") or
+                                                                 tags.get("junction") in ("roundabout", "circular"))):
+            bwd = False
+        elif oneway == "-1":
+            fwd = False
+    if not walk and not drive:
+        return None
+    return walk, fwd, bwd, (kph if drive else 0.0)
+
+class RoadHandler(osm.SimpleHandler):
+    """highway way'lerinin node dizileri (OSM id + konum) düz dizilere; way başına yaya/araç bayrakları ve hız."""
+    def __init__(self):
+        super().__init__()
+        self.refs, self.lat, self.lon = array("q"), array("d"), array("d")
+        self.way_off = array("q", [0])
+        self.walk, self.fwd, self.bwd = array("b"), array("b"), array("b")
+        self.kph = array("f")
+        self.count_in = 0
+
+    def way(self, w):
+        self.count_in += 1
+        c = classify(w.tags)
+        if c is None or len(w.nodes) < 2:
+            return
+        nodes = w.nodes
+        if not all(n.location.valid() for n in nodes):
+            return
+        for n in nodes:
+            self.refs.append(n.ref)
+            self.lat.append(n.location.lat)
+            self.lon.append(n.location.lon)
+        self.way_off.append(len(self.refs))
+        walk, fwd, bwd, kph = c
+        self.walk.append(walk); self.fwd.append(fwd); self.bwd.append(bwd)
+        self.kph.append(kph)
+
+def build_edges(h):
+    """
+    Way'ler kavşaklarda (birden çok way'de geçen node) ve uçlarında bölünür; aradaki şekil node'ları
+    kenar uzunluğuna katılır. Dönüş: (düğüm lat, lon, osm id, kenar src, dst, uzunluk, way indeksi).
+    """
+    refs = np.frombuffer(h.refs, np.int64)
+    lat, lon = np.frombuffer(h.lat, np.float64), np.frombuffer(h.lon, np.float64)
+    off = np.frombuffer(h.way_off, np.int64)
+    way_of = np.repeat(np.arange(len(off) - 1), np.diff(off))
+
+    uniq, first, inv, cnt = np.unique(refs, return_index=True, return_inverse=True, return_counts=True)
+    is_node = cnt > 1
+    is_node[inv[off[:-1]]] = True          # way başı
+    is_node[inv[off[1:] - 1]] = True       # way sonu
+
+    seg = haversine_np(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    seg[off[1:-1] - 1] = 0.0               # bir way'in son node'u → sonraki way'in ilk node'u değil
+    cum = np.concatenate([[0.0], np.cumsum(seg)])
+
+    jp = np.flatnonzero(is_node[inv])
+    same = way_of[jp[:-1]] == way_of[jp[1:]]
+    a, b = jp[:-1][same], jp[1:][same]
+    dense = np.full(len(uniq), -1, np.int64)
+    dense[is_node] = np.arange(int(is_node.sum()))
+    src, dst = dense[inv[a]], dense[inv[b]]
+    keep = src != dst                      # tek kavşaklı kapalı way'ler (döngü) atılır
+    node_pos = first[is_node]
+    return (lat[node_pos], lon[node_pos], uniq[is_node],
+            src[keep], dst[keep], (cum[b] - cum[a])[keep], way_of[a][keep])
+
+def spatial_order(nlat, nlon, cell_deg):
+    """Düğümleri snap ızgarası hücresine göre sırala; hücre başına başlangıç offset'leri (satır-ana düzen)."""
+    lat0 = math.floor(float(nlat.min()) / cell_deg) * cell_deg
+    lon0 = math.floor(float(nlon.min()) / cell_deg) * cell_deg
+    cy = np.floor((nlat - lat0) / cell_deg).astype(np.int64)
+    cx = np.floor((nlon - lon0) / cell_deg).astype(np.int64)
+    ny, nx = int(cy.max()) + 1, int(cx.max()) + 1
+    cell = cy * nx + cx
+    order = np.argsort(cell, kind="stable")
+    cell_off = np.concatenate([[0], np.cumsum(np.bincount(cell, minlength=ny * nx))]).astype(np.int64)
+    grid = {"cell_deg": cell_deg, "cell_lat0": lat0, "cell_lon0": lon0, "cell_ny": ny, "cell_nx": nx}
+    return order, cell_off, grid
+
+def to_csr(n, src, dst, length, speed):
+    order = np.lexsort((dst, src))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=n))]).astype(np.int64)
+    return (offsets, dst[order].astype(np.int32), length[order].astype(np.float32),
+            speed[order].astype(np.float32))
+
+def main():
+    ap = argparse.ArgumentParser(description="Belgium PBF -> yaya + araç yol ağı (CSR, .npy)")
+    ap.add_argument("--pbf", required=True, help="belgium-latest.osm.pbf yolu")
+    ap.add_argument("--out", default=ROAD_GRAPH, help="Çıktı dizini")
+    ap.add_argument("--cell-deg", type=float, default=SNAP_CELL_DEG, help="Snap ızgarası hücre boyu (derece)")
+    add_low_memory_args(ap)
+    add_metrics_args(ap)
+    args = ap.parse_args()
+    install_sinks(args)
+
+    os.makedirs(args.out, exist_ok=True)
+    print("[INFO] PBF okunuyor (highway way'leri)…")
+    t0 = time.time()
+    idx = location_index(args)
+    try:
+        h = RoadHandler()
+        h.apply_file(args.pbf, locations=True, idx=idx, filters=[osm.filter.KeyFilter("highway")])
+    finally:
+        remove_location_index(idx)
+    print(f"[WAYS] highway={h.count_in:,}  kullanılan={len(h.walk):,}  node_ref={len(h.refs):,}  "
+          f"time={time.time()-t0:.1f}s")
+
+    nlat, nlon, nid, src, dst, length, way = build_edges(h)
+    order, cell_off, grid = spatial_order(nlat, nlon, args.cell_deg)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    src, dst = rank[src], rank[dst]
+    n = len(order)
+
+    walk = np.frombuffer(h.walk, np.int8)[way].astype(bool)
+    fwd, bwd = np.frombuffer(h.fwd, np.int8)[way].astype(bool), np.frombuffer(h.bwd, np.int8)[way].astype(bool)
+    mps = np.frombuffer(h.kph, np.float32)[way].astype(np.float64) / 3.6
+    edges = {
+        # yaya: çift yönlü, sabit hız
+        "walk": (np.concatenate([src[walk], dst[walk]]), np.concatenate([dst[walk], src[walk]]),
+                 np.concatenate([length[walk]] * 2), np.full(2 * int(walk.sum()), WALK_MPS)),
+        # araç: oneway'e göre yön, maxspeed / yol türü hızı
+        "drive": (np.concatenate([src[fwd], dst[bwd]]), np.concatenate([dst[fwd], src[bwd]]),
+                  np.concatenate([length[fwd], length[bwd]]), np.concatenate([mps[fwd], mps[bwd]])),
+    }
+
+    np.save(graph_file(args.out, "nodes_lat"), nlat[order])
+    np.save(graph_file(args.out, "nodes_lon"), nlon[order])
+    np.save(graph_file(args.out, "nodes_osm_id"), nid[order])
+    np.save(graph_file(args.out, "cell_offsets"), cell_off)
+    n_edges = {}
+    for mode in MODES:
+        for part, arr in zip(CSR_PARTS, to_csr(n, *edges[mode])):
+            np.save(graph_file(args.out, f"{mode}_{part}"), arr)
+        n_edges[mode] = len(edges[mode][0])
+    meta = grid | {"n_nodes": n, "n_edges": n_edges, "walk_mps": WALK_MPS, "built_at": time.time(),
+                   "pbf": os.path.basename(args.pbf)}
+    with open(os.path.join(args.out, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=1)
+
+    size_mb = sum(os.path.getsize(os.path.join(args.out, x)) for x in os.listdir(args.out)) / 1e6
+    print(f"[DONE] düğüm={n:,}  kenar: " + "  ".join(f"{m}={c:,}" for m, c in n_edges.items()) +
+          f"  dizin={size_mb:.1f} MB  time={(time.time()-t0)/60:.1f} dk  {rss_report()}")
+    dt = time.time() - t0
+    emit("done", builder="road_graph", elapsed_s=round(dt, 3), ways_read=h.count_in, nodes=n, edges=n_edges,
+         nodes_per_s=round(n / max(dt, 1e-9), 1), dir_mb=round(size_mb, 2), peak_rss_mb=peak_rss_mb())
+
+if __name__ == "__main__":
+    main()
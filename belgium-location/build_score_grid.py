@@ -0,0 +1,159 @@
+# build_score_grid.py — Belçika geneli puan rasterı: her ~100 m hücre için kategori puanları + genel puan
+# Çıktı: <out>.npy (uint8, puan*10; 255 = veri yok; np.load(mmap_mode="r") ile açılır) + <out>.json (ızgara tanımı)
+# Sorgu tarafı: app_duckdb.ScoreGrid / grid_score() (sabit zamanlı hücre okuma veya bilineer ara değer)
+# Not: d_min burada düz mesafedir; near_* tabloları (build_nearest_poi.py) varken analyze()/toplu mod yürüme
+# ağı mesafesi kullanır, raster bu yüzden o noktalarda yakınlık puanını biraz yüksek verebilir.
+import os, json, math, time, argparse
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+import duckdb
+import app_duckdb as app
+from poi_cache_utils import rss_report, peak_rss_mb
+from profiling import emit, add_metrics_args, install_sinks
+
+BE_BBOX = (49.49, 2.54, 51.51, 6.41)   # lat_min, lon_min, lat_max, lon_max
+CELL_M = 100
+TILE = 256                             # işçi başına iş: TILE x TILE hücre
+EARTH_R = 6371000.0
+
+def grid_spec(bbox, cell_m):
+    """Düzenli enlem/boylam ızgarası; boylam adımı bbox ortasındaki enleme göre (~cell_m x cell_m hücre)."""
+    lat_min, lon_min, lat_max, lon_max = bbox
+    dlat = cell_m / 111320.0
+    dlon = cell_m / (111320.0 * math.cos(math.radians((lat_min + lat_max) / 2)))
+    return {"lat0": lat_min, "lon0": lon_min, "dlat": dlat, "dlon": dlon, "cell_m": cell_m,
+            "rows": int(math.ceil((lat_max - lat_min) / dlat)), "cols": int(math.ceil((lon_max - lon_min) / dlon))}
+
+def load_pois(nodes_path, polys_path):
+    """Kategori başına (lat, lon, is_hospital) NumPy dizileri (int32 koordinatlı cache'ler dahil)."""
+    df = duckdb.connect().execute(f"""
+        SELECT CAST(cat AS VARCHAR) AS cat, CAST(lat AS DOUBLE) AS lat, CAST(lon AS DOUBLE) AS lon,
+               CAST(hosp_pre AS BOOLEAN) AS is_hospital
+        FROM ({app._poi_source_sql(nodes_path, polys_path)})
+    """).df()
+    out = {}
+    for cat in app.CATS:
+        sub = df[df["cat"] == cat]
+        out[cat] = (sub["lat"].to_numpy(), sub["lon"].to_numpy(), sub["is_hospital"].to_numpy())
+    return out
+
+def score_tile(pois, grid, radii, i0, j0, h, w):
+    """
+    (katman, h, w) uint8 puanlar (katmanlar: CATS sırası + overall). POI başına yarıçap penceresindeki
+    hücre merkezlerine vektörel haversine uygulanır; n_total / d_min / has_hospital birikir ve
+    app_duckdb.calc_category_score_vec ile (analyze_batch ile aynı formül) puana çevrilir.
+    """
+    lat_c = grid["lat0"] + (np.arange(i0, i0 + h) + 0.5) * grid["dlat"]
+    lon_c = grid["lon0"] + (np.arange(j0, j0 + w) + 0.5) * grid["dlon"]
+    cos_c = np.cos(np.radians(lat_c))[:, None]
+    out = np.empty((len(app.CATS) + 1, h, w), np.uint8)
+    overall = np.zeros(h * w)
+    for k, cat in enumerate(app.CATS):
+        r = radii[cat]
+        plat, plon, phosp = pois[cat]
+        dlat, dlon = app.meters_to_deg_latlon(max(abs(lat_c[0]), abs(lat_c[-1])), r)
+        sel = ((plat >= lat_c[0] - dlat) & (plat <= lat_c[-1] + dlat) &
+               (plon >= lon_c[0] - dlon) & (plon <= lon_c[-1] + dlon))
+        n = np.zeros((h, w), np.int32)
+        dmin = np.full((h, w), np.inf)
+        hosp = np.zeros((h, w), bool)
+        wi = int(math.ceil(r / (grid["dlat"] * 111320.0))) + 1
+        for la, lo, ho in zip(plat[sel], plon[sel], phosp[sel]):
+            ci = math.floor((la - lat_c[0]) / grid["dlat"])
+            cj = math.floor((lo - lon_c[0]) / grid["dlon"])
+            wj = int(math.ceil(r / (grid["dlon"] * 111320.0 * max(0.1, math.cos(math.radians(la)))))) + 1
+            a0, a1 = max(0, ci - wi), min(h, ci + wi + 1)
+            b0, b1 = max(0, cj - wj), min(w, cj + wj + 1)
+            if a0 >= a1 or b0 >= b1:
+                continue
+            s1 = np.sin(np.radians(la - lat_c[a0:a1]) / 2)[:, None]
+            s2 = np.sin(np.radians(lo - lon_c[b0:b1]) / 2)[None, :]
+            d = 2 * EARTH_R * np.arcsin(np.sqrt(s1 * s1 + cos_c[a0:a1] * math.cos(math.radians(la)) * s2 * s2))
+            m = d <= r
+            n[a0:a1, b0:b1] += m
+            np.minimum(dmin[a0:a1, b0:b1], np.where(m, d, np.inf), out=dmin[a0:a1, b0:b1])
+            if ho:
+                hosp[a0:a1, b0:b1] |= m
+        d_min = pd.Series(dmin.ravel()).replace(np.inf, np.nan)
+        score = app.calc_category_score_vec(cat, pd.Series(n.ravel()), d_min, pd.Series(hosp.ravel())).to_numpy()
+        overall += app.OVERALL_WEIGHTS.get(cat, 0.0) * score
+        out[k] = np.round(score * app.SCORE_GRID_SCALE).reshape(h, w)
+    out[-1] = np.round(overall * app.SCORE_GRID_SCALE).reshape(h, w)
+    return out
+
+# işçi süreçleri: POI dizileri süreç başına bir kez (initializer) yüklenir
+_W = {}
+
+def _init_worker(pois, grid, radii):
+    _W.update(pois=pois, grid=grid, radii=radii)
+
+def _tile_worker(job):
+    i0, j0, h, w = job
+    return i0, j0, score_tile(_W["pois"], _W["grid"], _W["radii"], i0, j0, h, w)
+
+def main():
+    ap = argparse.ArgumentParser(description="Node + polygon cache -> ülke geneli puan rasterı (.npy + .json)")
+    ap.add_argument("--nodes", default="cache/be_poi.parquet")
+    ap.add_argument("--polys", default="cache/be_poi_poly.parquet")
+    ap.add_argument("--merged", default=app.MERGED_CACHE, help="build_poi_merged.py çıktısı ('' ile kapalı)")
+    ap.add_argument("--out", default=app.SCORE_GRID, help="Çıktı .npy yolu (yanına .json ızgara tanımı yazılır)")
+    ap.add_argument("--cell-m", type=float, default=CELL_M, help="Hücre boyu (metre)")
+    ap.add_argument("--bbox", default=",".join(map(str, BE_BBOX)), help="lat_min,lon_min,lat_max,lon_max")
+    ap.add_argument("--radius", type=int, default=app.DEFAULT_RADIUS_M)
+    ap.add_argument("--radius-from-d0", action="store_true", help="Her kategori için yarıçap = SCORING[cat]['D0']")
+    ap.add_argument("--tile", type=int, default=TILE, help="İş parçası boyu (hücre)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Paralel işçi süreci sayısı")
+    add_metrics_args(ap)
+    args = ap.parse_args()
+    install_sinks(args)
+
+    nodes = args.nodes if os.path.exists(args.nodes) else None
+    polys = args.polys if os.path.exists(args.polys) else None
+    if not nodes and not polys:
+        raise SystemExit("Ne node ne polygon cache bulundu.")
+    nodes, polys = app.resolve_sources(nodes, polys, args.merged)
+    grid = grid_spec(tuple(float(x) for x in args.bbox.split(",")), args.cell_m)
+    radii = {c: (app.SCORING[c]["D0"] if args.radius_from_d0 else args.radius) for c in app.CATS}
+
+    t0 = time.time()
+    pois = load_pois(nodes, polys)
+    print(f"[POI] {sum(len(v[0]) for v in pois.values()):,} nokta  time={time.time()-t0:.1f}s")
+
+    rows, cols, T = grid["rows"], grid["cols"], args.tile
+    jobs = [(i, j, min(T, rows - i), min(T, cols - j)) for i in range(0, rows, T) for j in range(0, cols, T)]
+    layers = list(app.CATS) + ["overall"]
+    print(f"[GRID] {rows:,} x {cols:,} = {rows*cols:,} hücre  ({args.cell_m:g} m)  parça={len(jobs):,}  işçi={args.workers}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    tmp = args.out + ".tmp.npy"
+    arr = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=(len(layers), rows, cols))
+    arr[:] = app.SCORE_GRID_NODATA
+    t1, done = time.time(), 0
+    with Pool(args.workers, initializer=_init_worker, initargs=(pois, grid, radii)) as pool:
+        for n, (i0, j0, tile) in enumerate(pool.imap_unordered(_tile_worker, jobs), 1):
+            arr[:, i0:i0 + tile.shape[1], j0:j0 + tile.shape[2]] = tile
+            done += tile.shape[1] * tile.shape[2]
+            if n % 50 == 0 or n == len(jobs):
+                dt = time.time() - t1
+                print(f"[TILE] {n:,}/{len(jobs):,}  {done:,} hücre  {done/dt:,.0f} hücre/sn")
+                emit("progress", builder="score_grid", tiles=n, tiles_total=len(jobs), cells=done,
+                     cells_per_s=round(done / max(dt, 1e-9), 1), peak_rss_mb=peak_rss_mb())
+    arr.flush()
+    del arr
+    os.replace(tmp, args.out)
+
+    meta = grid | {"layers": layers, "scale": app.SCORE_GRID_SCALE, "nodata": app.SCORE_GRID_NODATA,
+                   "radii": radii, "config": app.scoring_config_hash(),
+                   "sources": app.files_signature((nodes, polys)), "built_at": time.time()}
+    with open(app.score_grid_meta_path(args.out), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=1)
+    dt = time.time() - t1
+    print(f"[DONE] {args.out}  {rows*cols:,} hücre  {rows*cols/dt:,.0f} hücre/sn  "
+          f"size={os.path.getsize(args.out)/1e6:.1f} MB  time={time.time()-t0:.1f}s  {rss_report()}")
+    emit("done", builder="score_grid", elapsed_s=round(time.time() - t0, 3), cells=rows * cols,
+         cells_per_s=round(rows * cols / max(dt, 1e-9), 1), file_mb=round(os.path.getsize(args.out) / 1e6, 2),
+         peak_rss_mb=peak_rss_mb())
+
+if __name__ == "__main__":
+    main()
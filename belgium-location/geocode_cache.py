@@ -0,0 +1,224 @@
+# geocode_cache.py — Nominatim önünde kalıcı geocode cache'i (SQLite, süreçler arası paylaşımlı)
+# Toplu ön-ısıtma: python geocode_cache.py --prewarm adresler.csv --column address
+import os, re, csv, time, sqlite3, hashlib, argparse, threading, unicodedata
+
+DEFAULT_DB = "./cache/geocode.sqlite"
+DEFAULT_TTL_S = 180 * 24 * 3600     # bulunan adresler: 180 gün
+NEGATIVE_TTL_S = 7 * 24 * 3600      # bulunamayanlar: 7 gün (Nominatim'i boşuna tekrar yormamak için)
+USER_AGENT = "be-poi-cache/1.3"
+
+def normalize_address(address):
+    """Cache anahtarı: küçük harf, aksansız, noktalama → boşluk, tek boşluk.
+    'Tervuursesteenweg 147,  3001 Heverlee' ile 'tervuursesteenweg 147 3001 HEVERLEE' aynı anahtarı verir."""
+    s = unicodedata.normalize("NFKD", str(address or ""))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    s = re.sub(r"[^\w]+", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+def address_keys(street, housenumber, postcode=None, city=None):
+    """Çevrimdışı adres indeksi anahtarları: 'sokak|no|posta kodu' ve 'sokak|no|şehir'.
+    build_address_index.py (yazım) ve app_duckdb.LocalGeocoder (arama) aynı fonksiyonu kullanır."""
+    s, n = normalize_address(street), normalize_address(housenumber)
+    if not s or not n:
+        return []
+    keys = []
+    if postcode and normalize_address(postcode):
+        keys.append(f"{s}|{n}|{normalize_address(postcode)}")
+    if city and normalize_address(city):
+        keys.append(f"{s}|{n}|{normalize_address(city)}")
+    return keys
+
+def key_hash(key):
+    # süreçten bağımsız 64-bit anahtar (Python hash() her süreçte farklı tohumlanır)
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+_COUNTRY = {"belgium", "belgique", "belgie", "belgien", "be"}
+
+def address_key_candidates(address):
+    """
+    Serbest adres metninden olası indeks anahtarları (en olası önce). Belçika biçimleri:
+    'Tervuursesteenweg 147, 3001 Heverlee' (sokak-no) ve '16 Rue de la Loi, 1000 Bruxelles' (no-sokak);
+    posta kodu yoksa no'dan sonrası şehir kabul edilir.
+    """
+    toks = normalize_address(address).split()
+    while toks and toks[-1] in _COUNTRY:
+        toks.pop()
+    # posta kodu: sokak+no'dan sonra gelen son 4 haneli token
+    pc_i = next((i for i in range(len(toks) - 1, 1, -1) if re.fullmatch(r"\d{4}", toks[i])), None)
+    head, tail = (toks[:pc_i], toks[pc_i + 1:]) if pc_i is not None else (toks, [])
+    pc = toks[pc_i] if pc_i is not None else None
+    num_i = next((i for i, t in enumerate(head) if t[0].isdigit()), None)
+    if num_i is None:
+        return []
+    out = []
+    def add(street, num, rest):
+        for n in dict.fromkeys([" ".join(num), "".join(num)]):
+            for k in address_keys(" ".join(street), n, pc, " ".join(rest) if rest else None):
+                if k not in out:
+                    out.append(k)
+    if num_i > 0:
+        # sokak-no[-ek]: '147 a' / '147a', posta kodu yoksa ek'ten sonrası şehir
+        add(head[:num_i], head[num_i:num_i + 1], tail or head[num_i + 1:])
+        if num_i + 1 < len(head) and len(head[num_i + 1]) == 1:
+            add(head[:num_i], head[num_i:num_i + 2], tail or head[num_i + 2:])
+    else:
+        # no-sokak: posta kodu yoksa sokak/şehir sınırı belirsiz → tüm bölünmeler denenir
+        rest = head[1:]
+        if pc is not None:
+            add(rest, head[:1], tail)
+        else:
+            for k in range(len(rest), 0, -1):
+                add(rest[:k], head[:1], rest[k:])
+    return out
+
+class NominatimGeocoder:
+    """Tek Nominatim istemcisi + RateLimiter (süreç boyunca paylaşılır). Bulamazsa None döner."""
+    def __init__(self, user_agent=USER_AGENT, min_delay_seconds=1.0):
+        from geopy.geocoders import Nominatim
+        from geopy.extra.rate_limiter import RateLimiter
+        self._geocode = RateLimiter(Nominatim(user_agent=user_agent).geocode, min_delay_seconds=min_delay_seconds)
+        self._lock = threading.Lock()
+
+    def __call__(self, address):
+        with self._lock:  # RateLimiter thread-safe değil
+            loc = self._geocode(address)
+        return (loc.latitude, loc.longitude, loc.address) if loc else None
+
+class StubGeocoder:
+    """Çevrimdışı test/yük testi için: address,lat,lon[,display] CSV'si ya da sözlükten cevap verir."""
+    def __init__(self, source=None, delay_s=0.0):
+        self.delay_s = delay_s
+        self.calls = 0
+        self.table = {}
+        if isinstance(source, dict):
+            for addr, val in source.items():
+                self.table[normalize_address(addr)] = tuple(val) if len(val) == 3 else (val[0], val[1], addr)
+        elif source:
+            with open(source, newline="", encoding="utf-8") as f:
+                for r in csv.DictReader(f):
+                    self.table[normalize_address(r["address"])] = (
+                        float(r["lat"]), float(r["lon"]), r.get("display") or r["address"])
+
+    def __call__(self, address):
+        self.calls += 1
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        return self.table.get(normalize_address(address))
+
+class GeocodeCache:
+    """
+    Normalize edilmiş adres → (lat, lon, display) SQLite cache'i. TTL'li; bulunamayan adresler de
+    (negatif sonuç) daha kısa TTL ile saklanır. WAL + busy_timeout ile aynı dosya birden fazla süreç
+    tarafından güvenle paylaşılır; her thread kendi bağlantısını kullanır.
+    """
+    def __init__(self, path=DEFAULT_DB, geocoder=None, ttl_s=DEFAULT_TTL_S, negative_ttl_s=NEGATIVE_TTL_S):
+        self.path = path
+        self._geocoder = geocoder
+        self.ttl_s, self.negative_ttl_s = ttl_s, negative_ttl_s
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.negative_hits = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        con = self._con()
+        con.execute("""CREATE TABLE IF NOT EXISTS geocode (
+            key TEXT PRIMARY KEY, query TEXT, lat REAL, lon REAL, display TEXT,
+            found INTEGER NOT NULL, ts REAL NOT NULL)""")
+        con.commit()
+
+    @property
+    def geocoder(self):
+        # Nominatim istemcisi ilk cache miss'te kurulur (tam hit'li çalışmalarda ağ/geopy gerekmez)
+        if self._geocoder is None:
+            self._geocoder = NominatimGeocoder()
+        return self._geocoder
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30.0)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA busy_timeout=30000")
+            self._local.con = con
+        return con
+
+    def lookup(self, address):
+        """Cache'te geçerli kayıt varsa (found, lat, lon, display), yoksa None."""
+        row = self._con().execute(
+            "SELECT found, lat, lon, display, ts FROM geocode WHERE key=?", (normalize_address(address),)
+        ).fetchone()
+        if row is None:
+            return None
+        ttl = self.ttl_s if row[0] else self.negative_ttl_s
+        if time.time() - row[4] > ttl:
+            return None
+        return row[:4]
+
+    def store(self, address, result):
+        lat, lon, disp = result if result else (None, None, None)
+        con = self._con()
+        con.execute("INSERT OR REPLACE INTO geocode (key, query, lat, lon, display, found, ts) VALUES (?,?,?,?,?,?,?)",
+                    (normalize_address(address), address, lat, lon, disp, 1 if result else 0, time.time()))
+        con.commit()
+
+    def geocode(self, address):
+        """(lat, lon, display); adres bulunamazsa RuntimeError (app_duckdb.geocode ile aynı)."""
+        row = self.lookup(address)
+        if row is not None:
+            with self._lock:
+                self.hits += 1
+                self.negative_hits += 0 if row[0] else 1
+            if not row[0]:
+                raise RuntimeError("Adres geocode edilemedi.")
+            return row[1], row[2], row[3]
+        with self._lock:
+            self.misses += 1
+        result = self.geocoder(address)
+        self.store(address, result)
+        if not result:
+            raise RuntimeError("Adres geocode edilemedi.")
+        return result
+
+    def stats(self):
+        n = self._con().execute("SELECT COUNT(*), COALESCE(SUM(found), 0) FROM geocode").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "negative_hits": self.negative_hits,
+                "entries": n[0], "entries_found": n[1]}
+
+    def prewarm(self, addresses):
+        """Adres listesini cache'e alır; zaten geçerli olanlar atlanır. (yeni, mevcut, bulunamayan) döner."""
+        new = existing = failed = 0
+        for addr in addresses:
+            if not addr or not str(addr).strip():
+                continue
+            if self.lookup(addr) is not None:
+                existing += 1
+                continue
+            try:
+                self.geocode(addr)
+                new += 1
+            except RuntimeError:
+                failed += 1
+        return new, existing, failed
+
+def read_addresses(csv_path, column="address"):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            yield r.get(column)
+
+def main():
+    ap = argparse.ArgumentParser(description="Geocode cache'ini CSV'deki adreslerle ön-ısıt.")
+    ap.add_argument("--prewarm", required=True, help="Adres CSV'si")
+    ap.add_argument("--column", default="address", help="Adres kolonu adı")
+    ap.add_argument("--db", default=DEFAULT_DB, help="SQLite cache yolu")
+    ap.add_argument("--stub", help="Çevrimdışı: address,lat,lon CSV'sinden cevap veren stub geocoder")
+    args = ap.parse_args()
+
+    geocoder = StubGeocoder(args.stub) if args.stub else None
+    cache = GeocodeCache(args.db, geocoder=geocoder)
+    t0 = time.time()
+    new, existing, failed = cache.prewarm(read_addresses(args.prewarm, args.column))
+    print(f"[PREWARM] yeni={new:,}  mevcut={existing:,}  bulunamadı={failed:,}  süre={time.time()-t0:.1f}s")
+    print(f"[PREWARM] {cache.stats()}")
+
+if __name__ == "__main__":
+    main()
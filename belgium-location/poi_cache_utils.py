@@ -0,0 +1,524 @@
+# poi_cache_utils.py — builder'lar için ortak son-işlem: uzamsal sıralama (Hilbert) + row-group ayarı
+import os, sys, time, math, struct
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import duckdb
+from profiling import emit
+
+# Küresel grid üzerinde Hilbert anahtarı: boylam -180..180, enlem -90..90 → 2^ORDER x 2^ORDER hücre
+HILBERT_ORDER = 24          # ~2.4 m x 1.2 m hücre; sıralama anahtarı için yeterince ince
+ROW_GROUP_SIZE = 4_096      # küçük row-group → lat/lon min/max istatistikleri daha dar, daha çok atlanır
+# Tile (karo) grid'i: aynı Hilbert eğrisinin kaba seviyesi → 2^14 hücre (~1.5 km x 1.2 km, 50°N civarı)
+TILE_ORDER = 14
+TILE_SHIFT = 2 * (HILBERT_ORDER - TILE_ORDER)
+# düşük kardinaliteli etiket kolonları (cat, amenity, shop, …): Arrow dictionary → okuyan taraf her satır için
+# string değil küçük bir tamsayı indeks çözer
+DICT_STR = pa.dictionary(pa.int32(), pa.string())
+# --int-coords: lat/lon int32 sabit noktalı (1e-7 derece ≈ 1 cm) saklanır
+COORD_SCALE = 10_000_000
+
+def hilbert_key(lat, lon, order=HILBERT_ORDER):
+    """lat/lon dizileri için vektörel Hilbert indeksi (int64). Aynı grid kökü kullanıldığı için
+    kaba seviyedeki indeks = ince indeks >> 2*(order - kaba_order)."""
+    n = 1 << order
+    lat = np.asarray(lat, dtype=np.float64); lon = np.asarray(lon, dtype=np.float64)
+    x = np.clip(((lon + 180.0) / 360.0 * n).astype(np.int64), 0, n - 1)
+    y = np.clip(((lat + 90.0) / 180.0 * n).astype(np.int64), 0, n - 1)
+    d = np.zeros(x.shape, dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # çeyrek döndürme
+        flip = (~ry) & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return d
+
+def tile_of(hkey):
+    # Hilbert'in hiyerarşik özelliği: kaba hücre indeksi = ince indeksin üst bitleri
+    return np.asarray(hkey, dtype=np.int64) >> TILE_SHIFT
+
+def tiles_for_circle(lat, lon, radius_m, order=TILE_ORDER):
+    """Arama dairesiyle kesişen tile id'leri (sıralı numpy int64 dizi)."""
+    n = 1 << order
+    dlat = radius_m / 111320.0
+    dlon = radius_m / (111320.0 * max(0.1, math.cos(math.radians(lat))))
+    cw, ch = 360.0 / n, 180.0 / n
+    x0 = max(0, int((lon - dlon + 180.0) / cw)); x1 = min(n - 1, int((lon + dlon + 180.0) / cw))
+    y0 = max(0, int((lat - dlat + 90.0) / ch)); y1 = min(n - 1, int((lat + dlat + 90.0) / ch))
+    xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+    xs, ys = xs.ravel(), ys.ravel()
+    # hücre dikdörtgeninin merkeze en yakın noktası daire içinde mi (eşdikdörtgen yaklaşım, kenar payı %1)
+    lon_lo, lat_lo = xs * cw - 180.0, ys * ch - 90.0
+    near_lon = np.clip(lon, lon_lo, lon_lo + cw); near_lat = np.clip(lat, lat_lo, lat_lo + ch)
+    dy = (near_lat - lat) * 111320.0
+    dx = (near_lon - lon) * 111320.0 * max(0.1, math.cos(math.radians(lat)))
+    keep = np.hypot(dx, dy) <= radius_m * 1.01
+    return np.unique(hilbert_key(lat_lo[keep] + ch / 2, lon_lo[keep] + cw / 2, order))
+
+def sql_str(value):
+    # SQL metin sabiti (dosya yolları vb.): tek tırnaklar ikilenir
+    return "'" + str(value).replace("'", "''") + "'"
+
+def manifest_path_for(out_path):
+    return out_path + ".tiles.parquet"
+
+def write_tile_manifest(out_path):
+    """(cat, tile) → (row_start, row_count) manifest'i; dosya cat + tile sırasında olduğu için her çift tek bir satır aralığıdır."""
+    con = duckdb.connect()
+    try:
+        con.execute(f"""
+        COPY (
+          SELECT cat, tile, MIN(file_row_number) AS row_start, COUNT(*) AS row_count
+          FROM read_parquet({sql_str(out_path)}, file_row_number=true)
+          GROUP BY cat, tile ORDER BY row_start
+        ) TO {sql_str(manifest_path_for(out_path))} (FORMAT PARQUET)
+        """)
+        n = con.execute(f"SELECT COUNT(*) FROM read_parquet({sql_str(manifest_path_for(out_path))})").fetchone()[0]
+    finally:
+        con.close()
+    return n
+
+def final_schema(schema, int_coords=False):
+    # nihai dosya şeması: --int-coords'ta lat/lon int32 (ham dosyalar her zaman float64 derece)
+    if not int_coords:
+        return schema
+    return pa.schema([pa.field(f.name, pa.int32()) if f.name in ("lat", "lon") else f for f in schema])
+
+def has_int_coords(schema):
+    return pa.types.is_integer(schema.field("lat").type)
+
+# build-time sıralama skoru + hastane bayrağı: (POI, kategori) satırı başına, sadece POI'nin etiketlerine bağlı.
+# Değerler poi_rank.rank_columns_sql() ile hesaplanır; SCORES özeti şema metadata'sında RANK_STAMP_KEY altında.
+RANK_FIELDS = (pa.field("rank_score", pa.int16()), pa.field("is_hospital", pa.int8()))
+RANK_STAMP_KEY = b"poi_rank_config"
+
+def with_rank_columns(schema, stamp):
+    for f in RANK_FIELDS:
+        schema = schema.append(f)
+    return schema.with_metadata({**(schema.metadata or {}), RANK_STAMP_KEY: stamp.encode("utf-8")})
+
+def has_rank_columns(schema):
+    return all(f.name in schema.names for f in RANK_FIELDS)
+
+# build_poi_merged.py çıktısının metadata'sında: hangi node/polygon cache'lerinden üretildiği (JSON, mutlak yollar)
+MERGED_SOURCES_KEY = b"poi_merged_sources"
+
+def batch_table(batch, schema):
+    """Kolon listeleri (dict) → şemadaki pyarrow tablosu; tile ve (şemada varsa) hkey lat/lon'dan hesaplanır."""
+    hkey = hilbert_key(np.asarray(batch["lat"], dtype=np.float64), np.asarray(batch["lon"], dtype=np.float64))
+    cols = dict(batch, tile=tile_of(hkey))
+    if "hkey" in schema.names:
+        cols["hkey"] = hkey
+    return pa.table(cols, schema=schema)
+
+def conform(table, schema):
+    """Tabloyu nihai şemaya getirir: dictionary kolonlar kodlanır, float derece → int32 (--int-coords)."""
+    cols = []
+    for f in schema:
+        c = table[f.name]
+        if pa.types.is_dictionary(f.type):
+            if not pa.types.is_dictionary(c.type):
+                c = pc.dictionary_encode(c.cast(f.type.value_type))
+        elif f.name in ("lat", "lon") and pa.types.is_integer(f.type) and pa.types.is_floating(c.type):
+            c = pc.round(pc.multiply(c, float(COORD_SCALE)))
+        cols.append(c.cast(f.type))
+    return pa.Table.from_arrays(cols, schema=schema)
+
+def plain(table):
+    """conform'un tersi: dictionary kolonlar düz string, int32 lat/lon float64 derece (sıralama/birleştirme için)."""
+    cols = []
+    for f in table.schema:
+        c = table[f.name]
+        if pa.types.is_dictionary(f.type):
+            c = c.cast(f.type.value_type)
+        elif f.name in ("lat", "lon") and pa.types.is_integer(f.type):
+            c = pc.divide(c.cast(pa.float64()), float(COORD_SCALE))
+        cols.append(c)
+    return pa.Table.from_arrays(cols, names=table.column_names)
+
+def with_sort_key(schema):
+    # ham (sıralanmamış) dosya şeması: nihai şema + hkey
+    return schema.append(pa.field("hkey", pa.int64()))
+
+def raw_path_for(out_path):
+    return out_path + ".raw.parquet"
+
+def part_path_for(out_path, worker):
+    # --workers modunda işçi başına ham parça
+    return out_path + f".part{worker:03d}.parquet"
+
+def duckdb_connect(memory_limit=None, spill_dir=None):
+    """memory_limit verilirse (--low-memory) sıralama/gruplama o sınırda kalır, fazlası spill_dir'e taşar."""
+    con = duckdb.connect()
+    if memory_limit:
+        con.execute(f"SET memory_limit={sql_str(memory_limit)}")
+        con.execute("SET preserve_insertion_order=false")
+        if spill_dir:
+            con.execute(f"SET temp_directory={sql_str(spill_dir)}")
+    return con
+
+def finalize_cache(raw_path, out_path, schema, row_group_size=ROW_GROUP_SIZE, order_by="cat, hkey", memory_limit=None,
+                   derived_sql=None):
+    """
+    Ham dosyayı cat + Hilbert sırasına göre yeniden yazar: aynı kategorideki yakın POI'ler aynı
+    row-group'ta toplanır, böylece lat/lon BETWEEN ve cat='…' filtreleri min/max istatistikleriyle
+    çoğu row-group'u atlar. Sıralama DuckDB'de (disk taşmalı), yazım pyarrow ile (nihai şema korunur).
+    derived_sql: ham kolonlardan türetilen ek kolonlar ("ifade AS ad, ..."; ör. rank_score / is_hospital).
+    """
+    t0 = time.time()
+    tmp_out = out_path + ".tmp"
+    cols = ", ".join(f'"{f.name}"' for f in schema)
+    # raw_path: tek ham dosya ya da --workers modundaki parça listesi
+    raw_paths = [raw_path] if isinstance(raw_path, str) else list(raw_path)
+    src = "[" + ", ".join(sql_str(p) for p in raw_paths) + "]"
+    src = f"(SELECT *, {derived_sql} FROM read_parquet({src}))" if derived_sql else f"read_parquet({src})"
+    con = duckdb_connect(memory_limit, spill_dir=out_path + ".duckdb_tmp")
+    reader = con.execute(
+        f"SELECT {cols} FROM {src} ORDER BY {order_by}"
+    ).fetch_record_batch(row_group_size)
+    n_rows = 0
+    writer = pq.ParquetWriter(tmp_out, schema, compression="zstd", write_statistics=True)
+    try:
+        for batch in reader:
+            table = conform(pa.Table.from_batches([batch]), schema)
+            writer.write_table(table, row_group_size=row_group_size)
+            n_rows += table.num_rows
+    finally:
+        writer.close()
+        con.close()
+    os.replace(tmp_out, out_path)
+    for p in raw_paths:
+        os.remove(p)
+    n_groups = pq.ParquetFile(out_path).metadata.num_row_groups
+    n_tiles = write_tile_manifest(out_path) if "tile" in schema.names else 0
+    print(f"[FINALIZE] sorted_by=({order_by})  rows={n_rows:,}  row_groups={n_groups:,}  tiles={n_tiles:,}  "
+          f"file={os.path.getsize(out_path)/1e6:.1f} MB  time={time.time()-t0:.1f}s")
+    dt = time.time() - t0
+    emit("finalize", out=out_path, rows=n_rows, row_groups=n_groups, tiles=n_tiles, elapsed_s=round(dt, 3),
+         rows_per_s=round(n_rows / max(dt, 1e-9), 1), file_mb=round(os.path.getsize(out_path) / 1e6, 2),
+         peak_rss_mb=peak_rss_mb())
+    return n_rows
+
+def patch_cache(path, key_cols, key_of, drop_keys, new_rows, sort_cols, row_group_size=None, derived_sql=None):
+    """
+    finalize_cache çıktısına yerinde yama: key_of(tablo) değeri drop_keys içinde olan satırlar silinir,
+    new_rows (builder şemasında) (cat, tile) sırasındaki yerlerine eklenir. Sadece satır silinen/eklenen
+    row-group'lar yeniden sıralanır (sort_cols; 'hkey' lat/lon'dan yeniden hesaplanır), diğerleri aynen
+    kopyalanır. Sonra tile manifest'i yeniden yazılır. Dönüş: (silinen, eklenen, dokunulan row-group).
+    derived_sql: finalize_cache'teki gibi yeni satırlara eklenen türetilmiş kolonlar (dosyada varsa).
+    """
+    t0 = time.time()
+    pf = pq.ParquetFile(path)
+    schema = pf.schema_arrow
+    missing = [c for c in ("cat", "tile", *key_cols) if c not in schema.names]
+    if missing:
+        raise ValueError(f"{path}: {missing} kolonları yok; cache'i güncel builder ile bir kez yeniden üretin")
+    meta = pf.metadata
+    sizes = np.array([meta.row_group(g).num_rows for g in range(meta.num_row_groups)], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    group_of_row = np.repeat(np.arange(len(sizes)), sizes)
+
+    head = plain(pf.read(columns=["cat", "tile", *key_cols]))
+    new_rows = plain(new_rows)
+    if derived_sql:
+        con = duckdb.connect()
+        con.register("new_rows", new_rows)
+        new_rows = con.execute(f"SELECT *, {derived_sql} FROM new_rows").arrow()
+        con.close()
+    drop = np.isin(key_of(head), np.asarray(sorted(drop_keys), dtype=np.int64))
+    touched = set(group_of_row[drop].tolist())
+
+    # yeni satırın row-group'u: dosyada (cat, tile) sırasına göre kendinden önce gelen son satırınki
+    ins_group = np.zeros(new_rows.num_rows, dtype=np.int64)
+    if new_rows.num_rows and len(sizes):
+        cats = pa.array(sorted(set(pc.unique(head["cat"]).to_pylist()) | set(pc.unique(new_rows["cat"]).to_pylist())))
+        def cat_tile(t):
+            return (pc.index_in(t["cat"], value_set=cats).to_numpy().astype(np.int64) << 32) | t["tile"].to_numpy()
+        fk, nk = cat_tile(head), cat_tile(new_rows)
+        if len(fk) > 1 and (np.diff(fk) < 0).any():
+            raise ValueError(f"{path} (cat, tile) sırasında değil (--no-sort?); yama yapılamaz, yeniden üretin")
+        ins_group = group_of_row[np.maximum(np.searchsorted(fk, nk, side="right") - 1, 0)]
+    touched |= set(ins_group.tolist())
+
+    rg = row_group_size or (int(sizes.max()) if len(sizes) else ROW_GROUP_SIZE)
+    tmp_out = path + ".tmp"
+    writer = pq.ParquetWriter(tmp_out, schema, compression="zstd", write_statistics=True)
+    try:
+        for g in range(max(len(sizes), 1 if new_rows.num_rows else 0)):
+            if g not in touched:
+                writer.write_table(pf.read_row_group(g), row_group_size=rg)
+                continue
+            t = plain(pf.read_row_group(g).filter(pa.array(~drop[starts[g]:starts[g + 1]])) if len(sizes)
+                      else schema.empty_table())
+            add = new_rows.take(np.flatnonzero(ins_group == g)).select(t.column_names).cast(t.schema)
+            t = pa.concat_tables([t, add])
+            hkey = hilbert_key(t["lat"].to_numpy(), t["lon"].to_numpy())
+            t = t.append_column("hkey", pa.array(hkey, pa.int64()))
+            t = conform(t.sort_by([(c, "ascending") for c in sort_cols]), schema)
+            if t.num_rows:
+                writer.write_table(t, row_group_size=rg)
+    finally:
+        writer.close()
+    os.replace(tmp_out, path)
+    n_tiles = write_tile_manifest(path)
+    n_del = int(drop.sum())
+    print(f"[PATCH] {os.path.basename(path)}  deleted={n_del:,}  inserted={new_rows.num_rows:,}  "
+          f"row_groups_touched={len(touched):,}/{len(sizes):,}  tiles={n_tiles:,}  time={time.time()-t0:.1f}s")
+    return n_del, new_rows.num_rows, len(touched)
+
+# OSM kimliği anahtarları (patch_cache key_of): node → id; area osmium'daki gibi way → 2*id, relation → 2*id+1
+def node_keys(t):
+    return t["id"].to_numpy()
+
+def poly_keys(t):
+    is_rel = pc.equal(t["osm_type"], "r").to_numpy(zero_copy_only=False).astype(np.int64)
+    return 2 * t["osm_id"].to_numpy() + is_rel
+
+# ---------- çoklu bölge (birden çok PBF → bölge başına cache) ----------
+
+REGION_SUFFIXES = {"nodes": ".poi.parquet", "polys": ".poly.parquet", "merged": ".merged.parquet"}
+REGION_MANIFEST = "regions.parquet"
+
+def region_name(pbf_path):
+    # "netherlands-latest.osm.pbf" → "netherlands"
+    name = os.path.basename(pbf_path)
+    for suffix in (".osm.pbf", ".pbf"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return name[:-len("-latest")] if name.endswith("-latest") else name
+
+def region_path(region_dir, region, kind):
+    return os.path.join(region_dir, region + REGION_SUFFIXES[kind])
+
+def region_manifest_path(region_dir):
+    return os.path.join(region_dir, REGION_MANIFEST)
+
+def region_files(region_dir):
+    """Dizindeki bölge cache'leri: (bölge, tür, dosya adı), ada göre sıralı."""
+    out = []
+    for name in sorted(os.listdir(region_dir)):
+        for kind, suffix in REGION_SUFFIXES.items():
+            if name.endswith(suffix) and not name.endswith(".tiles.parquet"):
+                out.append((name[:-len(suffix)], kind, name))
+    return out
+
+def region_manifest(region_dir):
+    """
+    Bölge manifest'i (pa.Table): her bölge dosyasının her row-group'u için (lat, lon) sınır kutusu + satır
+    sayısı. Sadece Parquet footer'ları okunur (istatistiği olmayan row-group'un koordinatları okunur).
+    """
+    cols = {c: [] for c in ("region", "kind", "file", "row_group", "lat_min", "lat_max", "lon_min", "lon_max", "rows")}
+    for region, kind, name in region_files(region_dir):
+        pf = pq.ParquetFile(os.path.join(region_dir, name))
+        md = pf.metadata
+        scale = COORD_SCALE if has_int_coords(pf.schema_arrow) else 1
+        names = md.schema.names
+        for g in range(md.num_row_groups):
+            rg = md.row_group(g)
+            if rg.num_rows == 0:
+                continue
+            st = [rg.column(names.index(c)).statistics for c in ("lat", "lon")]
+            if all(s is not None and s.has_min_max for s in st):
+                box = (st[0].min, st[0].max, st[1].min, st[1].max)
+            else:
+                t = plain(pf.read_row_group(g, columns=["lat", "lon"]))
+                la, lo = pc.min_max(t["lat"]), pc.min_max(t["lon"])
+                box = (la["min"].as_py(), la["max"].as_py(), lo["min"].as_py(), lo["max"].as_py())
+            box = tuple(v / scale for v in box)
+            for c, v in zip(cols, (region, kind, name, g, *box, rg.num_rows)):
+                cols[c].append(v)
+    return pa.table(cols)
+
+def write_region_manifest(region_dir):
+    """regions.parquet'i yeniden yazar (sadece builder'lar; sorgu tarafı eskimiş manifest'i bellekte kurar)."""
+    t = region_manifest(region_dir)
+    path = region_manifest_path(region_dir)
+    pq.write_table(t, path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+    return t.num_rows
+
+def add_region_args(ap):
+    ap.add_argument("--out-dir", help="Çoklu bölge: --pbf'teki her dosya için <out-dir>/<bölge><ek> + regions.parquet "
+                                      "(birden çok --pbf verilirse varsayılan cache/regions)")
+
+def build_regions(args, build_one, kind, key_cols, key_of, sort_cols):
+    """
+    Çoklu PBF modu: her PBF aynı ayarlarla build_one(args, pbf, out) ile kendi bölge dosyasına yazılır.
+    Komşu extract'lar sınırda örtüşür (sınırı kesen area'lar ikisinde de tam gelir); aynı OSM nesnesi
+    sadece --pbf sırasında ilk geldiği bölgede kalır, sonrakilerden patch_cache ile silinir.
+    Sonunda bölge manifest'i (dosya/row-group sınır kutuları) yeniden yazılır.
+    """
+    out_dir = args.out_dir or os.path.join("cache", "regions")
+    names = [region_name(p) for p in args.pbf]
+    if len(set(names)) != len(names):
+        # aynı ada düşen iki PBF aynı dosyaya yazılır, ikincisi ilkini silerdi
+        raise SystemExit(f"Bölge adları tekil olmalı: {', '.join(names)}")
+    os.makedirs(out_dir, exist_ok=True)
+    t0 = time.time()
+    seen = np.zeros(0, dtype=np.int64)
+    dropped = {}
+    for pbf in args.pbf:
+        region = region_name(pbf)
+        out = region_path(out_dir, region, kind)
+        print(f"[REGION] {region}: {pbf} → {out}")
+        build_one(args, pbf, out)
+        keys = key_of(plain(pq.read_table(out, columns=key_cols)))
+        dup = np.intersect1d(keys, seen)
+        if len(dup):
+            patch_cache(out, key_cols, key_of, set(dup.tolist()), pq.read_schema(out).empty_table(), sort_cols)
+        dropped[region] = int(len(dup))
+        seen = np.union1d(seen, keys)
+    n = write_region_manifest(out_dir)
+    print(f"[REGIONS] {out_dir}  bölge={len(args.pbf)}  sınır örtüşmesi silinen=" +
+          ", ".join(f"{r}:{d:,}" for r, d in dropped.items()) + f"  manifest={n:,} row-group  "
+          f"time={time.time()-t0:.1f}s")
+    emit("done", builder=f"{kind}_regions", regions=len(args.pbf), dropped=dropped, manifest_rows=n,
+         elapsed_s=round(time.time() - t0, 3))
+
+def add_low_memory_args(ap, locations=True):
+    ap.add_argument("--low-memory", action="store_true",
+                    help="Sabit bellek tavanı: node konum indeksi diskte, sıralama/dupe kırpma DuckDB'de (diske taşar)")
+    ap.add_argument("--memory-limit", default="1GB", help="--low-memory'de DuckDB bellek sınırı")
+    if locations:
+        ap.add_argument("--index-type", default="sparse_file_array",
+                        help="--low-memory node konum indeksi (osmium map türü): sparse_file_array | dense_file_array")
+        ap.add_argument("--index-path", default=None,
+                        help="Konum indeksi dosyası (varsayılan: <out>.nodes.idx; build bitince silinir)")
+
+def location_index(args, suffix=""):
+    """apply_file(idx=...) değeri: normalde pyosmium'un bellekteki varsayılanı, --low-memory'de dosya tabanlı (mmap)."""
+    if not args.low_memory:
+        return "flex_mem"
+    return f"{args.index_type},{(args.index_path or args.out + '.nodes.idx') + suffix}"
+
+def remove_location_index(idx):
+    if "," in idx:
+        path = idx.split(",", 1)[1]
+        if os.path.exists(path):
+            os.remove(path)
+
+def peak_rss_mb():
+    """Süreç (+ biten alt süreçler) tepe RSS'i, MB; ölçülemezse None."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import ctypes
+            from ctypes import wintypes
+            class PMC(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+            pmc = PMC(); pmc.cb = ctypes.sizeof(PMC)
+            ok = ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                          ctypes.byref(pmc), pmc.cb)
+            return pmc.PeakWorkingSetSize / 1e6 if ok else None
+        except Exception:
+            return None
+    # ru_maxrss: Linux'ta KB, macOS'ta bayt
+    unit = 1.0 if sys.platform == "darwin" else 1024.0
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return rss * unit / 1e6
+
+def emit_progress(builder, meter, path, **counts):
+    # [PROGRESS] satırının makine okunur karşılığı (profiling.emit → --metrics-jsonl / server)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    emit("progress", builder=builder, **meter.rates(**counts), file_mb=round(size / 1e6, 2), peak_rss_mb=peak_rss_mb())
+
+def rss_report():
+    mb = peak_rss_mb()
+    return f"peak_rss={mb:,.0f} MB" if mb is not None else "peak_rss=?"
+
+# builder'ların ilgilendiği etiket anahtarları: en az birini taşımayan nesne Python'a hiç gelmez
+POI_KEYS = ("amenity", "shop", "healthcare", "railway", "highway", "public_transport", "leisure",
+            "boundary", "landuse", "sport", "school:level", "isced:level", "protect_class")
+
+def native_key_filters(keys=POI_KEYS, count=None):
+    """
+    apply_file(..., filters=...) zinciri: pyosmium'un C++ tarafı KeyFilter'ı. count='node'/'area'
+    verilirse önüne o türdeki tüm nesneleri sayan bir handler eklenir (her nesne için yine bir Python
+    çağrısı demektir; sadece ölçüm için). Dönüş: (filters, counts) — counts = {"total": n}.
+    """
+    import osmium as osm  # app_duckdb bu modülü osmium'suz da kullanır
+    counts = {"total": 0}
+    filters = []
+    if count:
+        def _inc(_obj):
+            counts["total"] += 1
+        filters.append(osm.make_simple_handler(**{count: _inc}))
+    filters.append(osm.filter.KeyFilter(*keys))
+    return filters, counts
+
+def filter_report(passed, counts):
+    if counts["total"]:
+        return (f"[FILTER] python_callbacks={passed:,}  native_filtered={counts['total'] - passed:,}  "
+                f"({100.0 * (counts['total'] - passed) / counts['total']:.1f}%)")
+    return f"[FILTER] python_callbacks={passed:,}  (native_filtered sayımı için --count-filtered)"
+
+def _read_varint(buf, i):
+    v = shift = 0
+    while True:
+        b = buf[i]; i += 1
+        v |= (b & 0x7F) << shift
+        if b < 0x80:
+            return v, i
+        shift += 7
+
+def pbf_blocks(pbf_path):
+    """
+    PBF blob dizini: [(tip, offset, uzunluk), ...]. Her blob = 4 bayt BlobHeader uzunluğu + BlobHeader
+    (protobuf: 1=type, 3=datasize) + sıkıştırılmış veri; içerik açılmadan sadece başlıklar okunur.
+    """
+    out = []
+    with open(pbf_path, "rb") as f:
+        while True:
+            off = f.tell()
+            raw = f.read(4)
+            if len(raw) < 4:
+                break
+            hlen = struct.unpack(">I", raw)[0]
+            hdr = f.read(hlen)
+            btype, dsize, i = None, 0, 0
+            while i < len(hdr):
+                key, i = _read_varint(hdr, i)
+                field, wire = key >> 3, key & 7
+                if wire == 2:
+                    n, i = _read_varint(hdr, i)
+                    if field == 1:
+                        btype = hdr[i:i + n].decode("ascii")
+                    i += n
+                elif wire == 0:
+                    v, i = _read_varint(hdr, i)
+                    if field == 3:
+                        dsize = v
+                else:
+                    raise ValueError(f"Beklenmeyen BlobHeader alanı: {field}/{wire}")
+            f.seek(dsize, 1)
+            out.append((btype, off, 4 + hlen + dsize))
+    return out
+
+def pbf_shard_bytes(pbf_path, blocks, worker, workers):
+    """OSMHeader + (i % workers == worker) olan OSMData blob'ları → tek başına geçerli bir PBF bayt dizisi."""
+    parts = []
+    with open(pbf_path, "rb") as f:
+        data_i = 0
+        for btype, off, n in blocks:
+            take = btype == "OSMHeader"
+            if btype == "OSMData":
+                take = (data_i % workers) == worker
+                data_i += 1
+            if take:
+                f.seek(off)
+                parts.append(f.read(n))
+    return b"".join(parts)
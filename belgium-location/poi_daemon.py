@@ -0,0 +1,162 @@
+# poi_daemon.py — app_duckdb.py için yerel (Unix soketi) sıcak daemon + ince istemci
+# Daemon:  python app_duckdb.py --daemon [--socket ./cache/app_duckdb.sock] [--nodes … --polys …]
+# İstemci: python app_duckdb.py --client --lat 50.87 --lon 4.68 [--socket …]   (diğer argümanlar aynen iletilir)
+# Durum/durdurma: python poi_daemon.py --ping | --stop [--socket …]
+# Sadece standart kütüphane: istemci yolu duckdb/pandas/folium içe aktarmaz.
+import os, sys, json, time, socket, struct, argparse
+
+DEFAULT_SOCKET = "./cache/app_duckdb.sock"
+RECV_TIMEOUT_S = 5.0   # istek gövdesi bu sürede gelmezse bağlantı bırakılır (sıradaki istemciler beklemesin)
+_LEN = struct.Struct(">I")
+
+# ---------- protokol: 4 bayt uzunluk + UTF-8 JSON ----------
+
+def send_msg(sock, obj):
+    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_LEN.pack(len(data)) + data)
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("bağlantı erken kapandı")
+        buf += chunk
+    return bytes(buf)
+
+def recv_msg(sock):
+    (n,) = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    return json.loads(_recv_exact(sock, n).decode("utf-8"))
+
+def request(path, msg, timeout=None):
+    """Tek istek/yanıt; daemon yoksa FileNotFoundError / ConnectionRefusedError."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(os.path.abspath(path))
+        send_msg(s, msg)
+        return recv_msg(s)
+
+def ping(path, timeout=1.0):
+    try:
+        return request(path, {"op": "ping"}, timeout=timeout)
+    except OSError:
+        return None
+
+def wait_ready(path, timeout=60.0):
+    """Daemon ısınıp soketi dinlemeye başlayana kadar bekler (bench / betikler için)."""
+    t_end = time.time() + timeout
+    while time.time() < t_end:
+        if ping(path):
+            return True
+        time.sleep(0.05)
+    return False
+
+# ---------- daemon ----------
+
+def serve(path, handle, recv_timeout=RECV_TIMEOUT_S):
+    """
+    Soketi açar ve istekleri sırayla işler: {"op": "run", "argv": [...], "cwd": ...} → handle(argv, cwd)
+    → {"stdout", "stderr", "code"}. Sıralı işleme bilinçli: CLI yolu stdout'u ve çalışma dizinini süreç
+    genelinde değiştirir. "ping" / "shutdown" yönetim istekleri. İsteğini recv_timeout saniyede
+    göndermeyen (ya da takılan) istemcinin bağlantısı bırakılır; diğer istemcileri bekletmez.
+    """
+    path = os.path.abspath(path)
+    if os.path.exists(path):
+        if ping(path):
+            raise SystemExit(f"Daemon zaten çalışıyor: {path}")
+        os.remove(path)  # önceki sürecin kalıntısı
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(path)
+    os.chmod(path, 0o600)
+    srv.listen(64)
+    print(f"[DAEMON] dinleniyor: {path}  pid={os.getpid()}", flush=True)
+    n = 0
+    try:
+        while True:
+            conn, _ = srv.accept()
+            with conn:
+                conn.settimeout(recv_timeout)
+                try:
+                    req = recv_msg(conn)
+                except socket.timeout:
+                    print(f"[DAEMON] istek {recv_timeout:g} sn içinde gelmedi; bağlantı bırakıldı", flush=True)
+                    continue
+                except (OSError, ValueError):
+                    continue
+                op = req.get("op", "run")
+                if op == "ping":
+                    send_msg(conn, {"ok": True, "pid": os.getpid(), "requests": n})
+                    continue
+                if op == "shutdown":
+                    send_msg(conn, {"ok": True})
+                    break
+                t0 = time.perf_counter()
+                resp = handle(list(req.get("argv", [])), req.get("cwd") or os.getcwd())
+                n += 1
+                try:
+                    send_msg(conn, resp)
+                except OSError:
+                    pass  # istemci beklemeden çıktı ya da okumuyor (zaman aşımı)
+                print(f"[DAEMON] #{n} kod={resp['code']}  {(time.perf_counter()-t0)*1000:.1f} ms  "
+                      f"{' '.join(req.get('argv', []))}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.close()
+        if os.path.exists(path):
+            os.remove(path)
+        print(f"[DAEMON] kapandı  istek={n}", flush=True)
+
+# ---------- ince istemci ----------
+
+def _pop_option(argv, name):
+    # "--socket X" / "--socket=X" argv'den çıkarılır (daemon kendi soket ayarını kullanır)
+    out, value, i = [], None, 0
+    while i < len(argv):
+        a = argv[i]
+        if a == name and i + 1 < len(argv):
+            value, i = argv[i + 1], i + 2
+            continue
+        if a.startswith(name + "="):
+            value = a.split("=", 1)[1]
+        else:
+            out.append(a)
+        i += 1
+    return out, value
+
+def client_main(argv, script=None):
+    """
+    app_duckdb.py --client …: argümanları daemon'a iletir, çıktıyı ve çıkış kodunu aynen yansıtır.
+    Daemon yoksa (script verilmişse) aynı argümanlarla tek seferlik moda düşer.
+    """
+    argv = [a for a in argv if a != "--client"]
+    argv, sock = _pop_option(argv, "--socket")
+    sock = sock or DEFAULT_SOCKET
+    try:
+        resp = request(sock, {"op": "run", "argv": argv, "cwd": os.getcwd()})
+    except (FileNotFoundError, ConnectionRefusedError):
+        if not script:
+            print(f"[ERROR] daemon yok: {os.path.abspath(sock)}", file=sys.stderr)
+            return 1
+        print(f"[WARN] daemon yok ({os.path.abspath(sock)}); tek seferlik moda düşülüyor", file=sys.stderr)
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable, os.path.abspath(script)] + argv)
+    sys.stdout.write(resp["stdout"])
+    sys.stderr.write(resp["stderr"])
+    return resp["code"]
+
+def main():
+    ap = argparse.ArgumentParser(description="app_duckdb daemon yönetimi")
+    ap.add_argument("--socket", default=DEFAULT_SOCKET)
+    g = ap.add_mutually_exclusive_group(required=True)
+    g.add_argument("--ping", action="store_true", help="Daemon durumu")
+    g.add_argument("--stop", action="store_true", help="Daemon'u kapat")
+    args = ap.parse_args()
+    try:
+        print(json.dumps(request(args.socket, {"op": "ping" if args.ping else "shutdown"}, timeout=5.0)))
+    except OSError as e:
+        raise SystemExit(f"daemon yok: {os.path.abspath(args.socket)} ({e})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# poi_index.py — DuckDB'siz, süreç içi POI sorgu motoru (grid index + vektörel haversine)
+# Kullanım: python poi_index.py --parity --nodes ./cache/be_poi.parquet --polys ./cache/be_poi_poly.parquet
+import math, time, argparse
+import numpy as np
+import pandas as pd
+import duckdb
+
+import app_duckdb as app
+from profiling import NULL_PROFILER
+
+EARTH_R = 6371000.0
+CELL_DEG = 0.02   # ~2.2 km x 1.4 km hücre; 2.5 km yarıçapta ~3x5 hücre taranır
+
+class GridIndex:
+    """
+    Sabit boyutlu enlem/boylam hücrelerine göre sıralı nokta indeksi. Hücre anahtarı satır-öncelikli
+    (cy*NX + cx) olduğundan bir enlem satırındaki hücreler ardışık; bbox sorgusu satır başına tek
+    searchsorted aralığıdır. Aday kümesi üzerinde haversine vektörel hesaplanır.
+    """
+    def __init__(self, lat, lon, cell_deg=CELL_DEG):
+        self.cell = cell_deg
+        self.nx = int(math.ceil(360.0 / cell_deg)) + 1
+        lat = np.asarray(lat, dtype=np.float64); lon = np.asarray(lon, dtype=np.float64)
+        keys = self._cy(lat) * self.nx + self._cx(lon)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = np.ascontiguousarray(keys[self.order])
+        # sıralı, bitişik diziler (sorgu sırasında gather yerine dilim)
+        self.lat = np.ascontiguousarray(lat[self.order])
+        self.lon = np.ascontiguousarray(lon[self.order])
+        self.lat_r = np.radians(self.lat)
+        self.cos_lat = np.cos(self.lat_r)
+
+    def _cy(self, lat):
+        return np.floor((np.asarray(lat) + 90.0) / self.cell).astype(np.int64)
+
+    def _cx(self, lon):
+        return np.floor((np.asarray(lon) + 180.0) / self.cell).astype(np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """bbox ile kesişen hücrelerdeki (sıralı dizideki) konumlar."""
+        cy0, cy1 = int(self._cy(lat_min)), int(self._cy(lat_max))
+        cx0, cx1 = int(self._cx(lon_min)), int(self._cx(lon_max))
+        rows = np.arange(cy0, cy1 + 1, dtype=np.int64) * self.nx
+        lo = np.searchsorted(self.keys, rows + cx0, side="left")
+        hi = np.searchsorted(self.keys, rows + cx1, side="right")
+        if len(lo) == 1:
+            return np.arange(lo[0], hi[0])
+        return np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)])
+
+    def haversine(self, pos, lat0, lon0):
+        # app_duckdb._haversine_sql ile aynı formül
+        s1 = np.sin(np.radians(self.lat[pos] - lat0) / 2)
+        s2 = np.sin(np.radians(self.lon[pos] - lon0) / 2)
+        a = s1 * s1 + math.cos(math.radians(lat0)) * self.cos_lat[pos] * s2 * s2
+        return 2 * EARTH_R * np.arcsin(np.sqrt(a))
+
+    def query_radius(self, lat0, lon0, radius_m):
+        """(konumlar, mesafeler): query_category'deki bbox + d_lin <= r filtresinin aynısı."""
+        dlat, dlon = app.meters_to_deg_latlon(lat0, radius_m)
+        pos = self.bbox(lat0 - dlat, lat0 + dlat, lon0 - dlon, lon0 + dlon)
+        if len(pos) == 0:
+            return pos, np.zeros(0)
+        la, lo = self.lat[pos], self.lon[pos]
+        pos = pos[(la >= lat0 - dlat) & (la <= lat0 + dlat) & (lo >= lon0 - dlon) & (lo <= lon0 + dlon)]
+        d = self.haversine(pos, lat0, lon0)
+        keep = d <= radius_m
+        return pos[keep], d[keep]
+
+    def nearest(self, lat0, lon0, max_m):
+        pos, d = self.query_radius(lat0, lon0, max_m)
+        if len(pos) == 0:
+            return None, None
+        i = int(np.argmin(d))
+        return int(self.order[pos[i]]), float(d[i])
+
+class PoiIndex:
+    """
+    Node + polygon cache'leri bir kez kategori bazlı NumPy dizilerine alır; PoiEngine.query ile
+    aynı arayüzü (frames, stats) sunar, böylece analyze(engine=PoiIndex(...)) doğrudan çalışır.
+    """
+    META_COLS = ["name", "brand", "amenity", "shop", "healthcare"]
+
+    def __init__(self, nodes_path="./cache/be_poi.parquet", polys_path="./cache/be_poi_poly.parquet",
+                 cell_deg=CELL_DEG):
+        t0 = time.perf_counter()
+        # tek yol ya da (çoklu bölge) yol listesi
+        nodes, polys = app._existing(nodes_path), app._existing(polys_path)
+        if not nodes and not polys:
+            raise FileNotFoundError("Ne node ne polygon cache bulundu.")
+        # skor / is_hospital: cache'teki build-time kolonlar (damga eşleşmezse SCORES ile yükleme anında)
+        df = duckdb.connect().execute(f"""
+            SELECT cat, name, brand, amenity, shop, healthcare, lat, lon,
+                   CAST(score_pre AS DOUBLE) AS score,
+                   CAST(hosp_pre AS INTEGER) AS is_hospital
+            FROM ({app._poi_source_sql(nodes, polys)})
+        """).df()
+        self.cats = {}
+        for cat, sub in df.groupby("cat", sort=False):
+            idx = GridIndex(sub["lat"].to_numpy(), sub["lon"].to_numpy(), cell_deg)
+            o = idx.order
+            self.cats[cat] = {
+                "idx": idx,
+                "score": np.ascontiguousarray(sub["score"].to_numpy()[o]),
+                "is_hospital": np.ascontiguousarray(sub["is_hospital"].to_numpy()[o]),
+                "meta": {c: sub[c].to_numpy()[o] for c in self.META_COLS},
+            }
+        self.load_s = time.perf_counter() - t0
+
+    def query_category(self, cat, lat, lon, radius_m, topn):
+        """Tek kategori: query_category ile aynı kolonlar."""
+        c = self.cats.get(cat)
+        if c is None:
+            return pd.DataFrame()
+        idx = c["idx"]
+        pos, d = idx.query_radius(lat, lon, radius_m)
+        if len(pos) == 0:
+            return pd.DataFrame()
+        score = c["score"][pos]
+        top = np.lexsort((d, -score))[:topn]   # ORDER BY score DESC, d_lin ASC
+        p, dt = pos[top], d[top]
+        walk_m, drive_m = dt * app.WALK_CIRCUITY, dt * app.DRIVE_CIRCUITY
+        out = {k: v[p] for k, v in c["meta"].items()}
+        out.update({
+            "lat": idx.lat[p], "lon": idx.lon[p], "score": score[top], "d_lin": dt,
+            "d_min": np.full(len(p), d.min()), "n_total": np.full(len(p), len(pos)),
+            "has_hospital_any": np.full(len(p), int(c["is_hospital"][pos].max())),
+            "walk_m": walk_m, "walk_s": walk_m / (app.WALK_SPEED_KPH * 1000/3600),
+            "drive_m": drive_m, "drive_s": drive_m / (app.DRIVE_SPEED_KPH * 1000/3600),
+        })
+        return pd.DataFrame(out)
+
+    def query(self, lat, lon, radius_m, topn, radii=None, cats=None, prof=NULL_PROFILER):
+        cats = list(cats or app.CATS.keys())
+        frames, stats = {}, {}
+        for cat in cats:
+            with prof.stage(f"index_{cat}"):
+                df = self.query_category(cat, lat, lon, (radii or {}).get(cat, radius_m), topn)
+            frames[cat] = df
+            stats[cat] = (0, None, False) if df.empty else (
+                int(df.iloc[0]["n_total"]), float(df.iloc[0]["d_min"]), bool(df.iloc[0]["has_hospital_any"]))
+            prof.category(cat, in_radius=stats[cat][0], returned=len(df))
+        return frames, stats
+
+def parity_check(index, nodes_path, polys_path, points, radius_m=app.DEFAULT_RADIUS_M, topn=app.TOP_N, tol=1e-6):
+    """DuckDB yolu (query_all_categories) ile aynı girdilerde karşılaştırma; uyuşmazlık listesi döner."""
+    con = duckdb.connect()
+    mismatches = []
+    for lat, lon in points:
+        f_db, s_db = app.query_all_categories(con, nodes_path, polys_path, lat, lon, radius_m, topn)
+        f_ix, s_ix = index.query(lat, lon, radius_m, topn)
+        for cat in f_db:
+            a, b = s_db[cat], s_ix[cat]
+            same = (a[0] == b[0] and a[2] == b[2] and
+                    ((a[1] is None and b[1] is None) or (a[1] is not None and b[1] is not None and abs(a[1]-b[1]) <= tol)))
+            if same and a[0]:
+                same = (np.allclose(f_db[cat]["d_lin"].to_numpy(), f_ix[cat]["d_lin"].to_numpy(), atol=tol) and
+                        list(f_db[cat]["score"]) == list(f_ix[cat]["score"]))
+            if not same:
+                mismatches.append((lat, lon, cat, a, b))
+    return mismatches
+
+def main():
+    ap = argparse.ArgumentParser(description="Süreç içi POI indeksi: parite ve gecikme ölçümü (DuckDB yoluna karşı).")
+    ap.add_argument("--nodes", type=str, default="./cache/be_poi.parquet")
+    ap.add_argument("--polys", type=str, default="./cache/be_poi_poly.parquet")
+    ap.add_argument("--radius", type=int, default=app.DEFAULT_RADIUS_M)
+    ap.add_argument("--topn", type=int, default=app.TOP_N)
+    ap.add_argument("--n", type=int, default=200, help="Rastgele test noktası sayısı (cache POI'lerinden)")
+    ap.add_argument("--parity", action="store_true", help="DuckDB yolu ile sonuçları karşılaştır")
+    args = ap.parse_args()
+
+    index = PoiIndex(args.nodes, args.polys)
+    print(f"[INDEX] yükleme={index.load_s:.2f}s  kategori={len(index.cats)}  "
+          f"poi={sum(len(c['idx']) for c in index.cats.values()):,}")
+
+    # test noktaları: rastgele POI konumlarının etrafı
+    rng = np.random.default_rng(0)
+    any_cat = next(iter(index.cats.values()))["idx"]
+    pick = rng.integers(0, len(any_cat), args.n)
+    points = list(zip(any_cat.lat[pick] + rng.normal(0, 0.01, args.n), any_cat.lon[pick] + rng.normal(0, 0.01, args.n)))
+
+    t0 = time.perf_counter()
+    for lat, lon in points:
+        for cat in app.CATS:
+            index.query_category(cat, lat, lon, args.radius, args.topn)
+    per_cat_ms = (time.perf_counter() - t0) * 1000 / (len(points) * len(app.CATS))
+    print(f"[INDEX] kategori başına ortalama sorgu: {per_cat_ms:.3f} ms")
+
+    if args.parity:
+        bad = parity_check(index, args.nodes, args.polys, points, args.radius, args.topn)
+        print(f"[PARITY] nokta={len(points)}  uyuşmazlık={len(bad)}")
+        for m in bad[:10]:
+            print("   ", m)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# poi_rank.py — POI sıralama skorları (SCORES) ve bunlardan türetilen SQL: sorgu tarafı (app_duckdb) canlı hesaplar,
+# builder'lar (build_poi_cache / build_poi_poly_cache_osmium / build_poi_merged / update_poi_cache) aynı ifadeleri
+# rank_score / is_hospital kolonlarına yazar. Ağır bağımlılığı yoktur; builder'lar app_duckdb'yi yüklemez.
+import json, hashlib
+
+# Alt-skor (tür ağırlıkları) — sıralama için; puanlamadan bağımsız
+SCORES = {
+    "school": """
+        (CASE WHEN amenity='school' THEN 10 ELSE 0 END) +
+        (CASE WHEN amenity='college' THEN 7 ELSE 0 END) +
+        (CASE WHEN amenity='kindergarten' THEN 6 ELSE 0 END) +
+        (CASE WHEN "school_level" IS NOT NULL THEN 4 ELSE 0 END) +
+        (CASE WHEN "isced_level" IS NOT NULL THEN 4 ELSE 0 END)
+    """,
+    "market": """
+        (CASE WHEN shop='supermarket' THEN 10 ELSE 0 END) +
+        (CASE WHEN shop='convenience' THEN 8 ELSE 0 END) +
+        (CASE WHEN amenity='marketplace' THEN 6 ELSE 0 END)
+    """,
+    "health": """
+        (CASE WHEN amenity='hospital' OR healthcare='hospital' THEN 100 ELSE 0 END) +
+        (CASE WHEN amenity='clinic' OR healthcare='clinic' THEN 80 ELSE 0 END) +
+        (CASE WHEN amenity='doctors' OR healthcare='doctor' THEN 60 ELSE 0 END) +
+        (CASE WHEN amenity='dentist' OR healthcare='dentist' THEN 55 ELSE 0 END) +
+        (CASE WHEN healthcare='physiotherapist' THEN 50 ELSE 0 END) +
+        (CASE WHEN amenity='pharmacy' THEN 40 ELSE 0 END) +
+        (CASE WHEN healthcare IS NOT NULL THEN 30 ELSE 0 END)
+    """,
+    "transit": """
+        (CASE WHEN railway='station' THEN 100 ELSE 0 END) +
+        (CASE WHEN railway='halt' THEN 90 ELSE 0 END) +
+        (CASE WHEN amenity='bus_station' THEN 80 ELSE 0 END) +
+        (CASE WHEN railway='tram_stop' OR railway='subway_entrance' THEN 70 ELSE 0 END) +
+        (CASE WHEN highway='bus_stop' THEN 50 ELSE 0 END) +
+        (CASE WHEN public_transport IS NOT NULL THEN 40 ELSE 0 END)
+    """,
+    "park": """
+        (CASE WHEN leisure='park' THEN 100 ELSE 0 END) +
+        (CASE WHEN leisure='garden' THEN 80 ELSE 0 END) +
+        (CASE WHEN leisure='nature_reserve' OR boundary='national_park' THEN 80 ELSE 0 END) +
+        (CASE WHEN leisure='recreation_ground' THEN 60 ELSE 0 END) +
+        (CASE WHEN leisure='playground' THEN 50 ELSE 0 END) +
+        (CASE WHEN landuse='grass' THEN 20 ELSE 0 END) +
+        (CASE WHEN boundary='national_park' THEN 15 ELSE 0 END)
+    """,
+    "sport": """
+        (CASE WHEN leisure='fitness_centre' OR amenity='gym' THEN 90 ELSE 0 END) +
+        (CASE WHEN leisure='sports_centre' THEN 80 ELSE 0 END) +
+        (CASE WHEN sport IS NOT NULL THEN 20 ELSE 0 END)
+    """,
+}
+
+def score_case_sql():
+    # SCORES[cat] ifadelerini tek CASE içinde topla (çok kategorili sorgular için)
+    whens = " ".join(f"WHEN '{cat}' THEN ({expr.strip()})" for cat, expr in SCORES.items())
+    return f"(CASE cat {whens} ELSE 0 END)"
+
+HOSPITAL_SQL = "(CASE WHEN amenity='hospital' OR healthcare='hospital' THEN 1 ELSE 0 END)"
+
+def rank_config_hash():
+    """SCORES + HOSPITAL_SQL özeti; builder'lar Parquet metadata'sına yazar (RANK_STAMP_KEY)."""
+    src = json.dumps({"scores": {c: " ".join(e.split()) for c, e in SCORES.items()},
+                      "hospital": HOSPITAL_SQL}, sort_keys=True)
+    return hashlib.sha1(src.encode("utf-8")).hexdigest()[:16]
+
+def rank_columns_sql():
+    # finalize_cache / patch_cache'in ham satırlara eklediği türetilmiş kolonlar (sadece POI'nin kendi etiketleri)
+    return (f"CAST({score_case_sql()} AS SMALLINT) AS rank_score, "
+            f"CAST({HOSPITAL_SQL} AS TINYINT) AS is_hospital")
@@ -0,0 +1,189 @@
+# profiling.py — aşama (stage) profili + takılabilir metrik çıkışları (sink)
+# Sorgu tarafı: analyze(..., profile=True) / app_duckdb.py --profile → Profiler.to_dict()
+# Builder'lar: emit("progress" | "flush" | "finalize" | "done", ...) → --metrics-jsonl dosyası, server histogramları vb.
+# Sadece standart kütüphane; ağır bağımlılık yok (builder alt süreçleri de içe aktarır).
+import os, sys, json, time, threading
+from contextlib import contextmanager
+
+# ---------- sink'ler ----------
+
+_SINKS = []
+_SINKS_LOCK = threading.Lock()
+
+def add_sink(fn):
+    """fn(event: str, fields: dict) — her emit() çağrısında çağrılır; aynı fn iki kez eklenmez."""
+    with _SINKS_LOCK:
+        if fn not in _SINKS:
+            _SINKS.append(fn)
+    return fn
+
+def remove_sink(fn):
+    with _SINKS_LOCK:
+        if fn in _SINKS:
+            _SINKS.remove(fn)
+
+def emit(event, **fields):
+    # sink yoksa neredeyse bedava; bir sink'in hatası diğerlerini ve çağıranı durdurmaz
+    if not _SINKS:
+        return
+    for fn in list(_SINKS):
+        try:
+            fn(event, fields)
+        except Exception as e:
+            print(f"[WARN] metrik sink hatası ({event}): {e}", file=sys.stderr)
+
+class JsonLinesSink:
+    """Her olay tek JSON satırı: {"ts", "pid", "event", ...alanlar}. path "-" → stdout."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if path == "-":
+            self.f = sys.stdout
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # append: --workers alt süreçleri aynı dosyaya satır satır yazabilir
+            self.f = open(path, "a", encoding="utf-8")
+
+    def __call__(self, event, fields):
+        line = json.dumps({"ts": round(time.time(), 3), "pid": os.getpid(), "event": event, **fields},
+                          ensure_ascii=False, default=str)
+        with self._lock:
+            self.f.write(line + "\n")
+            self.f.flush()
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+def add_metrics_args(ap):
+    ap.add_argument("--metrics-jsonl", type=str,
+                    help="Makine okunur metrikler (JSON satırları): dosya yolu veya '-' (stdout)")
+
+def install_sinks(args):
+    """add_metrics_args ile eklenen seçeneklere göre sink'leri kurar; kurulanların listesi."""
+    sinks = []
+    if getattr(args, "metrics_jsonl", None):
+        sinks.append(add_sink(JsonLinesSink(args.metrics_jsonl)))
+    return sinks
+
+@contextmanager
+def scoped_sinks():
+    """Blok içinde kurulan sink'ler blok sonunda kaldırılıp kapatılır (uzun ömürlü süreçte istek başına CLI)."""
+    with _SINKS_LOCK:
+        before = list(_SINKS)
+    try:
+        yield
+    finally:
+        for fn in [f for f in list(_SINKS) if f not in before]:
+            remove_sink(fn)
+            if hasattr(fn, "close"):
+                fn.close()
+
+class RateMeter:
+    """Builder ilerlemesi: son ölçümden bu yana ve başlangıçtan beri sayaç/sn."""
+    def __init__(self):
+        self.t0 = self.t_last = time.time()
+        self.last = {}
+
+    def rates(self, **counts):
+        now = time.time()
+        dt_all, dt = max(now - self.t0, 1e-9), max(now - self.t_last, 1e-9)
+        out = {"elapsed_s": round(now - self.t0, 3)}
+        for k, v in counts.items():
+            out[k] = v
+            out[f"{k}_per_s"] = round(v / dt_all, 1)
+            out[f"{k}_per_s_now"] = round((v - self.last.get(k, 0)) / dt, 1)
+        self.t_last, self.last = now, counts
+        return out
+
+# ---------- sorgu profili ----------
+
+class Profiler:
+    """
+    Tek analiz isteğinin aşama süreleri (ms, aynı ad tekrar ederse toplanır), kategori başına satır
+    sayıları, dosya başına okunan row-group/bayt ve (explain=True ise) DuckDB EXPLAIN ANALYZE çıktısı.
+    detail=False: sadece süreler ve ucuz sayaçlar (ek sorgu/metadata okuması yok; servis için).
+    """
+    enabled = True
+
+    def __init__(self, detail=True, explain=False):
+        self.detail = detail or explain
+        self.explain = explain
+        self.t0 = time.perf_counter()
+        self.stages = {}
+        self.categories = {}
+        self.files = {}
+        self.explains = []
+        self.info = {}
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+    def category(self, cat, **counts):
+        self.categories.setdefault(cat, {}).update(counts)
+
+    def file(self, path, **stats):
+        self.files.setdefault(path, {}).update(stats)
+
+    def add_explain(self, label, text):
+        self.explains.append({"query": label, "plan": text})
+
+    def to_dict(self):
+        out = {"total_ms": (time.perf_counter() - self.t0) * 1000, "stages": dict(self.stages),
+               "categories": self.categories}
+        if self.files:
+            out["files"] = self.files
+        if self.explains:
+            out["explain"] = self.explains
+        return out | self.info
+
+    def report(self):
+        """Konsol özeti ([PROFILE] satırları)."""
+        d = self.to_dict()
+        lines = [f"[PROFILE] toplam={d['total_ms']:.1f} ms"]
+        for name, ms in d["stages"].items():
+            lines.append(f"[PROFILE] {name:<20} {ms:>9.2f} ms")
+        for cat, c in d["categories"].items():
+            lines.append(f"[PROFILE] {cat:<8} " + "  ".join(f"{k}={v:,}" for k, v in c.items()))
+        for path, s in d.get("files", {}).items():
+            lines.append(f"[PROFILE] {os.path.basename(path)}: " +
+                         "  ".join(f"{k}={v:,}" if isinstance(v, int) else f"{k}={v}" for k, v in s.items()))
+        for e in d.get("explain", []):
+            lines.append(f"[EXPLAIN] {e['query']}\n{e['plan']}")
+        return "\n".join(lines)
+
+class _NullProfiler(Profiler):
+    """profile=False: aynı arayüz, hiçbir şey kaydetmez (çağıranlarda if gerekmez)."""
+    enabled = False
+
+    def __init__(self):
+        super().__init__(detail=False)
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def category(self, cat, **counts):
+        pass
+
+    def file(self, path, **stats):
+        pass
+
+    def add_explain(self, label, text):
+        pass
+
+NULL_PROFILER = _NullProfiler()
+
+def as_profiler(profile):
+    # analyze(profile=...) girdisi: False/None → NULL_PROFILER, True → yeni Profiler, "explain" → explain'li,
+    # Profiler örneği → olduğu gibi (çağıran, ör. server, kendi ayarlarıyla verir)
+    if isinstance(profile, Profiler):
+        return profile
+    if not profile:
+        return NULL_PROFILER
+    return Profiler(explain=(profile == "explain"))
@@ -0,0 +1,207 @@
+# road_graph.py — build_road_graph.py çıktısı (CSR yol ağı) üzerinde snap + sınırlı tek-kaynaklı Dijkstra
+# Dosyalar <dizin>/*.npy (np.load(mmap_mode="r")) + meta.json; sadece NumPy gerekir.
+import os, json, math, heapq
+import numpy as np
+
+ROAD_GRAPH = "./cache/be_roads"
+MODES = ("walk", "drive")
+SNAP_CELL_DEG = 0.005          # snap ızgarası (~550 m x 350 m)
+WALK_MPS = 4.8 / 3.6           # yaya kenarlarının nominal hızı (app_duckdb.WALK_SPEED_KPH ile aynı)
+EARTH_R = 6371000.0
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    # app_duckdb._haversine_sql ile aynı formül
+    s1 = np.sin(np.radians(lat2 - lat1) / 2)
+    s2 = np.sin(np.radians(lon2 - lon1) / 2)
+    a = s1 * s1 + np.cos(np.radians(lat1)) * np.cos(np.radians(lat2)) * s2 * s2
+    return 2 * EARTH_R * np.arcsin(np.sqrt(a))
+
+def graph_file(path, name):
+    return os.path.join(path, f"{name}.npy")
+
+CSR_PARTS = ("offsets", "targets", "lengths", "speeds")
+NEAR_META = "near_meta.json"      # build_nearest_poi.py çıktısı (aynı dizinde)
+NEAR_POIS = "near_pois.parquet"
+NEAR_PARTS = ("dist", "time", "poi")
+
+def near_file(path, mode, cat, part):
+    return graph_file(path, f"near_{mode}_{cat}_{part}")
+
+def near_meta_mtime(path):
+    """near_meta.json'ın mtime_ns'i; tablo yoksa None."""
+    try:
+        return os.stat(os.path.join(path, NEAR_META)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def reverse_csr(off, tgt, length, speed):
+    """Kenarları ters çevrilmiş CSR (yönlü araç ağında 'düğümden POI'ye' mesafe için)."""
+    n = len(off) - 1
+    src = np.repeat(np.arange(n, dtype=np.int64), np.diff(off))
+    order = np.lexsort((src, tgt))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(tgt, minlength=n))]).astype(np.int64)
+    return offsets, src[order].astype(np.int32), length[order], speed[order]
+
+def multi_source_dijkstra(csr, sources, max_m):
+    """
+    Çok kaynaklı, süre ağırlıklı Dijkstra. sources: [(düğüm, uzunluk0, süre0, etiket)].
+    Dönüş: düğüm başına (uzunluk float32, süre float32, en yakın kaynağın etiketi int32; ulaşılamayan NaN / -1).
+    """
+    off, tgt, length, speed = csr
+    n = len(off) - 1
+    best = [math.inf] * n
+    done = bytearray(n)
+    dist, tim = np.full(n, np.nan, np.float32), np.full(n, np.nan, np.float32)
+    lab = np.full(n, -1, np.int32)
+    heap = []
+    for node, l0, t0, label in sources:
+        if t0 < best[node]:
+            best[node] = t0
+            heap.append((t0, l0, node, label))
+    heapq.heapify(heap)
+    while heap:
+        t, l, u, label = heapq.heappop(heap)
+        if done[u]:
+            continue
+        done[u] = 1
+        dist[u], tim[u], lab[u] = l, t, label
+        a, b = int(off[u]), int(off[u + 1])
+        for v, el, es in zip(tgt[a:b].tolist(), length[a:b].tolist(), speed[a:b].tolist()):
+            nl = l + el
+            if nl > max_m or done[v]:
+                continue
+            nt = t + el / es
+            if nt < best[v]:
+                best[v] = nt
+                heapq.heappush(heap, (nt, nl, v, label))
+    return dist, tim, lab
+
+class RoadGraph:
+    """
+    Yaya + araç ağları: düğümler (kavşaklar / way uçları) snap ızgarası hücresine göre sıralı,
+    her mod için CSR (offsets[n+1], targets, lengths [m], speeds [m/s]). Dosyalar mmap ile açılır.
+    """
+    def __init__(self, path=ROAD_GRAPH):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = m = json.load(f)
+        load = lambda name: np.load(graph_file(path, name), mmap_mode="r").view(np.ndarray)
+        self.lat, self.lon = load("nodes_lat"), load("nodes_lon")
+        self.cell_off = load("cell_offsets")
+        self.cell_deg, self.lat0, self.lon0 = m["cell_deg"], m["cell_lat0"], m["cell_lon0"]
+        self.ny, self.nx = m["cell_ny"], m["cell_nx"]
+        self.csr = {mode: tuple(load(f"{mode}_{p}") for p in CSR_PARTS) for mode in MODES}
+        self._has_out = {}
+        self.path = path
+        # önceden hesaplanmış "en yakın POI" tabloları (varsa)
+        near_meta = os.path.join(path, NEAR_META)
+        self.near_meta = None
+        self.near_mtime_ns = near_meta_mtime(path)
+        if self.near_mtime_ns is not None:
+            with open(near_meta, encoding="utf-8") as f:
+                self.near_meta = json.load(f)
+        self._near = {}
+        self._near_pois = None
+        # near_* tabloları graf yeniden kurulmadan da (build_nearest_poi.py) değişebilir
+        self.fingerprint = (m["built_at"], m["n_nodes"], m["n_edges"],
+                            self.near_meta["built_at"] if self.near_meta else None, self.near_mtime_ns)
+
+    def has_out(self, mode):
+        # snap sadece o modda çıkış kenarı olan düğümlere (ör. araç modunda yaya yolu düğümü seçilmez)
+        if mode not in self._has_out:
+            off = self.csr[mode][0]
+            self._has_out[mode] = off[1:] != off[:-1]
+        return self._has_out[mode]
+
+    def _ring_nodes(self, cy, cx, k):
+        y0, y1 = max(0, cy - k), min(self.ny - 1, cy + k)
+        x0, x1 = max(0, cx - k), min(self.nx - 1, cx + k)
+        if y0 > y1 or x0 > x1:
+            return np.empty(0, np.int64)
+        # aynı satırdaki hücreler ardışık → satır başına tek aralık
+        parts = [np.arange(self.cell_off[y * self.nx + x0], self.cell_off[y * self.nx + x1 + 1])
+                 for y in range(y0, y1 + 1)]
+        return np.concatenate(parts)
+
+    def nearest(self, mode, lat, lon, max_rings=4):
+        """(düğüm, mesafe_m); max_rings hücre içinde uygun düğüm yoksa (None, None)."""
+        cy = int(math.floor((lat - self.lat0) / self.cell_deg))
+        cx = int(math.floor((lon - self.lon0) / self.cell_deg))
+        ok = self.has_out(mode)
+        for k in range(1, max_rings + 1):
+            cand = self._ring_nodes(cy, cx, k)
+            if ok[cand].any():
+                # halka kenarındaki bir düğümden daha yakını bir sonraki halkada olabilir
+                cand = self._ring_nodes(cy, cx, k + 1)
+                cand = cand[ok[cand]]
+                d = haversine_np(lat, lon, self.lat[cand], self.lon[cand])
+                i = int(np.argmin(d))
+                return int(cand[i]), float(d[i])
+        return None, None
+
+    def dijkstra(self, mode, src, max_m, targets=None):
+        """
+        src'den süre ağırlıklı Dijkstra; ağ mesafesi max_m'yi aşan yollar budanır. targets verilirse
+        hepsi yerleşince durur. Dönüş: {düğüm: (uzunluk_m, süre_s)} (sadece yerleşen düğümler).
+        """
+        off, tgt, length, speed = self.csr[mode]
+        remaining = set(targets) if targets is not None else None
+        best = {src: 0.0}
+        settled = {}
+        heap = [(0.0, 0.0, src)]
+        while heap:
+            t, l, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled[u] = (l, t)
+            if remaining is not None:
+                remaining.discard(u)
+                if not remaining:
+                    break
+            a, b = int(off[u]), int(off[u + 1])
+            for v, el, es in zip(tgt[a:b].tolist(), length[a:b].tolist(), speed[a:b].tolist()):
+                nl = l + el
+                if nl > max_m or v in settled:
+                    continue
+                nt = t + el / es
+                if nt < best.get(v, math.inf):
+                    best[v] = nt
+                    heapq.heappush(heap, (nt, nl, v))
+        return settled
+
+    def route(self, mode, lat, lon, pts_lat, pts_lon, max_m, access_mps):
+        """
+        Başlangıçtan noktalara (POI'ler) ağ uzunluğu ve süresi; tek Dijkstra, hedefler yerleşince durur.
+        Adres/POI ile snap düğümü arası düz çizgi, access_mps hızında eklenir. Ulaşılamayan: NaN.
+        """
+        n = len(pts_lat)
+        L, T = np.full(n, np.nan), np.full(n, np.nan)
+        src, src_d = self.nearest(mode, lat, lon)
+        if src is None or n == 0:
+            return L, T
+        snaps = [self.nearest(mode, float(a), float(b)) for a, b in zip(pts_lat, pts_lon)]
+        targets = {s for s, _ in snaps if s is not None}
+        settled = self.dijkstra(mode, src, max_m, targets)
+        for i, (node, d) in enumerate(snaps):
+            hit = settled.get(node) if node is not None else None
+            if hit is not None:
+                L[i] = src_d + hit[0] + d
+                T[i] = (src_d + d) / access_mps + hit[1]
+        return L, T
+
+    def has_near(self, mode, cat):
+        return bool(self.near_meta) and f"{mode}_{cat}" in self.near_meta["tables"]
+
+    def near(self, mode, cat):
+        """(uzunluk, süre, poi) dizileri: düğümden o kategorideki en yakın POI'ye ağ mesafesi/süresi (mmap)."""
+        key = (mode, cat)
+        if key not in self._near:
+            self._near[key] = tuple(np.load(near_file(self.path, mode, cat, p), mmap_mode="r").view(np.ndarray)
+                                    for p in NEAR_PARTS)
+        return self._near[key]
+
+    def near_poi(self, idx):
+        """near_* tablolarındaki poi indeksine karşılık gelen kayıt (cat, ref, name, lat, lon)."""
+        if self._near_pois is None:
+            import pyarrow.parquet as pq  # sadece isim gerektiğinde
+            self._near_pois = pq.read_table(os.path.join(self.path, NEAR_POIS)).to_pylist()
+        return self._near_pois[idx] if idx >= 0 else None
@@ -0,0 +1,325 @@
+# server.py — analyze() / analyze_batch() için HTTP API (Flask)
+# Yerel: python server.py --nodes .\cache\be_poi.parquet --polys .\cache\be_poi_poly.parquet
+# Yük testi (ağsız): python server.py --stub-geocoder .\stub_addresses.csv --stub-delay 0.5
+# WSGI (çok thread'li): gunicorn -k gthread --threads 16 "server:create_app()"
+import math, time, argparse, threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import pandas as pd
+from flask import Flask, Response, jsonify, request
+import app_duckdb as app
+from geocode_cache import StubGeocoder, DEFAULT_DB as GEOCODE_DB
+from profiling import Profiler
+
+# gecikme histogramı kova sınırları (ms)
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+FORMATS = {"json": "none", "geojson": "geojson", "html": "folium"}
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.n = 0
+
+    def observe(self, ms):
+        i = 0
+        while i < len(self.buckets) and ms > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += ms
+        self.n += 1
+
+class Metrics:
+    """Aşama (stage) başına gecikme histogramları + sayaçlar; /metrics Prometheus metin biçiminde döner."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+
+    def observe(self, stage, ms):
+        with self._lock:
+            self.stages.setdefault(stage, Histogram()).observe(ms)
+
+    def inc(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def render(self, gauges=None):
+        lines = ["# TYPE poi_stage_latency_ms histogram"]
+        with self._lock:
+            for stage, h in sorted(self.stages.items()):
+                acc = 0
+                for le, c in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    acc += c
+                    lines.append(f'poi_stage_latency_ms_bucket{{stage="{stage}",le="{le}"}} {acc}')
+                lines.append(f'poi_stage_latency_ms_sum{{stage="{stage}"}} {h.sum:.3f}')
+                lines.append(f'poi_stage_latency_ms_count{{stage="{stage}"}} {h.n}')
+            for (name, labels), v in sorted(self.counters.items()):
+                lab = ",".join(f'{k}="{val}"' for k, val in labels)
+                lines.append(f"{name}{{{lab}}} {v}")
+        for name, v in (gauges or {}).items():
+            lines.append(f"{name} {v}")
+        return "\n".join(lines) + "\n"
+
+class Busy(Exception):
+    pass
+
+class Service:
+    """
+    Süreç başına tek örnek: sıcak PoiEngine (tek DuckDB bağlantısı, thread başına cursor), yerel adres
+    indeksi + geocode cache'i ve sınırlı bir geocode havuzu. Cache'te olmayan adresler havuza gider,
+    böylece yavaş Nominatim çağrıları cache'ten çözülen istekleri bekletmez. Aynı anda işlenen istek
+    sayısı max_inflight ile sınırlıdır; dolunca 503 + Retry-After.
+    """
+    def __init__(self, nodes_path, polys_path, geocode_db=GEOCODE_DB, addr_index=app.ADDR_INDEX, geocoder=None,
+                 geocode_workers=4, geocode_queue=64, geocode_timeout_s=15.0, max_inflight=32,
+                 batch_max_points=20_000, result_cache_mb=app.RESULT_CACHE_MAX_MB, result_cache_db=None,
+                 snap_decimals=app.RESULT_SNAP_DECIMALS, merged_path=app.MERGED_CACHE, regions_dir=None):
+        # çoklu bölge: tüm bölge dosyaları tek bellek tablosuna (sorgu bbox'lı, bölge seçimi gereksiz)
+        sources = (app.get_region_set(regions_dir).all_sources() if regions_dir
+                   else app.resolve_sources(nodes_path, polys_path, merged_path))
+        self.engine = app.get_engine(*sources)
+        self.results = (app.get_result_cache(result_cache_mb, result_cache_db, snap_decimals)
+                        if result_cache_mb > 0 else None)
+        self.cache = app.get_geocode_cache(geocode_db, geocoder=geocoder)
+        self.local = app.get_local_geocoder(addr_index)
+        self.pool = ThreadPoolExecutor(max_workers=geocode_workers, thread_name_prefix="geocode")
+        self.geocode_slots = threading.BoundedSemaphore(geocode_queue)
+        self.geocode_timeout_s = geocode_timeout_s
+        self.slots = threading.BoundedSemaphore(max_inflight)
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self._inflight_lock = threading.Lock()
+        self.batch_max_points = batch_max_points
+        self.metrics = Metrics()
+
+    def observe_profile(self, profile):
+        # analyze() aşama süreleri → analyze_<aşama> histogramları. Süreç geneli emit() sink'i yerine
+        # yanıttaki profilden okunur: aynı süreçte birden çok Service/create_app olsa da sayım tek kalır.
+        for stage, ms in profile.get("stages", {}).items():
+            self.metrics.observe(f"analyze_{stage}", ms)
+        self.metrics.inc("poi_events_total", event="analyze")
+
+    def enter(self):
+        if not self.slots.acquire(blocking=False):
+            self.metrics.inc("poi_rejected_total", reason="inflight")
+            raise Busy()
+        with self._inflight_lock:
+            self.inflight += 1
+
+    def leave(self):
+        with self._inflight_lock:
+            self.inflight -= 1
+        self.slots.release()
+
+    def resolve(self, address):
+        """(lat, lon, display): yerel indeks ve cache istek thread'inde (ağsız); kaçanlar geocode havuzunda."""
+        t0 = time.perf_counter()
+        hit = self.local(address) if self.local is not None else None
+        source = "local"
+        if hit is None:
+            row = self.cache.lookup(address)
+            source = "cache"
+            if row is not None:
+                if not row[0]:
+                    raise RuntimeError("Adres geocode edilemedi.")
+                hit = row[1:]
+        if hit is None:
+            if not self.geocode_slots.acquire(blocking=False):
+                self.metrics.inc("poi_rejected_total", reason="geocode_queue")
+                raise Busy()
+            source = "remote"
+            try:
+                hit = self.pool.submit(self.cache.geocode, address).result(timeout=self.geocode_timeout_s)
+            finally:
+                self.geocode_slots.release()
+        self.metrics.inc("poi_geocode_total", source=source)
+        self.metrics.observe(f"geocode_{source}", (time.perf_counter() - t0) * 1000)
+        return hit
+
+    def gauges(self):
+        rc = {f"poi_result_cache_{k}": v for k, v in self.results.stats().items()} if self.results is not None else {}
+        return rc | {"poi_inflight": self.inflight, "poi_max_inflight": self.max_inflight,
+                "poi_engine_reloads": self.engine.reloads,
+                "poi_local_geocoder_hits": self.local.hits if self.local is not None else 0}
+
+def _radius_topn(p):
+    """İstekten (radius, topn); geçersizse ValueError (mesajı 400 gövdesinde döner)."""
+    try:
+        radius = float(p.get("radius", app.DEFAULT_RADIUS_M))
+        topn = int(p.get("topn", app.TOP_N))
+    except (TypeError, ValueError):
+        raise ValueError("radius/topn sayısal olmalı") from None
+    if not math.isfinite(radius) or radius <= 0:
+        raise ValueError("radius pozitif ve sonlu olmalı")
+    if topn < 1:
+        raise ValueError("topn en az 1 olmalı")
+    return radius, topn
+
+def _params():
+    # GET query string ya da POST JSON gövdesi
+    p = dict(request.args)
+    if request.is_json:
+        p.update(request.get_json(silent=True) or {})
+    return p
+
+def create_app(nodes_path="./cache/be_poi.parquet", polys_path="./cache/be_poi_poly.parquet", service=None, **kw):
+    svc = service or Service(nodes_path, polys_path, **kw)
+    api = Flask(__name__)
+    api.config["service"] = svc
+
+    def done(endpoint, status, t0, body):
+        svc.metrics.observe(f"{endpoint}_total", (time.perf_counter() - t0) * 1000)
+        svc.metrics.inc("poi_requests_total", endpoint=endpoint, status=status)
+        return body, status
+
+    @api.route("/analyze", methods=["GET", "POST"])
+    def analyze_ep():
+        t0 = time.perf_counter()
+        p = _params()
+        fmt = str(p.get("format", "json")).lower()
+        if fmt not in FORMATS:
+            return done("analyze", 400, t0, jsonify(error=f"format: {', '.join(FORMATS)}"))
+        try:
+            radius, topn = _radius_topn(p)
+        except ValueError as e:
+            return done("analyze", 400, t0, jsonify(error=str(e)))
+        try:
+            lat, lon = p.get("lat"), p.get("lon")
+            lat, lon = (float(lat), float(lon)) if (lat is not None and lon is not None) else (None, None)
+        except (TypeError, ValueError):
+            return done("analyze", 400, t0, jsonify(error="lat/lon sayısal olmalı"))
+        if lat is not None and not (math.isfinite(lat) and math.isfinite(lon)):
+            return done("analyze", 400, t0, jsonify(error="lat/lon sonlu olmalı"))
+        address = p.get("address")
+        if not address and lat is None:
+            return done("analyze", 400, t0, jsonify(error="address veya lat+lon verin"))
+        try:
+            svc.enter()
+        except Busy:
+            r = jsonify(error="meşgul, tekrar deneyin")
+            r.headers["Retry-After"] = "1"
+            return done("analyze", 503, t0, r)
+        try:
+            disp = None
+            if address:
+                try:
+                    lat, lon, disp = svc.resolve(address)
+                except Busy:
+                    r = jsonify(error="geocode kuyruğu dolu, tekrar deneyin")
+                    r.headers["Retry-After"] = "2"
+                    return done("analyze", 503, t0, r)
+                except FutureTimeout:
+                    return done("analyze", 504, t0, jsonify(error="geocode zaman aşımı"))
+                except RuntimeError as e:
+                    return done("analyze", 404, t0, jsonify(error=str(e)))
+            t1 = time.perf_counter()
+            # aşama süreleri her istekte (ucuz); ?profile=1 → satır/dosya ayrıntısı da hesaplanır ve yanıtta döner
+            want_profile = str(p.get("profile", "")).lower() in ("1", "true", "yes")
+            res = app.analyze(lat=lat, lon=lon, radius=radius, topn=topn, engine=svc.engine,
+                              map_mode=FORMATS[fmt], display=disp, result_cache=svc.results,
+                              profile=Profiler(detail=want_profile))
+            t2 = time.perf_counter()
+            svc.metrics.observe("analyze", (t2 - t1) * 1000)
+            svc.observe_profile(res.get("profile", {}))
+            if not want_profile:
+                res.pop("profile", None)
+            if fmt == "html":
+                body = Response(res["map_html"], mimetype="text/html")
+            else:
+                res.pop("map_html", None)
+                if fmt == "json":
+                    res.pop("map", None)
+                body = jsonify(res)
+            svc.metrics.observe(f"serialize_{fmt}", (time.perf_counter() - t2) * 1000)
+            return done("analyze", 200, t0, body)
+        finally:
+            svc.leave()
+
+    @api.route("/batch", methods=["POST"])
+    def batch_ep():
+        t0 = time.perf_counter()
+        p = request.get_json(silent=True) or {}
+        points = p.get("points") or []
+        if not points:
+            return done("batch", 400, t0, jsonify(error="points: [{lat, lon[, id]} | {address[, id]}, ...]"))
+        if len(points) > svc.batch_max_points:
+            return done("batch", 413, t0, jsonify(error=f"en fazla {svc.batch_max_points:,} nokta"))
+        try:
+            radius, topn = _radius_topn(p)
+        except ValueError as e:
+            return done("batch", 400, t0, jsonify(error=str(e)))
+        try:
+            svc.enter()
+        except Busy:
+            r = jsonify(error="meşgul, tekrar deneyin")
+            r.headers["Retry-After"] = "1"
+            return done("batch", 503, t0, r)
+        try:
+            t1 = time.perf_counter()
+            res = app.analyze_batch(pd.DataFrame(points), radius=radius, topn=topn, engine=svc.engine,
+                                    with_top=bool(p.get("with_top")), local_geocoder=svc.local,
+                                    geocode_cache=svc.cache)
+            svc.metrics.observe("batch_query", (time.perf_counter() - t1) * 1000)
+            out = {"scores": res["scores"].to_dict(orient="records"),
+                   "elapsed_s": res["elapsed_s"], "points_per_s": res["points_per_s"]}
+            if res.get("top") is not None:
+                out["top"] = res["top"].to_dict(orient="records")
+            return done("batch", 200, t0, jsonify(out))
+        except ValueError as e:
+            return done("batch", 400, t0, jsonify(error=str(e)))
+        finally:
+            svc.leave()
+
+    @api.route("/metrics")
+    def metrics_ep():
+        return Response(svc.metrics.render(svc.gauges()), mimetype="text/plain; version=0.0.4")
+
+    @api.route("/healthz")
+    def health_ep():
+        return jsonify(ok=True, engine=svc.engine.latency_stats(), inflight=svc.inflight)
+
+    @api.route("/map_template.html")
+    def template_ep():
+        # geojson çıktısını çizen statik şablon; istemci uzun süre cache'leyebilir
+        r = Response(app.map_template(), mimetype="text/html")
+        r.headers["Cache-Control"] = "public, max-age=86400"
+        return r
+
+    return api
+
+def main():
+    ap = argparse.ArgumentParser(description="POI analizi HTTP API'si (/analyze, /batch, /metrics)")
+    ap.add_argument("--nodes", default="./cache/be_poi.parquet")
+    ap.add_argument("--polys", default="./cache/be_poi_poly.parquet")
+    ap.add_argument("--merged", default=app.MERGED_CACHE, help="build_poi_merged.py çıktısı ('' ile kapalı)")
+    ap.add_argument("--regions", help="Çoklu bölge cache dizini (builder --out-dir); --nodes/--polys yerine")
+    ap.add_argument("--geocode-cache", default=GEOCODE_DB, help="Kalıcı geocode cache'i (SQLite)")
+    ap.add_argument("--addr-index", default=app.ADDR_INDEX, help="Çevrimdışı adres indeksi")
+    ap.add_argument("--stub-geocoder", help="Ağsız yük testi: address,lat,lon CSV'sinden cevap veren stub geocoder")
+    ap.add_argument("--stub-delay", type=float, default=0.0, help="Stub geocoder çağrı başına gecikme (sn)")
+    ap.add_argument("--geocode-workers", type=int, default=4, help="Cache'te olmayan adresler için thread sayısı")
+    ap.add_argument("--geocode-queue", type=int, default=64, help="Bekleyebilecek en fazla geocode sayısı")
+    ap.add_argument("--max-inflight", type=int, default=32, help="Aynı anda işlenen en fazla istek (fazlası 503)")
+    ap.add_argument("--result-cache-mb", type=float, default=app.RESULT_CACHE_MAX_MB,
+                    help="Sonuç cache'i bellek sınırı (MB); 0 → kapalı")
+    ap.add_argument("--result-cache-db", help="Sonuç cache'i disk katmanı (SQLite, ops.); yeniden başlatmada sıcak kalır")
+    ap.add_argument("--snap-decimals", type=int, default=app.RESULT_SNAP_DECIMALS,
+                    help="Cache anahtarı için lat/lon ondalık hassasiyeti (4 ≈ 11 m)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    args = ap.parse_args()
+
+    geocoder = StubGeocoder(args.stub_geocoder, delay_s=args.stub_delay) if args.stub_geocoder else None
+    api = create_app(args.nodes, args.polys, geocode_db=args.geocode_cache, addr_index=args.addr_index,
+                     geocoder=geocoder, geocode_workers=args.geocode_workers, geocode_queue=args.geocode_queue,
+                     max_inflight=args.max_inflight, result_cache_mb=args.result_cache_mb,
+                     result_cache_db=args.result_cache_db, snap_decimals=args.snap_decimals, merged_path=args.merged,
+                     regions_dir=args.regions)
+    print(f"[SERVER] http://{args.host}:{args.port}  max_inflight={args.max_inflight}  "
+          f"geocode_workers={args.geocode_workers}  stub={'evet' if geocoder else 'hayır'}")
+    api.run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    main()
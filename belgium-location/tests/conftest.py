@@ -0,0 +1,29 @@
+# tests/conftest.py — bench/synth.py ile küçük sentetik node + polygon cache (builder şemaları, finalize_cache yolu)
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench import synth  # noqa: E402
+
+CENTER = (synth.PROFILES["city"]["lat"], synth.PROFILES["city"]["lon"])
+# merkez, kenara yakın ve profil diskinin dışında kalan (boş sonuçlu) noktalar
+POINTS = [CENTER, (CENTER[0] + 0.02, CENTER[1] - 0.03), (CENTER[0] - 0.045, CENTER[1] + 0.06), (CENTER[0] + 0.5, CENTER[1])]
+RADIUS = 1200
+TOPN = 5
+
+@pytest.fixture(scope="session")
+def cache(tmp_path_factory):
+    d = tmp_path_factory.mktemp("cache")
+    nodes, polys = str(d / "nodes.parquet"), str(d / "polys.parquet")
+    synth.synth_nodes(nodes, n=3_000, profile="city")
+    synth.synth_polys(polys, n=600, profile="city")
+    return nodes, polys
+
+def assert_frames_equal(a, b):
+    """İki TOP-N frame'i aynı satırlar, aynı sırada (dtype farkı önemsiz: DuckDB/pandas sürüme göre değişir)."""
+    import pandas as pd
+    assert a.empty == b.empty
+    if a.empty:
+        return
+    pd.testing.assert_frame_equal(a.reset_index(drop=True), b[list(a.columns)].reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False)
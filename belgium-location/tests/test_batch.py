@@ -0,0 +1,33 @@
+# analyze_batch: tek geçişli toplu puanlama, tekil analyze() ile aynı puanları vermeli
+import math
+import pandas as pd
+import pytest
+import app_duckdb as app
+from conftest import POINTS, RADIUS, TOPN
+
+def test_batch_matches_single(cache):
+    nodes, polys = cache
+    pts = pd.DataFrame([{"id": i, "lat": lat, "lon": lon} for i, (lat, lon) in enumerate(POINTS)])
+    res = app.analyze_batch(pts, radius=RADIUS, topn=TOPN, nodes_path=nodes, polys_path=polys, with_top=True,
+                            road_graph=None)
+    scores = res["scores"]
+    assert len(scores) == len(POINTS)
+    for i, (lat, lon) in enumerate(POINTS):
+        data = app._analyze_data(lat, lon, RADIUS, TOPN, nodes, polys, None, None)
+        for cat in app.CATS:
+            assert scores.loc[i, f"{cat}_score"] == pytest.approx(data["cat_scores"][cat], abs=1e-9)
+        assert scores.loc[i, "overall"] == pytest.approx(data["overall"], abs=1e-9)
+        # TOP-N: kategori başına aynı POI'ler, aynı sırada
+        top = res["top"][res["top"]["pid"] == i]
+        pois = pd.DataFrame(data["pois"])
+        for cat in app.CATS:
+            want = pois[pois["cat"] == cat]["name"].tolist()
+            assert top[top["cat"] == cat].sort_values("rn")["name"].tolist() == want
+
+def test_batch_empty_point(cache):
+    nodes, polys = cache
+    far = pd.DataFrame([{"lat": 0.0, "lon": 0.0}])
+    scores = app.analyze_batch(far, radius=RADIUS, nodes_path=nodes, polys_path=polys, road_graph=None)["scores"]
+    assert scores.loc[0, "overall"] == 0.0
+    assert all(scores.loc[0, f"{c}_n"] == 0 for c in app.CATS)
+    assert all(math.isnan(scores.loc[0, f"{c}_dmin"]) for c in app.CATS)
@@ -0,0 +1,30 @@
+# PoiEngine: bellekteki tablo üzerinden sorgu, dosya tarayan query_all_categories ile aynı sonuç
+import os
+import duckdb
+import pytest
+import app_duckdb as app
+from conftest import POINTS, RADIUS, TOPN, assert_frames_equal
+
+@pytest.fixture(scope="module")
+def engine(cache):
+    return app.PoiEngine(*cache)
+
+@pytest.mark.parametrize("lat,lon", POINTS)
+def test_engine_matches_file_query(cache, engine, lat, lon):
+    con = duckdb.connect()
+    want, want_stats = app.query_all_categories(con, *cache, lat, lon, RADIUS, TOPN)
+    got, got_stats = engine.query(lat, lon, RADIUS, TOPN)
+    for cat in app.CATS:
+        assert_frames_equal(want[cat], got[cat])
+        assert got_stats[cat][0] == want_stats[cat][0]
+
+def test_engine_reloads_on_file_change(cache, tmp_path):
+    nodes, polys = cache
+    path = str(tmp_path / "nodes.parquet")
+    with open(nodes, "rb") as src, open(path, "wb") as dst:
+        dst.write(src.read())
+    eng = app.PoiEngine(path, polys, check_every_s=0)
+    fp = eng.fingerprint()
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10**9))
+    assert eng.fingerprint() != fp
+    assert eng.reloads >= 1
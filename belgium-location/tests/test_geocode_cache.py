@@ -0,0 +1,74 @@
+# GeocodeCache: StubGeocoder ile çevrimdışı; normalize anahtar, pozitif/negatif TTL, hata cache'lenmez, prewarm sayıları
+import types
+import pytest
+import geocode_cache as gc
+
+ADDR = "Tervuursesteenweg 147, 3001 Heverlee"
+HIT = (50.8620, 4.6960, "Tervuursesteenweg 147, 3001 Leuven")
+
+@pytest.fixture
+def clock(monkeypatch):
+    # sadece geocode_cache modülünün gördüğü saat
+    now = {"t": 1_700_000_000.0}
+    monkeypatch.setattr(gc, "time", types.SimpleNamespace(time=lambda: now["t"], sleep=lambda s: None))
+    return now
+
+def _cache(tmp_path, table=None, **kw):
+    stub = gc.StubGeocoder(table if table is not None else {ADDR: HIT})
+    return gc.GeocodeCache(str(tmp_path / "geocode.sqlite"), geocoder=stub, **kw), stub
+
+def test_normalized_key_hits(tmp_path, clock):
+    cache, stub = _cache(tmp_path)
+    assert cache.geocode(ADDR) == HIT
+    for variant in ("tervuursesteenweg 147 3001 HEVERLEE", "  Tervuursesteenweg 147,3001  Heverlee. "):
+        assert cache.geocode(variant) == HIT
+    assert stub.calls == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+    # aynı dosyayı açan ikinci örnek (ör. başka süreç) geocoder'a gitmez
+    other, stub2 = _cache(tmp_path)
+    assert other.geocode(ADDR.upper()) == HIT and stub2.calls == 0
+
+def test_positive_ttl(tmp_path, clock):
+    cache, stub = _cache(tmp_path, ttl_s=100, negative_ttl_s=10)
+    cache.geocode(ADDR)
+    clock["t"] += 99
+    cache.geocode(ADDR)
+    assert stub.calls == 1
+    clock["t"] += 2
+    cache.geocode(ADDR)
+    assert stub.calls == 2
+
+def test_negative_ttl(tmp_path, clock):
+    cache, stub = _cache(tmp_path, table={}, ttl_s=100, negative_ttl_s=10)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            cache.geocode("Onbekende straat 1, 9999 Nergens")
+    assert stub.calls == 1 and cache.negative_hits == 1
+    # negatif sonuç kısa TTL'den sonra yeniden sorulur; adres artık bulunuyorsa pozitif olarak saklanır
+    clock["t"] += 11
+    stub.table[gc.normalize_address("Onbekende straat 1, 9999 Nergens")] = HIT
+    assert cache.geocode("Onbekende straat 1, 9999 Nergens") == HIT
+    assert stub.calls == 2
+    assert cache.stats()["entries_found"] == 1
+
+def test_geocoder_error_not_cached(tmp_path, clock):
+    cache, stub = _cache(tmp_path)
+    def down(address):
+        raise ConnectionError("nominatim erişilemez")
+    cache._geocoder = down
+    with pytest.raises(ConnectionError):
+        cache.geocode(ADDR)
+    assert cache.lookup(ADDR) is None and cache.stats()["entries"] == 0
+    cache._geocoder = stub
+    assert cache.geocode(ADDR) == HIT
+
+def test_prewarm_counts(tmp_path, clock):
+    table = {f"Bondgenotenlaan {i}, 3000 Leuven": (50.88 + i / 1e4, 4.70, f"Bondgenotenlaan {i}") for i in range(1, 6)}
+    cache, stub = _cache(tmp_path, table=table, negative_ttl_s=10)
+    addrs = list(table) + ["Nergensstraat 1, 9999 Nergens", "", "   ", None]
+    assert cache.prewarm(addrs) == (5, 0, 1)
+    # ikinci tur: bulunan ve bulunamayan (geçerli negatif kayıt) adresler mevcut sayılır
+    assert cache.prewarm(addrs + ["bondgenotenlaan 1 3000 LEUVEN"]) == (0, 7, 0)
+    assert stub.calls == 6
+    clock["t"] += 11
+    assert cache.prewarm(addrs) == (0, 5, 1)
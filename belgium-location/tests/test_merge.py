@@ -0,0 +1,86 @@
+# build_poi_merged.py: çiftte güçlü etiketler korunur, birleşik ve ayrı cache'lerin n_total farkı = raporlanan dupe'lar
+import argparse
+import duckdb
+import numpy as np
+import pyarrow.parquet as pq
+import build_poi_cache as nodes_mod
+import build_poi_poly_cache_osmium as polys_mod
+import build_poi_merged as merged_mod
+import app_duckdb as app
+from bench import synth
+from poi_cache_utils import plain, ROW_GROUP_SIZE
+from road_graph import haversine_np
+from conftest import CENTER, POINTS, RADIUS, TOPN
+
+M_LAT = 1 / 111320.0
+
+def _args():
+    return argparse.Namespace(low_memory=False, memory_limit=None, int_coords=False, row_group_size=ROW_GROUP_SIZE)
+
+def _build(tmp_path, node_rows, area_rows):
+    nodes, polys, out = (str(tmp_path / f) for f in ("nodes.parquet", "polys.parquet", "merged.parquet"))
+    b = nodes_mod.new_batch()
+    for nid, lat, lon, tags in node_rows:
+        nodes_mod.append_node(b, nid, lat, lon, tags)
+    synth._finalize(b, nodes, nodes_mod.SCHEMA, nodes_mod.ORDER_BY, False)
+    b = polys_mod.new_batch()
+    for wid, lat, lon, tags in area_rows:
+        polys_mod.append_area(b, "w", wid, lat, lon, tags)
+    synth._finalize(b, polys, polys_mod.SCHEMA, polys_mod.ORDER_BY, False)
+    dupes = str(tmp_path / "dupes.parquet")
+    merged_mod.merge(_args(), nodes, polys, out, dict(merged_mod.MERGE_TOLERANCE_M), dupes)
+    return nodes, polys, out, dupes
+
+def test_pair_keeps_hospital(tmp_path):
+    lat, lon = CENTER
+    nodes, polys, out, dupes = _build(tmp_path, [
+        # klinik node'u, aynı isimli hastane alanından ~30 m: alan daha yüksek sıralı → alanın etiketleri
+        (1, lat, lon, {"amenity": "clinic", "name": "AZ Sint-Jan"}),
+        # node daha yüksek sıralı (klinik 80 + healthcare 30 > hastane 100) ama alan hastane: bayrak korunur
+        (2, lat + 0.01, lon, {"amenity": "clinic", "healthcare": "clinic", "name": "AZ Groeninge"}),
+    ], [
+        (10, lat + 30 * M_LAT, lon, {"amenity": "hospital", "name": "AZ Sint-Jan"}),
+        (11, lat + 0.01 + 30 * M_LAT, lon, {"amenity": "hospital", "name": "AZ Groeninge"}),
+    ])
+    assert pq.read_table(dupes).num_rows == 2
+    rows = {r["name"]: r for r in plain(pq.read_table(out)).to_pylist()}
+    assert len(rows) == 2
+    a, g = rows["AZ Sint-Jan"], rows["AZ Groeninge"]
+    assert (a["src"], a["uid"], a["amenity"], a["rank_score"], a["is_hospital"]) == ("node+area", "n1", "hospital", 100, 1)
+    assert (a["lat"], a["lon"]) == (lat, lon)
+    assert (g["amenity"], g["healthcare"], g["rank_score"], g["is_hospital"]) == ("clinic", "clinic", 110, 1)
+    # sorgu tarafında: birleşik cache de ayrı cache'ler gibi hastane görür
+    con = duckdb.connect()
+    _, split = app.query_all_categories(con, nodes, polys, lat, lon, RADIUS, TOPN)
+    _, one = app.query_all_categories(con, None, out, lat, lon, RADIUS, TOPN)
+    assert split["health"][2] and one["health"][2]
+    assert (split["health"][0], one["health"][0]) == (4, 2)
+
+def test_merged_counts_differ_by_dupes(tmp_path):
+    rng = np.random.default_rng(11)
+    lat, lon = synth.profile_points("city", 3_000, rng)
+    kinds = rng.integers(0, len(synth.NODE_TAGS), len(lat))
+    node_rows = [(i + 1, float(lat[i]), float(lon[i]), dict(synth.NODE_TAGS[kinds[i]], name=f"POI {i}"))
+                 for i in range(len(lat))]
+    alat, alon = synth.profile_points("city", 500, rng)
+    akinds = rng.integers(0, len(synth.AREA_TAGS), len(alat))
+    area_rows = [(i + 1, float(alat[i]), float(alon[i]), dict(synth.AREA_TAGS[akinds[i]], name=f"Area {i}"))
+                 for i in range(len(alat))]
+    # alan olarak da etiketlenmiş node'lar: aynı isim + etiket, ~20 m ötede
+    twins = [r for r in node_rows if set(r[3].items()) & {("amenity", "school"), ("shop", "supermarket"),
+                                                          ("amenity", "hospital")}][:80]
+    area_rows += [(10_000 + k, la + 20 * M_LAT, lo, dict(tags)) for k, (_, la, lo, tags) in enumerate(twins)]
+    nodes, polys, out, dupes = _build(tmp_path, node_rows, area_rows)
+
+    pairs = pq.read_table(dupes).to_pylist()
+    assert len(pairs) == len(twins)
+    area_pos = {r["uid"]: (r["lat"], r["lon"]) for r in plain(pq.read_table(polys, columns=["uid", "lat", "lon"])).to_pylist()}
+    con = duckdb.connect()
+    for plat, plon in POINTS:
+        _, split = app.query_all_categories(con, nodes, polys, plat, plon, RADIUS, TOPN)
+        _, one = app.query_all_categories(con, None, out, plat, plon, RADIUS, TOPN)
+        for cat in app.CATS:
+            # çift iki satırdan (node + alan) node konumundaki tek satıra iner: fark = alanı dairede kalan çiftler
+            in_r = sum(1 for p in pairs if p["cat"] == cat and
+                       haversine_np(plat, plon, *area_pos[p["area_uid"]]) <= RADIUS)
+            assert split[cat][0] - one[cat][0] == in_r, (plat, plon, cat)
@@ -0,0 +1,26 @@
+# query_all_categories: tek sorgu, kategori başına query_category ile birebir aynı sonuç
+import duckdb
+import pytest
+import app_duckdb as app
+from conftest import POINTS, RADIUS, TOPN, assert_frames_equal
+
+@pytest.mark.parametrize("lat,lon", POINTS)
+def test_all_categories_match_per_category(cache, lat, lon):
+    nodes, polys = cache
+    con = duckdb.connect()
+    frames, stats = app.query_all_categories(con, nodes, polys, lat, lon, RADIUS, TOPN)
+    for cat in app.CATS:
+        one = app.query_category(con, nodes, polys, cat, lat, lon, RADIUS, TOPN)
+        assert_frames_equal(one, frames[cat])
+        if not one.empty:
+            assert stats[cat][0] == int(one.iloc[0]["n_total"])
+            assert stats[cat][1] == pytest.approx(float(one.iloc[0]["d_min"]))
+
+def test_per_category_radius(cache):
+    nodes, polys = cache
+    con = duckdb.connect()
+    radii = {"school": 400, "park": 2500}
+    frames, _ = app.query_all_categories(con, nodes, polys, *POINTS[0], RADIUS, TOPN, radii=radii)
+    for cat in app.CATS:
+        one = app.query_category(con, nodes, polys, cat, *POINTS[0], radii.get(cat, RADIUS), TOPN)
+        assert_frames_equal(one, frames[cat])
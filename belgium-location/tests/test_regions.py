@@ -0,0 +1,62 @@
+# RegionSet: sorgu dairesine değen bölge dosyaları seçilir; analyze(regions=...) tüm bölgelerin birleşimiyle aynı sonucu verir
+import numpy as np
+import pytest
+import build_poi_cache as nodes_mod
+import build_poi_poly_cache_osmium as polys_mod
+import app_duckdb as app
+from bench import synth
+from poi_cache_utils import region_path, write_region_manifest
+from conftest import CENTER, RADIUS, TOPN, assert_frames_equal
+
+# iki komşu bölge: şehir diskinin merkez boylamının batısı ve doğusu
+WEST, BORDER, EAST = (CENTER[0], CENTER[1] - 0.05), CENTER, (CENTER[0] + 0.01, CENTER[1] + 0.05)
+
+@pytest.fixture(scope="module")
+def regions(tmp_path_factory):
+    d = str(tmp_path_factory.mktemp("regions"))
+    rng = np.random.default_rng(21)
+    lat, lon = synth.profile_points("city", 3_000, rng)
+    kinds = rng.integers(0, len(synth.NODE_TAGS), len(lat))
+    alat, alon = synth.profile_points("city", 600, rng)
+    akinds = rng.integers(0, len(synth.AREA_TAGS), len(alat))
+    for region, side in (("west", lambda x: x < CENTER[1]), ("east", lambda x: x >= CENTER[1])):
+        b = nodes_mod.new_batch()
+        for i in np.flatnonzero(side(lon)):
+            nodes_mod.append_node(b, int(i) + 1, float(lat[i]), float(lon[i]), dict(synth.NODE_TAGS[kinds[i]], name=f"POI {i}"))
+        synth._finalize(b, region_path(d, region, "nodes"), nodes_mod.SCHEMA, nodes_mod.ORDER_BY, False)
+        b = polys_mod.new_batch()
+        for i in np.flatnonzero(side(alon)):
+            polys_mod.append_area(b, "w", int(i) + 1, float(alat[i]), float(alon[i]),
+                                  dict(synth.AREA_TAGS[akinds[i]], name=f"Area {i}"))
+        synth._finalize(b, region_path(d, region, "polys"), polys_mod.SCHEMA, polys_mod.ORDER_BY, False)
+    write_region_manifest(d)
+    return d
+
+def test_select_inside_one_region(regions):
+    rs = app.RegionSet(regions)
+    assert rs.select(*WEST, RADIUS) == ([region_path(regions, "west", "nodes")], [region_path(regions, "west", "polys")])
+    assert rs.select(*EAST, RADIUS) == ([region_path(regions, "east", "nodes")], [region_path(regions, "east", "polys")])
+
+def test_select_near_border(regions):
+    nodes, polys = app.RegionSet(regions).select(*BORDER, RADIUS)
+    assert sorted(nodes) == sorted(region_path(regions, r, "nodes") for r in ("west", "east"))
+    assert sorted(polys) == sorted(region_path(regions, r, "polys") for r in ("west", "east"))
+
+def _pois(data):
+    return app.pd.DataFrame(data["pois"], columns=list(app.POI_OUT_COLS))
+
+def test_analyze_regions_matches_union(regions):
+    nodes = [region_path(regions, r, "nodes") for r in ("east", "west")]
+    polys = [region_path(regions, r, "polys") for r in ("east", "west")]
+    for lat, lon in (WEST, BORDER, EAST):
+        # seçilen bölge dosyaları, tüm bölgelerin birleşimiyle aynı yapısal sonucu verir
+        ref = app._analyze_data(lat, lon, RADIUS, TOPN, nodes, polys, None, None)
+        got = app._analyze_data(lat, lon, RADIUS, TOPN, *app.get_region_set(regions).select(lat, lon, RADIUS), None, None)
+        assert (got["cat_scores"], got["overall"]) == (ref["cat_scores"], ref["overall"])
+        assert_frames_equal(_pois(ref), _pois(got))
+        # analyze(regions=...) da birleşim üzerindeki analyze() ile aynı çıktıyı verir
+        kw = dict(lat=lat, lon=lon, radius=RADIUS, topn=TOPN, map_mode="none", road_graph=None)
+        res, full = app.analyze(regions=regions, **kw), app.analyze(nodes_path=nodes, polys_path=polys, **kw)
+        assert (res["scores"], res["overall"]) == (full["scores"], full["overall"])
+        for cat in app.CATS:
+            assert_frames_equal(app.pd.DataFrame(full["results"][cat]), app.pd.DataFrame(res["results"][cat]))
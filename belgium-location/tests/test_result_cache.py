@@ -0,0 +1,72 @@
+# ResultCache: dosya yeniden yazımında ve ayar değişiminde eski girdiler düşer, kaynak kümeleri arasında
+# geçiş cache'i boşaltmaz, bellek katmanı bayt sınırında en eski girdiyi atar
+import copy
+import shutil
+import app_duckdb as app
+from bench import synth
+from conftest import CENTER, RADIUS, TOPN
+
+def _copy(cache, d):
+    d.mkdir()
+    out = [str(d / "nodes.parquet"), str(d / "polys.parquet")]
+    for src, dst in zip(cache, out):
+        shutil.copy(src, dst)
+        shutil.copy(src + ".tiles.parquet", dst + ".tiles.parquet")
+    return out
+
+def _run(rc, nodes, polys, point=CENTER):
+    res = app.analyze(lat=point[0], lon=point[1], radius=RADIUS, topn=TOPN, nodes_path=nodes, polys_path=polys,
+                      map_mode="none", road_graph=None, result_cache=rc)
+    return res["scores"], res["overall"]
+
+def test_file_rewrite_invalidates(cache, tmp_path):
+    nodes, polys = _copy(cache, tmp_path / "a")
+    db = str(tmp_path / "results.sqlite")
+    rc = app.ResultCache(disk_path=db)
+    first = _run(rc, nodes, polys)
+    assert _run(rc, nodes, polys) == first
+    assert (rc.hits, rc.misses) == (1, 1)
+    # polygon cache yeniden üretilir (farklı içerik): yeni sonuç hesaplanır, eski girdi bellekten ve diskten düşer
+    synth.synth_polys(polys, n=200, profile="city", seed=9)
+    second = _run(rc, nodes, polys)
+    assert (rc.misses, rc.invalidations) == (2, 1)
+    assert second == _run(None, nodes, polys)
+    assert rc.stats()["entries"] == 1
+    assert rc._con().execute("SELECT COUNT(*) FROM result").fetchone()[0] == 1
+    # yeni süreç diskten okur
+    rc2 = app.ResultCache(disk_path=db)
+    assert _run(rc2, nodes, polys) == second
+    assert rc2.disk_hits == 1
+
+def test_scoring_change_invalidates(cache, monkeypatch):
+    rc = app.ResultCache()
+    first = _run(rc, *cache)
+    scoring = copy.deepcopy(app.SCORING)
+    for cat in scoring:
+        scoring[cat]["D0"] = scoring[cat]["D0"] * 0.25
+    monkeypatch.setattr(app, "SCORING", scoring)
+    second = _run(rc, *cache)
+    assert (rc.hits, rc.misses, rc.invalidations) == (0, 2, 1)
+    assert second == _run(None, *cache)
+    assert second != first
+
+def test_switching_sources_keeps_entries(cache, tmp_path):
+    a = cache
+    b = _copy(cache, tmp_path / "b")
+    rc = app.ResultCache()
+    for _ in range(3):
+        _run(rc, *a)
+        _run(rc, *b)
+    assert (rc.hits, rc.misses, rc.invalidations) == (4, 2, 0)
+
+def test_memory_cap_evicts_lru():
+    rc = app.ResultCache(max_bytes=3_000)
+    keys = [rc.key(50.0 + i / 1000, 4.0, RADIUS, TOPN, None, ("fp",), ("src",)) for i in range(5)]
+    for k in keys[:3]:
+        rc.put(k, {"x": "a" * 900})
+    assert rc.get(keys[0]) is not None        # en son kullanılan: keys[0]; en eskisi keys[1]
+    rc.put(keys[3], {"x": "a" * 900})
+    assert rc.evictions == 1 and rc.bytes <= rc.max_bytes
+    assert rc.get(keys[1]) is None and rc.get(keys[0]) is not None
+    rc.put(keys[4], {"x": "a" * 5_000})       # sınırdan büyük tek girdi: diğerleri atılır, o kalır
+    assert rc.stats()["entries"] == 1 and rc.get(keys[4]) is not None
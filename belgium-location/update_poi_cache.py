@@ -0,0 +1,156 @@
+# update_poi_cache.py — yerel OSM değişiklik dosyalarıyla (.osc / .osc.gz) cache'leri yerinde güncelleme
+# Tam PBF'i yeniden işlemek yerine: diff'teki node/way/relation'lar OSM kimliğine göre silinir ve
+# (hâlâ POI ise) yeni halleriyle eklenir; sadece etkilenen row-group'lar yeniden yazılır.
+import os, time, argparse
+import numpy as np
+import pyarrow.parquet as pq
+import osmium as osm
+from shapely.geometry import Polygon
+from poi_cache_utils import batch_table, plain, patch_cache, has_rank_columns, node_keys, poly_keys
+from poi_rank import rank_columns_sql
+import build_poi_cache as nodes_mod
+import build_poi_poly_cache_osmium as polys_mod
+
+# area kimliği osmium'daki gibi: way → 2*id, relation → 2*id+1
+def area_key(osm_type, osm_id):
+    return 2 * osm_id + (1 if osm_type == "r" else 0)
+
+class ChangeCollector(osm.SimpleHandler):
+    """
+    Diff'lerdeki her nesnenin en son halini toplar (aynı nesne birden çok dosyada/sürümde geçebilir;
+    büyük sürüm, eşitlikte sonraki dosya kazanır). Silinen nesneler boş etiketle tutulur.
+    """
+    def __init__(self):
+        super().__init__()
+        self.nodes = {}   # id -> (version, (lat, lon) | None, tags)
+        self.ways = {}    # id -> (version, deleted, node_refs, tags)
+        self.rels = {}    # id -> (version, deleted, tags)
+
+    @staticmethod
+    def _newer(store, o):
+        prev = store.get(o.id)
+        return prev is None or o.version >= prev[0]
+
+    def node(self, n):
+        if not self._newer(self.nodes, n):
+            return
+        alive = (not n.deleted) and n.location.valid()
+        loc = (float(n.location.lat), float(n.location.lon)) if alive else None
+        self.nodes[n.id] = (n.version, loc, {k:v for k,v in n.tags} if alive else {})
+
+    def way(self, w):
+        if not self._newer(self.ways, w):
+            return
+        refs = [] if w.deleted else [r.ref for r in w.nodes]
+        self.ways[w.id] = (w.version, w.deleted, refs, {} if w.deleted else {k:v for k,v in w.tags})
+
+    def relation(self, r):
+        if not self._newer(self.rels, r):
+            return
+        self.rels[r.id] = (r.version, r.deleted, {} if r.deleted else {k:v for k,v in r.tags})
+
+def node_changes(ch):
+    """Diff'teki her node'un eski satırları silinir; hâlâ POI olanlar yeni haliyle eklenir."""
+    b = nodes_mod.new_batch()
+    for nid, (_, loc, tags) in ch.nodes.items():
+        if loc is not None and tags:
+            nodes_mod.append_node(b, nid, loc[0], loc[1], tags)
+    return set(ch.nodes), batch_table(b, nodes_mod.SCHEMA)
+
+def way_centroid(refs, locs):
+    """Kapalı way'in centroid'i; node konumlarından biri diff'te yoksa None."""
+    pts = [locs.get(r) for r in refs]
+    if any(p is None for p in pts):
+        return None
+    try:
+        c = Polygon([(lon, lat) for lat, lon in pts]).centroid
+        return float(c.y), float(c.x)
+    except Exception:
+        return None
+
+def poly_changes(ch, polys_path):
+    """
+    Way/relation değişiklikleri → (silinecek area anahtarları, yeni satırlar, çözülemeyen sayısı).
+    Geometri diff'ten kurulabiliyorsa (way'in tüm node'ları diff'te) centroid yeniden hesaplanır; yoksa
+    nesne cache'te zaten varsa eski centroid korunup sadece etiketler güncellenir. İkisi de olmayan
+    yeni alanlar (ör. yeni multipolygon relation) sayılır ve bir sonraki tam build'e kalır.
+    """
+    locs = {nid: loc for nid, (_, loc, _) in ch.nodes.items() if loc is not None}
+    changed = [("w", wid, deleted, refs, tags) for wid, (_, deleted, refs, tags) in ch.ways.items()]
+    changed += [("r", rid, deleted, None, tags) for rid, (_, deleted, tags) in ch.rels.items()]
+    drop = {area_key(t, i) for t, i, *_ in changed}
+
+    if "osm_id" not in pq.read_schema(polys_path).names:
+        raise ValueError(f"{polys_path}: osm_type/osm_id kolonları yok; cache'i güncel builder ile bir kez yeniden üretin")
+    cur = plain(pq.read_table(polys_path, columns=["osm_type", "osm_id", "name", "lat", "lon"]))
+    keys = poly_keys(cur)
+    old_pos = {}
+    for i, k in enumerate(keys.tolist()):
+        old_pos.setdefault(k, i)
+    # builder'daki (isim, ~10 m konum) dupe kırpması: kalan satırlarla çakışan yeni area eklenmez
+    keep = ~np.isin(keys, np.asarray(sorted(drop), dtype=np.int64))
+    names, lats, lons = cur["name"].to_pylist(), cur["lat"].to_numpy(), cur["lon"].to_numpy()
+    seen = {polys_mod.dedupe_key(names[i], lats[i], lons[i]) for i in np.flatnonzero(keep)}
+
+    b, unresolved = polys_mod.new_batch(), 0
+    for osm_type, osm_id, deleted, refs, tags in changed:
+        if deleted or tags.get("area") == "no":
+            continue
+        if osm_type == "w" and not (len(refs) >= 4 and refs[0] == refs[-1]):
+            continue  # kapalı olmayan way area değildir
+        if osm_type == "r" and tags.get("type") not in ("multipolygon", "boundary"):
+            continue
+        cats = polys_mod.categorize(tags)
+        if not cats:
+            continue
+        ll = way_centroid(refs, locs) if osm_type == "w" else None
+        if ll is None:
+            i = old_pos.get(area_key(osm_type, osm_id))
+            if i is None:
+                unresolved += 1
+                continue
+            ll = (float(lats[i]), float(lons[i]))
+        name = tags.get("name") or tags.get("brand") or tags.get("ref") or None
+        k = polys_mod.dedupe_key(name, ll[0], ll[1])
+        if k in seen:
+            continue
+        seen.add(k)
+        polys_mod.append_area(b, osm_type, osm_id, ll[0], ll[1], tags, cats)
+    return drop, batch_table(b, polys_mod.SCHEMA), unresolved
+
+def rank_sql(path):
+    # build-time rank_score / is_hospital kolonları olan cache'te yeni satırlar için de hesaplanır
+    return rank_columns_sql() if has_rank_columns(pq.read_schema(path)) else None
+
+def main():
+    ap = argparse.ArgumentParser(description="OSM diff (.osc/.osc.gz) -> node + polygon POI cache güncellemesi")
+    ap.add_argument("--osc", nargs="+", required=True, help="Değişiklik dosyaları (uygulama sırasıyla)")
+    ap.add_argument("--nodes", default="cache/be_poi.parquet", help="Node cache (build_poi_cache.py çıktısı)")
+    ap.add_argument("--polys", default="cache/be_poi_poly.parquet", help="Polygon cache (build_poi_poly_cache_osmium.py çıktısı)")
+    args = ap.parse_args()
+
+    t0 = time.time()
+    ch = ChangeCollector()
+    for path in args.osc:
+        ch.apply_file(path)
+    print(f"[DIFF] files={len(args.osc)}  nodes={len(ch.nodes):,}  ways={len(ch.ways):,}  relations={len(ch.rels):,}  "
+          f"time={time.time()-t0:.1f}s")
+
+    if os.path.exists(args.nodes):
+        drop, new = node_changes(ch)
+        patch_cache(args.nodes, ["id"], node_keys, drop, new, ["cat", "hkey", "id"],
+                    derived_sql=rank_sql(args.nodes))
+    else:
+        print(f"[SKIP] node cache yok: {args.nodes}")
+    if os.path.exists(args.polys):
+        drop, new, unresolved = poly_changes(ch, args.polys)
+        patch_cache(args.polys, ["osm_type", "osm_id"], poly_keys, drop, new, ["cat", "hkey", "uid"],
+                    derived_sql=rank_sql(args.polys))
+        if unresolved:
+            print(f"[WARN] geometrisi diff'ten kurulamayan yeni area: {unresolved:,} (bir sonraki tam build'de eklenir)")
+    else:
+        print(f"[SKIP] polygon cache yok: {args.polys}")
+    print(f"[DONE] time={time.time()-t0:.1f}s")
+
+if __name__ == "__main__":
+    main()